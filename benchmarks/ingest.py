@@ -0,0 +1,748 @@
+#!/usr/bin/env python
+"""
+===============================
+Timescaledbapp Ingest Benchmark
+===============================
+
+This script measures the ingest pipeline of the `timeserie` endpoint with
+synthetic multichannel payloads. It configures its own Django project, so it
+runs from a checkout of the repository without the example project:
+
+.. code-block:: bash
+
+    python benchmarks/ingest.py --channels 8 --rate 1000 --duration 10 \\
+        --payloads 16 --output results.json
+
+Every payload carries `--duration` seconds of `--channels` channels sampled
+at `--rate` Hz, with the timestamps encoded as float seconds, integer
+milliseconds or ISO 8601 strings. Consecutive payloads overlap by
+`--duplicates` of their samples, which are resolved with the `--on-conflict`
+policy.
+
+The payloads are posted one by one (single) and all together (``many=True``),
+and for each mode the script reports:
+
+``parse``
+    Reading the JSON body with `StreamingJSONParser`.
+
+``validate``
+    `TimeserieSerializer.is_valid` (which converts the timestamps and values
+    into arrays) and the lookup of the channels of the measure.
+
+``convert``
+    Building the columns of the timeserie tables.
+
+``insert``
+    Writing the columns with the configured ingest engine.
+
+``total``
+    The sum of the stages above.
+
+``request``
+    The whole request, dispatched to `TimeserieViewSet`, measured on its own.
+
+The peak memory of each stage is measured in a separate pass with
+`tracemalloc`, so tracing does not slow down the timed pass.
+
+Database
+--------
+
+By default the samples are written to the PostgreSQL/TimescaleDB instance
+given by the standard ``PGHOST``, ``PGPORT``, ``PGDATABASE``, ``PGUSER`` and
+``PGPASSWORD`` variables (by default the container started by
+``timescaledbapp_create``), which is migrated if needed. The benchmark only
+deletes the samples of its own measure, but a dedicated database is
+recommended.
+
+When the server can not be reached, or with ``--database sqlite``, a
+temporary SQLite database is used instead. Its timings are not
+representative of TimescaleDB, and the results are marked with
+``"fallback": true``.
+
+Output
+------
+
+The results are written as JSON to `--output`, or to the standard output:
+the configuration, the environment, one entry per mode and repetition, and
+the median of the repetitions of each mode.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+)
+
+STAGES = ['parse', 'validate', 'convert', 'insert']
+
+SOURCE = 'benchmark'
+MEASURE = 'ingest'
+
+
+# ----------------------------------------------------------------------
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the ingest of the timeserie endpoint.'
+    )
+    parser.add_argument(
+        '--channels', type=int, default=8, help='Channels per payload.'
+    )
+    parser.add_argument(
+        '--rate', type=float, default=1000, help='Sampling rate, in Hz.'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=10,
+        help='Seconds of samples per payload.',
+    )
+    parser.add_argument(
+        '--timestamps',
+        choices=['float', 'ms', 'iso'],
+        default='float',
+        help='Encoding of the timestamps: float seconds, integer '
+        'milliseconds or ISO 8601 strings.',
+    )
+    parser.add_argument(
+        '--duplicates',
+        type=float,
+        default=0,
+        help='Fraction of the samples of a payload already sent by the '
+        'previous one.',
+    )
+    parser.add_argument(
+        '--on-conflict',
+        choices=['reject', 'skip', 'overwrite'],
+        default=None,
+        help="Conflict policy of the payloads, by default 'skip' when "
+        "there are duplicates and 'reject' otherwise.",
+    )
+    parser.add_argument(
+        '--payloads',
+        type=int,
+        default=8,
+        help='Payloads per mode, posted one by one and as one many=True '
+        'request.',
+    )
+    parser.add_argument(
+        '--layout',
+        choices=['row', 'block', 'wide'],
+        default='row',
+        help='Layout of the benchmark measure.',
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['auto', 'copy', 'bulk_create'],
+        default='auto',
+        help='The TIMESCALEDB_INGEST_ENGINE setting.',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Repetitions of each mode.'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0, help='Seed of the synthetic values.'
+    )
+    parser.add_argument(
+        '--database',
+        choices=['auto', 'postgres', 'sqlite'],
+        default='auto',
+        help="'auto' falls back to SQLite when PostgreSQL is not reachable.",
+    )
+    parser.add_argument(
+        '--output', help='Write the JSON results to this file.'
+    )
+    args = parser.parse_args(argv)
+
+    if not 0 <= args.duplicates < 1:
+        parser.error('--duplicates must be in [0, 1).')
+    if args.timestamps == 'ms' and args.rate > 1000:
+        parser.error('Millisecond timestamps need a rate of 1000 Hz or less.')
+    if min(args.channels, args.payloads, args.repeat) < 1:
+        parser.error('--channels, --payloads and --repeat must be positive.')
+    if round(args.rate * args.duration) < 1:
+        parser.error('Every payload needs at least one sample.')
+    if args.on_conflict is None:
+        args.on_conflict = 'skip' if args.duplicates else 'reject'
+    return args
+
+
+# ----------------------------------------------------------------------
+def postgres_database():
+    """Return the PostgreSQL settings, from the libpq environment."""
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PGDATABASE', 'timescaledb'),
+        'USER': os.environ.get('PGUSER', 'postgres'),
+        'PASSWORD': os.environ.get('PGPASSWORD', 'password'),
+        'HOST': os.environ.get('PGHOST', '127.0.0.1'),
+        'PORT': os.environ.get('PGPORT', '5432'),
+    }
+
+
+# ----------------------------------------------------------------------
+def postgres_available(database):
+    """Check that the PostgreSQL server accepts connections."""
+    try:
+        import psycopg2
+    except ImportError:
+        return False
+    try:
+        psycopg2.connect(
+            dbname=database['NAME'],
+            user=database['USER'],
+            password=database['PASSWORD'],
+            host=database['HOST'],
+            port=database['PORT'],
+            connect_timeout=3,
+        ).close()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+# ----------------------------------------------------------------------
+def configure(args, workdir):
+    """
+    Configure Django for the benchmark.
+
+    Returns
+    -------
+    bool
+        True when the SQLite fallback is used.
+    """
+    import django
+    from django.conf import settings
+
+    database = postgres_database()
+    fallback = args.database == 'sqlite' or (
+        args.database == 'auto' and not postgres_available(database)
+    )
+    if fallback:
+        database = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(workdir, 'timescaledb.sqlite3'),
+        }
+
+    settings.configure(
+        SECRET_KEY='benchmark',
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'django_filters',
+            'rest_framework',
+            'dunderlab.django.timescaledbapp.apps.TimeScaleDBConfig',
+        ],
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(workdir, 'default.sqlite3'),
+            },
+            'timescaledb': database,
+        },
+        DATABASE_ROUTERS=[
+            'dunderlab.django.timescaledbapp.db_router.TimeScaleDBRouter'
+        ],
+        USE_TZ=True,
+        TIME_ZONE='UTC',
+        TIMESCALEDB_CHUNK_INTERVAL='1 days',
+        TIMESCALEDB_RETENTION_INTERVAL='3650 days',
+        TIMESCALEDB_SCHEDULE_INTERVAL='1 days',
+        TIMESCALEDB_INGEST_ENGINE=args.engine,
+    )
+    django.setup()
+    return fallback
+
+
+# ----------------------------------------------------------------------
+def create_schema(fallback):
+    """
+    Create the tables of the benchmark.
+
+    The timeserie tables are unmanaged, created by the migrations on
+    TimescaleDB, so on SQLite they are created here from their models,
+    with the `unique_together` fields as primary key.
+    """
+    from django.apps import apps
+    from django.core.management import call_command
+    from django.db import connections
+
+    call_command('migrate', database='default', verbosity=0)
+    if not fallback:
+        call_command('migrate', database='timescaledb', verbosity=0)
+        return
+
+    connection = connections['timescaledb']
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('timescaledbapp').get_models():
+            if model._meta.managed:
+                editor.create_model(model)
+                continue
+            fields = model._meta.local_concrete_fields
+            columns = ', '.join(
+                f"{editor.quote_name(field.column)} "
+                f"{field.db_type(connection)} "
+                f"{'NULL' if field.null else 'NOT NULL'}"
+                for field in fields
+            )
+            key = ', '.join(
+                editor.quote_name(model._meta.get_field(name).column)
+                for name in model._meta.unique_together[0]
+            )
+            editor.execute(
+                f"CREATE TABLE {editor.quote_name(model._meta.db_table)} "
+                f"({columns}, PRIMARY KEY ({key}))"
+            )
+
+
+# ----------------------------------------------------------------------
+def create_measure(args):
+    """Create the benchmark source, measure and channels, if needed."""
+    from dunderlab.django.timescaledbapp.models import Channel, Measure, Source
+
+    source, _ = Source.objects.get_or_create(
+        label=SOURCE, defaults={'name': 'Ingest benchmark'}
+    )
+    measure, _ = Measure.objects.update_or_create(
+        source=source,
+        label=MEASURE,
+        defaults={'name': 'Ingest benchmark', 'layout': args.layout},
+    )
+    for index in range(args.channels):
+        Channel.objects.update_or_create(
+            measure=measure,
+            label=f'c{index}',
+            defaults={
+                'name': f'Channel {index}',
+                'unit': 'V',
+                'sampling_rate': args.rate,
+            },
+        )
+    measure.channels.exclude(
+        label__in=[f'c{index}' for index in range(args.channels)]
+    ).delete()
+    return measure
+
+
+# ----------------------------------------------------------------------
+def clear_samples(measure):
+    """Delete the samples of the benchmark measure."""
+    from django.db import connections, router
+
+    from dunderlab.django.timescaledbapp.cache import metadata_cache
+    from dunderlab.django.timescaledbapp.models import (
+        Chunk,
+        TimeSerieBlock,
+        TimeSerieWide,
+        timeserie_model,
+    )
+
+    using = router.db_for_write(Chunk)
+    models = [
+        timeserie_model(storage)
+        for storage in ('float64', 'int16', 'int32')
+    ] + [TimeSerieBlock, TimeSerieWide]
+    with connections[using].cursor() as cursor:
+        for model in models:
+            cursor.execute(
+                f"DELETE FROM {model._meta.db_table} WHERE chunk_id IN "
+                f"(SELECT id FROM {Chunk._meta.db_table} "
+                f"WHERE measure_id = %s)",
+                [measure.id],
+            )
+    Chunk.objects.filter(measure=measure).delete()
+    measure.channels.update(count=0)
+    metadata_cache.clear()
+
+
+# ----------------------------------------------------------------------
+def generate_payloads(args):
+    """
+    Generate the synthetic payloads.
+
+    Returns
+    -------
+    list[dict]
+        The payloads, with the timestamps in the configured encoding.
+    """
+    rng = np.random.default_rng(args.seed)
+    n = round(args.rate * args.duration)
+    step = n - round(args.duplicates * n)
+    start = np.datetime64(
+        datetime.now(timezone.utc).replace(tzinfo=None), 'us'
+    ) - np.timedelta64(round(1e6 * args.payloads * args.duration), 'us')
+
+    payloads = []
+    for index in range(args.payloads):
+        offsets = np.rint(
+            np.arange(index * step, index * step + n) * (1e6 / args.rate)
+        ).astype('timedelta64[us]')
+        times = start + offsets
+        micros = times.astype(np.int64)
+        if args.timestamps == 'float':
+            timestamps = (micros / 1e6).tolist()
+        elif args.timestamps == 'ms':
+            timestamps = (micros // 1000).tolist()
+        else:
+            timestamps = np.datetime_as_string(times, timezone='UTC').tolist()
+
+        payloads.append(
+            {
+                'source': SOURCE,
+                'measure': MEASURE,
+                'timestamps': timestamps,
+                'values': {
+                    f'c{channel}': np.round(
+                        rng.standard_normal(n), 6
+                    ).tolist()
+                    for channel in range(args.channels)
+                },
+                'on_conflict': args.on_conflict,
+            }
+        )
+    return payloads
+
+
+########################################################################
+class Recorder:
+    """
+    Records the duration, and optionally the peak memory, of each stage.
+
+    Parameters
+    ----------
+    trace : bool
+        Measure the peak memory of the stages with `tracemalloc`.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, trace: bool = False) -> None:
+        """Start with every stage at zero."""
+        self.trace = trace
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.peak = dict.fromkeys(STAGES, 0)
+
+    # ----------------------------------------------------------------------
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a stage, adding up the time of repeated stages."""
+        if self.trace:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        self.seconds[name] += time.perf_counter() - start
+        if self.trace:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            self.peak[name] = max(self.peak[name], peak)
+
+
+# ----------------------------------------------------------------------
+def run_stages(bodies, many, recorder):
+    """
+    Run the stages of the ingest pipeline, the way the view runs them.
+
+    Parameters
+    ----------
+    bodies : list[bytes]
+        The request bodies, one per request.
+    many : bool
+        Whether each body is a list of payloads.
+    recorder : Recorder
+        Receives the measurements.
+    """
+    from django.db import router, transaction
+    from rest_framework.exceptions import ValidationError
+
+    from dunderlab.django.timescaledbapp.cache import metadata_cache
+    from dunderlab.django.timescaledbapp.ingest import (
+        conflict_policy,
+        write_slices,
+    )
+    from dunderlab.django.timescaledbapp.models import TimeSerie
+    from dunderlab.django.timescaledbapp.parsers import StreamingJSONParser
+    from dunderlab.django.timescaledbapp.serializers import (
+        TimeserieSerializer,
+    )
+
+    using = router.db_for_write(TimeSerie)
+    for body in bodies:
+        with recorder.stage('parse'):
+            data = StreamingJSONParser().parse(io.BytesIO(body))
+
+        with recorder.stage('validate'):
+            serializer = TimeserieSerializer(data=data, many=many)
+            serializer.is_valid(raise_exception=True)
+            # The list serializer checks the payloads with its child
+            child = serializer.child if many else serializer
+            payloads = serializer.validated_data if many else [
+                serializer.validated_data
+            ]
+            measures = []
+            for attrs in payloads:
+                key = (attrs.get('source', ''), attrs['measure'])
+                measure = metadata_cache.get(*key)
+                child.check_channels(attrs, measure)
+                if measure.default_chunk_id is None:
+                    measure = measure._replace(
+                        default_chunk_id=metadata_cache.get_default_chunk_id(
+                            *key
+                        )
+                    )
+                measures.append(measure)
+
+        with recorder.stage('convert'):
+            batch = [
+                (
+                    index,
+                    child.to_columns(
+                        attrs, measure, measure.default_chunk_id
+                    ),
+                    conflict_policy(
+                        attrs.get('on_conflict'), measure.conflict_policy
+                    ),
+                )
+                for index, (attrs, measure) in enumerate(
+                    zip(payloads, measures)
+                )
+            ]
+
+        with recorder.stage('insert'):
+            if many:
+                results = [None] * len(batch)
+                with transaction.atomic(using=using):
+                    serializer.write(batch, results, using)
+                failed = [r for r in results if r['status'] != 'success']
+            else:
+                ((_, tables, on_conflict),) = batch
+                write_slices(
+                    tables.items(), using=using, on_conflict=on_conflict
+                )
+                failed = []
+        if failed:
+            raise ValidationError(failed)
+
+
+# ----------------------------------------------------------------------
+def run_requests(bodies, user):
+    """
+    Post the bodies to the timeserie view.
+
+    Returns
+    -------
+    float
+        The seconds taken by all the requests.
+    """
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from dunderlab.django.timescaledbapp.views import TimeserieViewSet
+
+    factory = APIRequestFactory()
+    view = TimeserieViewSet.as_view({'post': 'create'})
+    seconds = 0.0
+    for body in bodies:
+        request = factory.post(
+            '/timescaledbapp/timeserie/',
+            body,
+            content_type='application/json',
+        )
+        force_authenticate(request, user=user)
+        start = time.perf_counter()
+        response = view(request)
+        seconds += time.perf_counter() - start
+        if response.status_code not in (201, 207):
+            raise RuntimeError(
+                f'The request failed with {response.status_code}: '
+                f'{response.data}'
+            )
+        if response.status_code == 207:
+            raise RuntimeError(f'Some payloads failed: {response.data}')
+    return seconds
+
+
+# ----------------------------------------------------------------------
+def benchmark_user():
+    """Return a user allowed to post to the timeserie endpoint."""
+    from django.contrib.auth.models import Group, User
+
+    user, _ = User.objects.get_or_create(username='benchmark')
+    group, _ = Group.objects.get_or_create(name='api_admin')
+    user.groups.add(group)
+    return user
+
+
+# ----------------------------------------------------------------------
+def run(args):
+    """Run the benchmark and return the results."""
+    with tempfile.TemporaryDirectory() as workdir:
+        fallback = configure(args, workdir)
+
+        import django
+        from django.db import connections
+
+        from dunderlab.django.timescaledbapp.ingest import get_ingest_engine
+
+        create_schema(fallback)
+        measure = create_measure(args)
+        user = benchmark_user()
+        if fallback:
+            print(
+                'Warning: using the SQLite fallback, its timings are not '
+                'representative of TimescaleDB.',
+                file=sys.stderr,
+            )
+
+        payloads = generate_payloads(args)
+        samples = sum(
+            len(values)
+            for payload in payloads
+            for values in payload['values'].values()
+        )
+        modes = {
+            'single': [json.dumps(payload).encode() for payload in payloads],
+            'many': [json.dumps(payloads).encode()],
+        }
+        del payloads
+
+        results = []
+        for mode, bodies in modes.items():
+            for repeat in range(args.repeat):
+                clear_samples(measure)
+                timed = Recorder()
+                run_stages(bodies, mode == 'many', timed)
+
+                clear_samples(measure)
+                traced = Recorder(trace=True)
+                tracemalloc.start()
+                try:
+                    run_stages(bodies, mode == 'many', traced)
+                finally:
+                    tracemalloc.stop()
+
+                clear_samples(measure)
+                request = run_requests(bodies, user)
+
+                seconds = dict(timed.seconds)
+                seconds['total'] = sum(timed.seconds.values())
+                seconds['request'] = request
+                results.append(
+                    {
+                        'mode': mode,
+                        'repeat': repeat,
+                        'requests': len(bodies),
+                        'bytes': sum(map(len, bodies)),
+                        'seconds': seconds,
+                        'peak_memory_bytes': dict(traced.peak),
+                        'samples_per_second': {
+                            'total': samples / seconds['total'],
+                            'request': samples / request,
+                        },
+                    }
+                )
+        clear_samples(measure)
+
+        connection = connections['timescaledb']
+        database = {
+            'vendor': connection.vendor,
+            'fallback': fallback,
+            'engine': type(get_ingest_engine('timescaledb')).__name__,
+        }
+        if not fallback:
+            database['name'] = connection.settings_dict['NAME']
+            database['host'] = connection.settings_dict['HOST']
+
+        return {
+            'benchmark': 'ingest',
+            'created': datetime.now(timezone.utc).isoformat(),
+            'config': {
+                'channels': args.channels,
+                'rate': args.rate,
+                'duration': args.duration,
+                'timestamps': args.timestamps,
+                'duplicates': args.duplicates,
+                'on_conflict': args.on_conflict,
+                'payloads': args.payloads,
+                'layout': args.layout,
+                'repeat': args.repeat,
+                'seed': args.seed,
+                'samples': samples,
+            },
+            'database': database,
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'peak_rss_bytes': peak_rss(),
+            },
+            'results': results,
+            'summary': summary(results),
+        }
+
+
+# ----------------------------------------------------------------------
+def peak_rss():
+    """Return the peak resident memory of the process, in bytes."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# ----------------------------------------------------------------------
+def summary(results):
+    """Return the median of the repetitions of each mode."""
+    modes = {}
+    for result in results:
+        modes.setdefault(result['mode'], []).append(result)
+    return {
+        mode: {
+            'seconds': {
+                stage: statistics.median(r['seconds'][stage] for r in runs)
+                for stage in runs[0]['seconds']
+            },
+            'peak_memory_bytes': {
+                stage: max(r['peak_memory_bytes'][stage] for r in runs)
+                for stage in STAGES
+            },
+            'samples_per_second': {
+                key: statistics.median(
+                    r['samples_per_second'][key] for r in runs
+                )
+                for key in runs[0]['samples_per_second']
+            },
+        }
+        for mode, runs in modes.items()
+    }
+
+
+# ----------------------------------------------------------------------
+def main(argv=None):
+    """Run the benchmark and write the JSON results."""
+    args = parse_args(argv)
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,12 @@ aioAPI:
     authorization. It can perform GET and POST requests to the API endpoints
     asynchronously and supports batch retrieval and submission of data.
 
+aioStream:
+    A client for the streaming ingest WebSocket of the timescaledbapp. It is
+    created with `aioAPI.stream` and sends frames of samples over a single
+    connection, waiting for acknowledgements when the flow control window is
+    full.
+
 inset (nested in aioAPI):
     A nested class in aioAPI that is used to interact with a specific API
     endpoint. It is initialized with an endpoint and provides methods to adjust
@@ -34,17 +40,40 @@ In this case, 'my_endpoint' is an endpoint of the API. The 'get' method
 performs a GET request to the endpoint and returns the retrieved data. To
 retrieve the data in batches, an additional 'batch_size' argument can be
 supplied to the 'get' method.
+
+The timeseries can be limited to a time range with 'start' and 'end', given
+as `datetime` objects, ISO 8601 strings or epoch seconds:
+
+data = await api.timeserie.get(source="src", measure="m", start=datetime.now(timezone.utc) - timedelta(minutes=5))
+
+The paginated responses are returned as asynchronous generators that follow
+the 'next' links. The timeseries requested without a 'page' are paged by key
+('pagination=cursor'), so walking the whole history costs the same for
+every page.
+
+Samples can also be streamed over a WebSocket:
+
+async with api.stream(source="src", measure="m") as stream:
+    await stream.send(timestamps, {"c0": values})
 """
 
+import gzip
 import inspect
 import logging
 import math
 import json
 import asyncio
+from datetime import date
 from typing import Any, Optional, Union, AsyncGenerator
+from urllib.parse import urljoin
 
 import aiohttp
 
+try:
+    from aiohttp.compression_utils import HAS_ZSTD
+except ImportError:
+    HAS_ZSTD = False
+
 METHODS = ['post', 'put', '', 'get', 'delete', 'options', 'head']
 
 
@@ -77,6 +106,188 @@ def batches(seq: list[Any], batch_size: int) -> list[Any]:
         yield seq[start:end]
 
 
+# ----------------------------------------------------------------------
+def to_list(seq: Any) -> list[Any]:
+    """Convert a sequence, or a NumPy array, into a JSON serializable list."""
+    if hasattr(seq, 'tolist'):
+        return seq.tolist()
+    return list(seq)
+
+
+# ----------------------------------------------------------------------
+def to_param(value: Any) -> str:
+    """Convert a `datetime`, or a NumPy scalar, into a query parameter."""
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, 'dtype') and value.dtype.kind == 'M':
+        return f"{value.astype('datetime64[us]')}Z"
+    return str(value.item() if hasattr(value, 'item') else value)
+
+
+########################################################################
+class aioStream:
+    """
+    Client for the streaming ingest WebSocket.
+
+    Parameters
+    ----------
+    url : str
+        The WebSocket URL of the endpoint.
+    bind : dict[str, Any]
+        The 'bind' message, with the source, measure and optional chunk,
+        conflict policy and token.
+    headers : dict[str, str], optional
+        Headers of the handshake, e.g. the 'Authorization' header.
+
+    Attributes
+    ----------
+    acks : list[dict[str, Any]]
+        The acknowledgements received from the server.
+    errors : list[dict[str, Any]]
+        The errors received from the server.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        url: str,
+        bind: dict[str, Any],
+        headers: Optional[dict[str, str]] = None,
+    ):
+        self.url = url
+        self.bind = {'type': 'bind', **bind}
+        self.headers = headers or {}
+        self.acks = []
+        self.errors = []
+        self.seq = 0
+        self.acked = 0
+        self.window = 1
+        self.channels = []
+        self._session = None
+        self._ws = None
+        self._reader = None
+        self._credit = asyncio.Condition()
+
+    # ----------------------------------------------------------------------
+    async def __aenter__(self) -> 'aioStream':
+        await self.connect()
+        return self
+
+    # ----------------------------------------------------------------------
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    # ----------------------------------------------------------------------
+    async def connect(self) -> None:
+        """
+        Open the connection and bind it to the measure.
+
+        Raises
+        ------
+        ConnectionError
+            If the server refuses the bind message.
+        """
+        self._session = aiohttp.ClientSession(headers=self.headers)
+        self._ws = await self._session.ws_connect(self.url)
+        await self._ws.send_json(self.bind)
+
+        response = await self._ws.receive_json()
+        if response.get('type') != 'bound':
+            await self.close()
+            raise ConnectionError(response.get('errors', response))
+
+        self.window = response['window']
+        self.channels = response['channels']
+        self._reader = asyncio.create_task(self.read())
+
+    # ----------------------------------------------------------------------
+    async def read(self) -> None:
+        """Read the acknowledgements and errors sent by the server."""
+        async for message in self._ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = json.loads(message.data)
+            if data.get('type') == 'ack':
+                self.acks.append(data)
+                self.acked = max(self.acked, data['seq'])
+            elif data.get('type') == 'error':
+                self.errors.append(data)
+                logging.warning(f"Stream error: {data.get('errors')}")
+                if 'seq' in data:
+                    self.acked = max(self.acked, data['seq'])
+            async with self._credit:
+                self._credit.notify_all()
+
+        async with self._credit:
+            self._credit.notify_all()
+
+    # ----------------------------------------------------------------------
+    async def send(
+        self,
+        timestamps: list[Any],
+        values: dict[str, list[float]],
+    ) -> int:
+        """
+        Send a frame of samples, waiting for credit if the window is full.
+
+        Parameters
+        ----------
+        timestamps : list
+            The timestamps of the samples, as epoch or ISO strings.
+        values : dict[str, list[float]]
+            The values of each channel.
+
+        Returns
+        -------
+        int
+            The sequence number of the frame.
+        """
+        async with self._credit:
+            await self._credit.wait_for(
+                lambda: self.seq - self.acked < self.window
+                or self._ws.closed
+            )
+        if self._ws.closed:
+            raise ConnectionError("The stream is closed.")
+
+        self.seq += 1
+        await self._ws.send_str(
+            json.dumps(
+                {
+                    'seq': self.seq,
+                    'timestamps': to_list(timestamps),
+                    'values': {k: to_list(v) for k, v in values.items()},
+                }
+            )
+        )
+        return self.seq
+
+    # ----------------------------------------------------------------------
+    async def drain(self, timeout: float = 30) -> None:
+        """Wait until every frame sent is acknowledged."""
+        async with self._credit:
+            await asyncio.wait_for(
+                self._credit.wait_for(
+                    lambda: self.acked >= self.seq or self._ws.closed
+                ),
+                timeout,
+            )
+
+    # ----------------------------------------------------------------------
+    async def close(self) -> None:
+        """Wait for the pending acknowledgements and close the connection."""
+        if self._ws is not None and not self._ws.closed:
+            try:
+                await self.drain()
+            except asyncio.TimeoutError:
+                logging.warning("Stream closed with frames not acknowledged.")
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+        if self._session is not None:
+            await self._session.close()
+
+
 ########################################################################
 class aioAPI:
     """
@@ -90,6 +301,9 @@ class aioAPI:
         JWT token for API authorization.
     auth : Any, optional
         Authorization information.
+    compress_min_size : int, optional
+        Timeserie uploads of at least this number of bytes are sent
+        compressed with gzip, by default 1024. None disables the compression.
 
     Attributes
     ----------
@@ -109,12 +323,14 @@ class aioAPI:
         url: Optional[str] = None,
         token: Optional[str] = None,
         auth: Optional[Any] = None,
+        compress_min_size: Optional[int] = 1024,
     ):
         if url and not url.endswith("/"):
             url = "{}/".format(url)
         if url:
             self.HTTP_SERVICE: str = url
         self.AUTH = auth
+        self.compress_min_size = compress_min_size
 
         self.API_TOKEN = self.HTTP_SERVICE + 'api/token/'
         self.API_TOKEN_VERIFY = self.API_TOKEN + 'verify/'
@@ -126,6 +342,9 @@ class aioAPI:
         else:
             self.headers: dict[str, str] = {}
         self.headers['Content-Type'] = 'application/json'
+        self.headers['Accept-Encoding'] = (
+            'zstd, gzip, deflate' if HAS_ZSTD else 'gzip, deflate'
+        )
         self.__endpoints__ = asyncio.wait_for(self.endpoints(), timeout=5)
         assert (
             self.__endpoints__
@@ -210,9 +429,16 @@ class aioAPI:
                     params[k], (list, tuple)
                 ):
                     params[k] = ','.join(params[k])
+                elif isinstance(params[k], date) or hasattr(
+                    params[k], 'dtype'
+                ):
+                    params[k] = to_param(params[k])
 
             # print(params)
 
+        if call == 'timeserie' and mode == 'get' and 'page' not in params:
+            params.setdefault('pagination', 'cursor')
+
         if not url:
             url = self.HTTP_SERVICE + call + "/"
 
@@ -226,12 +452,22 @@ class aioAPI:
 
             data = json.dumps(data)
 
+        headers = {}
+        if (
+            call == 'timeserie'
+            and isinstance(data, str)
+            and self.compress_min_size is not None
+            and len(data) >= self.compress_min_size
+        ):
+            data = gzip.compress(data.encode(), compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+
         resp = None
         async with aiohttp.ClientSession(
             headers=self.headers, timeout=timeout
         ) as session:
             async with getattr(session, mode)(
-                url, params=params, data=data, auth=self.AUTH
+                url, params=params, data=data, headers=headers, auth=self.AUTH
             ) as response:
                 if response.status in [200, 201]:
                     resp = await response.json()
@@ -249,6 +485,48 @@ class aioAPI:
         logging.warning(f"Error {response.status}: {response.reason}")
         return resp
 
+    # ----------------------------------------------------------------------
+    def stream(
+        self,
+        source: str,
+        measure: str,
+        chunk: Optional[str] = None,
+        on_conflict: Optional[str] = None,
+        path: str = '/ws/timeserie/',
+    ) -> aioStream:
+        """
+        Create a client for the streaming ingest WebSocket.
+
+        Parameters
+        ----------
+        source : str
+            The label of the source.
+        measure : str
+            The label of the measure.
+        chunk : str, optional
+            The label of a new chunk for the samples.
+        on_conflict : str, optional
+            The conflict policy, 'reject', 'skip' or 'overwrite'.
+        path : str, optional
+            The path of the endpoint, by default '/ws/timeserie/'.
+
+        Returns
+        -------
+        aioStream
+            The stream, to be used as an asynchronous context manager.
+        """
+        bind = {'source': source, 'measure': measure}
+        if chunk:
+            bind['chunk'] = chunk
+        if on_conflict:
+            bind['on_conflict'] = on_conflict
+
+        url = urljoin(self.HTTP_SERVICE.replace('http', 'ws', 1), path)
+        headers = {
+            k: v for k, v in self.headers.items() if k == 'Authorization'
+        }
+        return aioStream(url, bind, headers=headers)
+
     # ----------------------------------------------------------------------
     async def request_generator(
         self, resp: dict[str, Any], mode: str
@@ -256,6 +534,9 @@ class aioAPI:
         """
         Asynchronous generator to recursively request next page data based on the response from the server.
 
+        The 'next' links carry the page number or the cursor of the next page,
+        so both paginations are followed the same way.
+
         Parameters
         ----------
         resp : dict
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimeScaleDBConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "dunderlab.django.timescaledbapp"
+
+    def ready(self):
+        from . import signals  # noqa: F401
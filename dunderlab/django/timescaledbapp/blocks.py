@@ -0,0 +1,653 @@
+"""
+=====================
+Timescaledbapp Blocks
+=====================
+
+This module provides the array-block layout of the samples, used by the
+measures with the 'block' layout. Instead of one row per sample, the samples
+of each channel are packed in blocks of consecutive samples, stored in the
+`TimeSerieBlock` table:
+
+``block_start``, ``n`` and ``sample_period``
+    The first timestamp, the number of samples and the period in seconds of
+    a run of uniformly sampled data. The timestamps are not stored.
+
+``offsets``
+    Samples that are not uniformly spaced keep their timestamps, as int64
+    microseconds from ``block_start``, and a ``sample_period`` of 0.
+
+``values``
+    The values, packed little-endian with the dtype of the channel storage,
+    so the integer channels keep their raw counts (see `Channel.storage`).
+
+The uploads sent with a `t0` instead of their timestamps (see
+`TimeserieSerializer`) are packed in uniform blocks right away, from the
+sampling rate of each channel.
+
+The blocks of a channel must not overlap. The blocks that start at the
+same time as an existing block of their channel and chunk are handled by
+the conflict policy of the measure, like the rows of the other layouts,
+and `overlapping_blocks` finds the ones that overlap the time span of other
+blocks, like the re-uploads split at different samples, which are skipped
+with the 'skip' policy and refused with the others.
+
+Functions
+---------
+
+.. rubric:: uniform_runs
+
+Finds the runs of uniformly spaced timestamps.
+
+.. rubric:: block_columns
+
+Packs the samples of several channels into the columns of the block table.
+
+.. rubric:: unpack_blocks
+
+Rebuilds the timestamps and values of a sequence of blocks.
+
+.. rubric:: block_ends
+
+Returns the timestamp of the last sample of each block.
+
+.. rubric:: overlapping_blocks
+
+Finds the blocks that overlap other blocks of their channel and chunk.
+
+Classes
+-------
+
+.. rubric:: Sample
+
+A single sample, with a `timestamp` and a `value`.
+
+.. rubric:: SampleColumns
+
+A sequence of samples backed by a `timestamp` and a `value` array.
+
+.. rubric:: BlockSamples
+
+The samples of a channel, as a sequence that only reads the blocks of the
+slices requested by the paginator.
+
+Settings
+--------
+
+``TIMESCALEDB_BLOCKS``
+    A dictionary with ``'SIZE'`` (the maximum number of samples of a block,
+    default 1024), ``'MIN_RUN'`` (shorter uniform runs are stored with their
+    offsets, default 8) and ``'TOLERANCE'`` (the maximum error, in
+    microseconds, of the timestamps rebuilt from the sample period,
+    default 1).
+
+"""
+
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Union
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q, QuerySet
+from django.utils.functional import cached_property
+
+from .cache import ChannelMetadata
+from .converters import (
+    UTCTimestamp,
+    from_datetimes,
+    time_filter,
+    to_datetimes,
+    uniform_timestamps,
+)
+from .models import TimeSerieBlock
+
+
+# ----------------------------------------------------------------------
+def blocks_config() -> dict[str, Any]:
+    """Return the `TIMESCALEDB_BLOCKS` setting with its defaults."""
+    return {
+        'SIZE': 1024,
+        'MIN_RUN': 8,
+        'TOLERANCE': 1,
+        **getattr(settings, 'TIMESCALEDB_BLOCKS', {}),
+    }
+
+
+# ----------------------------------------------------------------------
+def fits_period(times: np.ndarray, tolerance: int) -> bool:
+    """Check that `times` are rebuilt from their mean period within `tolerance`."""
+    if len(times) < 3:
+        return True
+    period = (times[-1] - times[0]) / (len(times) - 1)
+    rebuilt = times[0] + np.rint(np.arange(len(times)) * period).astype(np.int64)
+    return bool(np.abs(rebuilt - times).max() <= tolerance)
+
+
+# ----------------------------------------------------------------------
+def uniform_runs(
+    times: np.ndarray, size: int, min_run: int, tolerance: int
+) -> list[tuple[int, int]]:
+    """
+    Find the runs of uniformly spaced timestamps.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The timestamps, as int64 microseconds.
+    size : int
+        The maximum length of a run.
+    min_run : int
+        The minimum length of a run.
+    tolerance : int
+        The maximum error, in microseconds, of the timestamps rebuilt from
+        the period of a run.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        The start and stop indexes of each run, in order.
+
+    Examples
+    --------
+    >>> times = np.array([0, 10, 20, 30, 45, 50, 60, 70, 80])
+    >>> uniform_runs(times, size=1024, min_run=3, tolerance=0)
+    [(0, 4), (5, 9)]
+    """
+    steps = np.diff(times)
+    # Each run of steps similar to the previous one joins its samples
+    breaks = np.flatnonzero(np.abs(np.diff(steps)) > tolerance) + 1
+    bounds = zip(np.r_[0, breaks].tolist(), np.r_[breaks, len(steps)].tolist())
+
+    runs = []
+    free = 0
+    for first, last in bounds:
+        first = max(first, free)
+        if last + 1 - first < min_run:
+            continue
+        free = last + 1
+        for start in range(first, free, size):
+            pending = [(start, min(start + size, free))]
+            while pending:
+                start_, stop = pending.pop()
+                if fits_period(times[start_:stop], tolerance):
+                    runs.append((start_, stop))
+                elif stop - start_ >= 2 * min_run:
+                    middle = (start_ + stop) // 2
+                    pending += [(middle, stop), (start_, middle)]
+    return runs
+
+
+# ----------------------------------------------------------------------
+def block_columns(
+    timestamps: Optional[np.ndarray],
+    values: dict[str, np.ndarray],
+    channels: dict[str, ChannelMetadata],
+    chunk_id: int,
+    t0: Optional[np.datetime64] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Pack the samples of several channels into the columns of the block table.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray or None
+        The `datetime64[us]` timestamps shared by all the channels, None
+        when `t0` is given.
+    values : dict[str, np.ndarray]
+        The values of each channel, with the dtype of its storage, keyed by
+        channel label.
+    channels : dict[str, ChannelMetadata]
+        The metadata of the channels, keyed by label.
+    chunk_id : int
+        The id of the chunk the samples belong to.
+    t0 : np.datetime64, optional
+        The timestamp of the first sample of every channel, which are
+        uniformly sampled at their `sampling_rate`.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The `block_start`, `n`, `sample_period`, `values`, `offsets`,
+        `channel_id` and `chunk_id` columns.
+    """
+    config = blocks_config()
+    blocks = []
+    for label, array in values.items():
+        array = array.astype(array.dtype.newbyteorder('<'))
+        if t0 is not None:
+            blocks += uniform_blocks(array, channels[label], t0, config['SIZE'])
+            continue
+        times = timestamps[: len(array)].astype('datetime64[us]').astype(np.int64)
+
+        # Uniform runs, and the irregular samples between them
+        runs = uniform_runs(
+            times, config['SIZE'], config['MIN_RUN'], config['TOLERANCE']
+        )
+        spans = []
+        done = 0
+        for start, stop in runs + [(len(times), len(times))]:
+            spans += [
+                (first, min(first + config['SIZE'], start), False)
+                for first in range(done, start, config['SIZE'])
+            ]
+            if start < stop:
+                spans.append((start, stop, True))
+            done = stop
+
+        for start, stop, uniform in spans:
+            n = stop - start
+            offsets = None
+            period = 0.0
+            if uniform and n > 1:
+                period = (times[stop - 1] - times[start]) / (n - 1) / 1e6
+            elif n > 1:
+                offsets = (times[start:stop] - times[start]).astype('<i8').tobytes()
+            blocks.append(
+                (
+                    times[start],
+                    n,
+                    period,
+                    array[start:stop].tobytes(),
+                    offsets,
+                    channels[label].id,
+                )
+            )
+
+    starts, ns, periods, packed, offsets, channel_ids = (
+        zip(*blocks) if blocks else [()] * 6
+    )
+    return {
+        'block_start': np.array(starts, dtype=np.int64).astype('datetime64[us]'),
+        'n': np.array(ns, dtype=np.int32),
+        'sample_period': np.array(periods, dtype=np.float64),
+        'values': np.array(packed + (None,), dtype=object)[:-1],
+        'offsets': np.array(offsets + (None,), dtype=object)[:-1],
+        'channel_id': np.array(channel_ids, dtype=np.int32),
+        'chunk_id': np.full(len(blocks), chunk_id, dtype=np.int32),
+    }
+
+
+# ----------------------------------------------------------------------
+def uniform_blocks(
+    array: np.ndarray, channel: ChannelMetadata, t0: np.datetime64, size: int
+) -> list[tuple]:
+    """Split the samples of a uniformly sampled channel into blocks."""
+    firsts = range(0, len(array), size)
+    starts = uniform_timestamps(t0, channel.sampling_rate / size, len(firsts))
+    return [
+        (
+            start,
+            min(size, len(array) - first),
+            1 / channel.sampling_rate,
+            array[first : first + size].tobytes(),
+            None,
+            channel.id,
+        )
+        for first, start in zip(firsts, starts.astype(np.int64).tolist())
+    ]
+
+
+# ----------------------------------------------------------------------
+def unpack_blocks(
+    starts: np.ndarray,
+    ns: np.ndarray,
+    periods: np.ndarray,
+    values: list[bytes],
+    offsets: list[Optional[bytes]],
+    storage: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rebuild the timestamps and values of a sequence of blocks.
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        The `datetime64[us]` start of each block.
+    ns : np.ndarray
+        The number of samples of each block.
+    periods : np.ndarray
+        The sample period of each block, in seconds.
+    values : list[bytes]
+        The packed values of each block.
+    offsets : list[bytes or None]
+        The packed offsets of each irregular block.
+    storage : str
+        The storage mode of the channel, the dtype of the values.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The `datetime64[us]` timestamps and the values of all the samples.
+    """
+    ns = np.asarray(ns, dtype=np.int64)
+    firsts = np.cumsum(ns) - ns
+    starts = np.asarray(starts, dtype='datetime64[us]').astype(np.int64)
+
+    index = np.arange(ns.sum()) - np.repeat(firsts, ns)
+    times = np.repeat(starts, ns) + np.rint(
+        index * np.repeat(np.asarray(periods, dtype=np.float64) * 1e6, ns)
+    ).astype(np.int64)
+    for first, n, start, packed in zip(firsts, ns, starts, offsets):
+        if packed is not None:
+            times[first : first + n] = start + np.frombuffer(packed, dtype='<i8')
+
+    dtype = np.dtype(storage)
+    array = np.frombuffer(b''.join(values), dtype=dtype.newbyteorder('<'))
+    return times.astype('datetime64[us]'), array.astype(dtype)
+
+
+# ----------------------------------------------------------------------
+def block_ends(
+    starts: np.ndarray,
+    ns: np.ndarray,
+    periods: np.ndarray,
+    offsets: list[Optional[bytes]],
+) -> np.ndarray:
+    """
+    Return the timestamp of the last sample of each block.
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        The `datetime64[us]` start of each block.
+    ns : np.ndarray
+        The number of samples of each block.
+    periods : np.ndarray
+        The sample period of each block, in seconds.
+    offsets : list[bytes or None]
+        The packed offsets of each irregular block.
+
+    Returns
+    -------
+    np.ndarray
+        The `datetime64[us]` timestamp of the last sample of each block.
+    """
+    starts = np.asarray(starts, dtype='datetime64[us]').astype(np.int64)
+    ends = starts + np.rint(
+        (np.asarray(ns, dtype=np.int64) - 1)
+        * np.asarray(periods, dtype=np.float64)
+        * 1e6
+    ).astype(np.int64)
+    for i, packed in enumerate(offsets):
+        if packed is not None:
+            ends[i] = starts[i] + np.frombuffer(packed[-8:], dtype='<i8')[0]
+    return ends.astype('datetime64[us]')
+
+
+# ----------------------------------------------------------------------
+def overlapping_blocks(
+    columns: dict[str, np.ndarray], using: Optional[str] = None
+) -> np.ndarray:
+    """
+    Find the blocks that overlap other blocks of their channel and chunk.
+
+    The blocks are compared with the stored blocks, and with each other,
+    by the time span of their samples. The blocks that start at the same
+    time are not overlaps, but conflicts of their key, left to the conflict
+    policy. Only the stored blocks within the span of the new ones, and the
+    last one that starts before it, are read, since the stored blocks do not
+    overlap.
+
+    Parameters
+    ----------
+    columns : dict[str, np.ndarray]
+        The columns of the new blocks, as returned by `block_columns`.
+    using : str, optional
+        The database alias.
+
+    Returns
+    -------
+    np.ndarray
+        The mask of the new blocks that overlap another block.
+    """
+    starts = columns['block_start'].astype('datetime64[us]')
+    ends = block_ends(
+        starts, columns['n'], columns['sample_period'], columns['offsets']
+    )
+    overlaps = np.zeros(len(starts), dtype=bool)
+
+    keys = np.stack([columns['channel_id'], columns['chunk_id']], axis=1)
+    for channel_id, chunk_id in np.unique(keys, axis=0).tolist():
+        group = np.flatnonzero(
+            (columns['channel_id'] == channel_id) & (columns['chunk_id'] == chunk_id)
+        )
+        group = group[np.argsort(starts[group], kind='stable')]
+        new_starts, new_ends = starts[group], ends[group]
+
+        # The new blocks that overlap the previous ones of the same write
+        if len(group) > 1:
+            previous = np.maximum.accumulate(new_ends)[:-1]
+            overlaps[group[1:]] |= (new_starts[1:] <= previous) & (
+                new_starts[1:] != new_starts[:-1]
+            )
+
+        blocks = TimeSerieBlock.objects.using(using).filter(
+            channel_id=channel_id, chunk_id=chunk_id
+        )
+        first = blocks.filter(
+            time_filter(end=new_starts[0], field='block_start')
+        ).aggregate(first=Max('block_start'))['first']
+        rows = list(
+            blocks.filter(
+                time_filter(
+                    new_starts[0] if first is None else from_datetimes([first])[0],
+                    new_ends.max(),
+                    field='block_start',
+                )
+            )
+            .order_by('block_start')
+            .values_list('block_start', 'n', 'sample_period', 'offsets')
+        )
+        if not rows:
+            continue
+        block_starts, ns, periods, offsets = zip(*rows)
+        stored_starts = from_datetimes(block_starts)
+        stored_ends = block_ends(stored_starts, ns, periods, offsets)
+
+        # The stored blocks that end after each start and begin before each end
+        after = np.searchsorted(stored_ends, new_starts, side='left')
+        before = np.searchsorted(stored_starts, new_ends, side='right')
+        same = np.isin(new_starts, stored_starts)
+        overlaps[group] |= before - after - same > 0
+    return overlaps
+
+
+########################################################################
+class Sample(NamedTuple):
+    """A single sample, as read from the block table."""
+    timestamp: datetime
+    value: float
+
+
+########################################################################
+class SampleColumns(Sequence):
+    """
+    A sequence of samples backed by a `timestamp` and a `value` array.
+
+    Its items are `Sample` tuples, but :func:`.fetch.sample_columns` reads
+    its arrays directly.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The naive UTC `datetime64[us]` timestamps.
+    values : np.ndarray
+        The values.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """Keep the arrays of the samples."""
+        self.timestamps = timestamps
+        self.values = values
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """The number of samples."""
+        return len(self.values)
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, item: Union[int, slice]) -> Any:
+        """Return a sample, or the samples of a slice."""
+        if isinstance(item, slice):
+            return SampleColumns(self.timestamps[item], self.values[item])
+        (timestamp,) = to_datetimes(self.timestamps[[item]])
+        return Sample(timestamp, self.values[item].item())
+
+
+########################################################################
+class BlockSamples(Sequence):
+    """
+    The samples of a channel stored in blocks.
+
+    The start and length of every block are read once, then each slice only
+    reads the blocks that hold its samples, so a page of samples costs one
+    query whatever its position.
+
+    Parameters
+    ----------
+    channel : ChannelMetadata
+        The channel.
+    chunk_id : int, optional
+        Only the samples of this chunk.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the samples between these naive UTC times, included, unbounded
+        when None. The blocks of a channel do not overlap (see
+        `overlapping_blocks`), so only the first and last blocks are
+        unpacked to count the samples out of the range.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        channel: ChannelMetadata,
+        chunk_id: Optional[int] = None,
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+            None,
+            None,
+        ),
+    ) -> None:
+        """Select the blocks of the channel."""
+        self.storage = channel.storage
+        self.start, self.end = timerange
+        self.blocks = TimeSerieBlock.objects.filter(channel_id=channel.id)
+        if chunk_id is not None:
+            self.blocks = self.blocks.filter(chunk_id=chunk_id)
+
+    # ----------------------------------------------------------------------
+    @cached_property
+    def queryset(self) -> QuerySet:
+        """The blocks that can hold samples within the time range."""
+        queryset = self.blocks.filter(
+            time_filter(end=self.end, field='block_start')
+        )
+        if self.start is not None:
+            # The samples before the start are in the blocks that start last
+            # before it, and the blocks are not indexed by their end
+            first = queryset.filter(
+                time_filter(end=self.start, field='block_start')
+            ).aggregate(first=Max('block_start'))['first']
+            queryset = queryset.filter(
+                time_filter(
+                    self.start if first is None else from_datetimes([first])[0],
+                    field='block_start',
+                )
+            )
+        return queryset.order_by('block_start', 'chunk_id')
+
+    # ----------------------------------------------------------------------
+    @cached_property
+    def index(self) -> tuple[list[datetime], np.ndarray, np.ndarray]:
+        """
+        The start of each block, their `datetime64` values and their ends.
+
+        The ends count only the samples within the time range.
+        """
+        rows = list(self.queryset.values_list('block_start', 'n'))
+        starts = [start for start, _ in rows]
+        times = from_datetimes(starts)
+        counts = np.array([n for _, n in rows], dtype=np.int64)
+
+        if rows and (self.start is not None or self.end is not None):
+            edges = times == times[-1]
+            if self.start is not None:
+                edges |= times < self.start
+            edge_times = Q()
+            for time in np.unique(times[edges]):
+                edge_times |= Q(block_start=UTCTimestamp(time))
+            blocks = self.queryset.filter(edge_times).values_list(
+                'block_start', 'n', 'sample_period', 'values', 'offsets'
+            )
+            block_starts, ns, periods, values, offsets = zip(*blocks)
+            timestamps, _ = unpack_blocks(
+                from_datetimes(block_starts), ns, periods, values, offsets,
+                self.storage,
+            )
+            firsts = np.cumsum(ns) - np.asarray(ns)
+            counts[edges] = np.add.reduceat(
+                self.within(timestamps).astype(np.int64), firsts
+            )
+
+        return starts, times, np.cumsum(counts)
+
+    # ----------------------------------------------------------------------
+    def within(self, timestamps: np.ndarray) -> np.ndarray:
+        """Return the mask of the timestamps within the time range."""
+        mask = np.ones(len(timestamps), dtype=bool)
+        if self.start is not None:
+            mask &= timestamps >= self.start
+        if self.end is not None:
+            mask &= timestamps <= self.end
+        return mask
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """The number of samples."""
+        ends = self.index[2]
+        return int(ends[-1]) if len(ends) else 0
+
+    # ----------------------------------------------------------------------
+    def __iter__(self):
+        """Iterate over all the samples."""
+        return iter(self[:])
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, item: Union[int, slice]) -> Any:
+        """
+        Return a sample, or the `SampleColumns` of a slice.
+
+        Only the blocks that overlap the slice are read, and the blocks
+        that start at the same time are read together.
+        """
+        if not isinstance(item, slice):
+            index = item + len(self) if item < 0 else item
+            if not 0 <= index < len(self):
+                raise IndexError("Sample index out of range.")
+            return self[index : index + 1][0]
+
+        start, stop, step = item.indices(len(self))
+        if start >= stop:
+            return []
+
+        starts, times, ends = self.index
+        first = np.searchsorted(ends, start, side='right')
+        last = np.searchsorted(ends, stop - 1, side='right')
+        first = np.searchsorted(times, times[first], side='left')
+        last = np.searchsorted(times, times[last], side='right')
+
+        blocks = list(
+            self.queryset.filter(
+                block_start__range=(starts[first], starts[last - 1])
+            ).values_list('block_start', 'n', 'sample_period', 'values', 'offsets')
+        )
+        block_starts, ns, periods, values, offsets = zip(*blocks)
+        timestamps, samples = unpack_blocks(
+            from_datetimes(block_starts), ns, periods, values, offsets, self.storage
+        )
+        if self.start is not None or self.end is not None:
+            mask = self.within(timestamps)
+            timestamps, samples = timestamps[mask], samples[mask]
+
+        skipped = int(ends[first - 1]) if first else 0
+        selection = slice(start - skipped, stop - skipped, step)
+        return SampleColumns(timestamps[selection], samples[selection])
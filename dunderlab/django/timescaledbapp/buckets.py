@@ -0,0 +1,403 @@
+"""
+======================
+Timescaledbapp Buckets
+======================
+
+This module provides the downsampling of the time series into time buckets,
+for the overviews of long periods. The samples of each channel are grouped
+in buckets of a fixed width, and only the aggregates of each bucket are
+returned, with the start of the bucket as its timestamp:
+
+``avg``, ``min``, ``max`` and ``sum``
+    The mean, extrema and sum of the values of the bucket.
+
+``first`` and ``last``
+    The values of the first and last samples of the bucket.
+
+``count``
+    The number of samples of the bucket.
+
+On PostgreSQL, the samples of the 'row' layout are aggregated in SQL with the
+`time_bucket` function of TimescaleDB, with one query per storage table for
+all the channels. The other layouts, and backends, read the samples and
+aggregate them with NumPy, from the same origin as `time_bucket`, so the
+buckets start at the same times.
+
+The integer storages are aggregated on their raw counts, see
+`Channel.storage`.
+
+Functions
+---------
+
+.. rubric:: parse_width
+
+Parses a bucket width, such as ``'500ms'``, ``'1s'`` or ``'5min'``.
+
+.. rubric:: format_width
+
+Returns the canonical spelling of a bucket width.
+
+.. rubric:: parse_aggregates
+
+Parses a comma separated list of aggregates.
+
+.. rubric:: bucket_columns
+
+Aggregates the samples of several channels of the 'row' layout in SQL.
+
+.. rubric:: bucket_samples
+
+Aggregates the samples of a channel with NumPy.
+
+Classes
+-------
+
+.. rubric:: TimeBucket
+
+The `time_bucket` of the timestamp of each sample.
+
+.. rubric:: First
+
+The value of the first sample of each group, with the `first` aggregate
+of TimescaleDB.
+
+.. rubric:: Last
+
+The value of the last sample of each group, with the `last` aggregate of
+TimescaleDB.
+
+"""
+
+import re
+from datetime import timedelta
+from typing import Iterable, Optional
+
+import numpy as np
+from django.db.models import (
+    Aggregate,
+    Avg,
+    BigIntegerField,
+    Count,
+    DateTimeField,
+    DurationField,
+    F,
+    FloatField,
+    Func,
+    Max,
+    Min,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Cast
+
+from .cache import ChannelMetadata
+from .converters import time_filter
+from .fetch import fetch_columns, storage_channels
+from .models import timeserie_model
+
+# The aggregates of a bucket, in the order they are returned.
+AGGREGATES = ('avg', 'min', 'max', 'first', 'last', 'sum', 'count')
+
+# The default origin of `time_bucket`, a Monday, for the buckets of naive
+# timestamps.
+ORIGIN = np.datetime64('2000-01-03', 'us')
+
+# Scale of the bucket width units to microseconds.
+WIDTH_UNITS = {
+    'us': 1,
+    'ms': 10**3,
+    's': 10**6,
+    'min': 60 * 10**6,
+    'h': 3600 * 10**6,
+    'd': 86400 * 10**6,
+}
+
+WIDTH = re.compile(r'^\s*(\d+(?:\.\d*)?|\.\d+)\s*([a-z]*)\s*$')
+
+
+# ----------------------------------------------------------------------
+def parse_width(text: str) -> np.timedelta64:
+    """
+    Parse a bucket width.
+
+    Parameters
+    ----------
+    text : str
+        A number followed by one of the units 'us', 'ms', 's', 'min', 'h'
+        or 'd', seconds without a unit.
+
+    Returns
+    -------
+    np.timedelta64
+        The width, in microseconds.
+
+    Raises
+    ------
+    ValueError
+        If the width can not be parsed, or is shorter than a microsecond.
+    """
+    match = WIDTH.match(text)
+    if not match or match.group(2) not in ('', *WIDTH_UNITS):
+        raise ValueError(
+            f"Invalid bucket width: '{text}', use a number and one of the "
+            f"units {', '.join(WIDTH_UNITS)}."
+        )
+    width = round(float(match.group(1)) * WIDTH_UNITS[match.group(2) or 's'])
+    if width < 1:
+        raise ValueError("The bucket width must be at least 1us.")
+    return np.timedelta64(width, 'us')
+
+
+# ----------------------------------------------------------------------
+def format_width(width: np.timedelta64) -> str:
+    """
+    Return the canonical spelling of a bucket width.
+
+    The width is written as an integer of the largest unit that divides it,
+    so the spellings parsed to the same width, like '1 s', '1.0s' and
+    '1000ms', share the same text.
+
+    Examples
+    --------
+    >>> format_width(parse_width('1.0 s')), format_width(parse_width('90s'))
+    ('1s', '90s')
+    """
+    width = int(width / np.timedelta64(1, 'us'))
+    scale, unit = max(
+        (scale, unit) for unit, scale in WIDTH_UNITS.items() if width % scale == 0
+    )
+    return f'{width // scale}{unit}'
+
+
+# ----------------------------------------------------------------------
+def parse_aggregates(text: str) -> list[str]:
+    """
+    Parse a comma separated list of aggregates.
+
+    Raises
+    ------
+    ValueError
+        If an aggregate is unknown.
+    """
+    aggregates = [name.strip() for name in text.split(',') if name.strip()]
+    unknown = [name for name in aggregates if name not in AGGREGATES]
+    if unknown or not aggregates:
+        raise ValueError(
+            f"Unknown aggregates: {', '.join(unknown) or text!r}, use "
+            f"{', '.join(AGGREGATES)}."
+        )
+    return list(dict.fromkeys(aggregates))
+
+
+# ----------------------------------------------------------------------
+def bucket_columns(
+    channels: Iterable[ChannelMetadata],
+    width: np.timedelta64,
+    aggregates: list[str],
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+    chunk_ids: Optional[list[int]] = None,
+) -> dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]:
+    """
+    Aggregate the samples of several channels in time buckets, in SQL.
+
+    The samples of all the channels stored in the same table are grouped by
+    channel and `time_bucket` with a single query, so only the aggregates
+    are sent by the database. Requires TimescaleDB.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels, of a measure with the 'row' layout.
+    width : np.timedelta64
+        The width of the buckets.
+    aggregates : list[str]
+        The aggregates, from `AGGREGATES`.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the samples between these naive UTC times, included, unbounded
+        when None.
+    chunk_ids : list[int], optional
+        Only the samples of these chunks, aggregated by chunk and channel.
+
+    Returns
+    -------
+    dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]
+        The `datetime64[us]` start of the buckets and the arrays of each
+        aggregate of every channel with samples, keyed by chunk id (None
+        without `chunk_ids`) and channel id.
+    """
+    partition = ['channel_id']
+    if chunk_ids is not None:
+        partition = ['chunk_id', 'channel_id']
+
+    buckets = {}
+    for storage, channel_ids in storage_channels(channels).items():
+        queryset = timeserie_model(storage).objects.filter(
+            time_filter(*timerange), channel_id__in=channel_ids
+        )
+        if chunk_ids is not None:
+            queryset = queryset.filter(chunk_id__in=chunk_ids)
+        queryset = (
+            queryset.annotate(bucket=TimeBucket(width))
+            .values(*partition, 'bucket')
+            .annotate(
+                **{name: bucket_aggregate(name) for name in aggregates}
+            )
+            .order_by(*partition, 'bucket')
+        )
+        columns = fetch_columns(queryset, [*partition, 'bucket', *aggregates])
+
+        buckets.update(split_buckets(columns, partition, aggregates))
+    return buckets
+
+
+# ----------------------------------------------------------------------
+def split_buckets(
+    columns: dict[str, np.ndarray], partition: list[str], aggregates: list[str]
+) -> dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]:
+    """
+    Split the buckets of several channels, sorted by `partition`, by chunk
+    and channel.
+    """
+    # A new channel, or chunk, starts wherever one of the keys changes
+    keys = [columns[column] for column in partition]
+    length = len(columns['bucket'])
+    changes = np.zeros(max(length - 1, 0), dtype=bool)
+    for key in keys:
+        changes |= key[1:] != key[:-1]
+    bounds = [0, *(np.flatnonzero(changes) + 1).tolist(), length]
+
+    buckets = {}
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if first == last:
+            continue
+        chunk_id = int(keys[0][first]) if 'chunk_id' in partition else None
+        buckets[(chunk_id, int(keys[-1][first]))] = (
+            columns['bucket'][first:last],
+            {name: columns[name][first:last] for name in aggregates},
+        )
+    return buckets
+
+
+# ----------------------------------------------------------------------
+def bucket_aggregate(name: str) -> Aggregate:
+    """
+    Return the SQL aggregate of the values of a bucket.
+
+    The means and sums are cast to float, PostgreSQL returns them as
+    `numeric` or `bigint` for the integer storages.
+    """
+    return {
+        'avg': Cast(Avg('value'), FloatField()),
+        'min': Min('value'),
+        'max': Max('value'),
+        'first': First('value'),
+        'last': Last('value'),
+        'sum': Cast(Sum('value'), FloatField()),
+        'count': Count('value', output_field=BigIntegerField()),
+    }[name]
+
+
+# ----------------------------------------------------------------------
+def bucket_samples(
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    width: np.timedelta64,
+    aggregates: list[str],
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Aggregate the samples of a channel in time buckets, with NumPy.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamps of the samples.
+    values : np.ndarray
+        The values of the samples.
+    width : np.timedelta64
+        The width of the buckets.
+    aggregates : list[str]
+        The aggregates, from `AGGREGATES`.
+
+    Returns
+    -------
+    tuple[np.ndarray, dict[str, np.ndarray]]
+        The `datetime64[us]` start of the buckets with samples, and the
+        array of each aggregate.
+    """
+    times = timestamps.astype('datetime64[us]').astype(np.int64)
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], np.asarray(values)[order]
+    if not len(times):
+        return times.astype('datetime64[us]'), {
+            name: values if name in ('min', 'max', 'first', 'last')
+            else np.empty(0, dtype=np.int64 if name == 'count' else np.float64)
+            for name in aggregates
+        }
+
+    step = int(width / np.timedelta64(1, 'us'))
+    origin = int(ORIGIN.astype(np.int64))
+    keys = (times - origin) // step
+    firsts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    lasts = np.concatenate([firsts[1:], [len(keys)]]) - 1
+    counts = lasts - firsts + 1
+
+    columns = {}
+    for name in aggregates:
+        if name == 'count':
+            columns[name] = counts
+        elif name == 'first':
+            columns[name] = values[firsts]
+        elif name == 'last':
+            columns[name] = values[lasts]
+        elif name == 'min':
+            columns[name] = np.minimum.reduceat(values, firsts)
+        elif name == 'max':
+            columns[name] = np.maximum.reduceat(values, firsts)
+        else:
+            sums = np.add.reduceat(values.astype(np.float64), firsts)
+            columns[name] = sums / counts if name == 'avg' else sums
+
+    starts = (origin + keys[firsts] * step).astype('datetime64[us]')
+    return starts, columns
+
+
+########################################################################
+class TimeBucket(Func):
+    """The start of the `time_bucket` of the timestamp of each sample."""
+    function = 'time_bucket'
+    output_field = DateTimeField()
+
+    # ----------------------------------------------------------------------
+    def __init__(self, width: np.timedelta64, expression: str = 'timestamp'):
+        super().__init__(
+            Value(
+                timedelta(microseconds=int(width / np.timedelta64(1, 'us'))),
+                output_field=DurationField(),
+            ),
+            F(expression),
+        )
+
+
+########################################################################
+class First(Aggregate):
+    """The value of the first sample of each group, by timestamp."""
+    function = 'first'
+    name = 'First'
+
+    # ----------------------------------------------------------------------
+    def __init__(self, expression: str, ordering: str = 'timestamp', **extra):
+        super().__init__(expression, ordering, **extra)
+
+    # ----------------------------------------------------------------------
+    def _resolve_output_field(self):
+        return self.get_source_fields()[0]
+
+
+########################################################################
+class Last(First):
+    """The value of the last sample of each group, by timestamp."""
+    function = 'last'
+    name = 'Last'
@@ -0,0 +1,469 @@
+"""
+=====================
+Timescaledbapp Buffer
+=====================
+
+This module provides an optional in-process, write-behind ingest buffer.
+Validated requests are queued, and a background thread coalesces the
+samples of many requests into a single write and a single transaction
+(group commit), so many small POSTs cost one round-trip instead of one
+each.
+
+The buffer is flushed when it holds `MAX_ROWS` samples or when the oldest
+queued request has waited `MAX_DELAY` seconds. Past `HIGH_WATER` queued
+samples new requests are refused with `BufferFull`, which the API turns
+into a 503 response with a `Retry-After` header.
+
+Requests are merged with the other requests for the same table, database
+and conflict policy. With the ``'reject'`` policy each request learns how
+many rows it inserted; with ``'skip'`` and ``'overwrite'`` the breakdown of
+a merged flush can not be split per request, and is only reported in the
+buffer metrics.
+
+With ``'flush'`` durability a request is acknowledged once its samples are
+committed. With ``'enqueue'`` durability it is acknowledged as soon as it
+is queued, and samples still queued are lost if the process dies. Either
+way, the queue is drained when the worker process exits.
+
+Classes
+-------
+
+.. rubric:: BufferFull
+
+Raised when the buffer is past its high-water mark.
+
+.. rubric:: IngestBuffer
+
+The buffer and its flush thread, with metrics available from `info`.
+
+Functions
+---------
+
+.. rubric:: get_ingest_buffer
+
+Returns the buffer configured with `TIMESCALEDB_INGEST_BUFFER`, or None
+when it is disabled.
+
+Settings
+--------
+
+``TIMESCALEDB_INGEST_BUFFER``
+    A dictionary with ``'ENABLED'`` (default False), ``'MAX_ROWS'`` (default
+    100000), ``'MAX_DELAY'`` (default 0.1 seconds), ``'HIGH_WATER'`` (default
+    1000000 samples), ``'DURABILITY'`` (``'flush'`` or ``'enqueue'``, default
+    ``'flush'``) and ``'TIMEOUT'`` (default 30 seconds to wait for a flush).
+
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, NamedTuple, Optional, Type
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Model
+from django.db.utils import IntegrityError
+
+from .ingest import REJECT, IngestEngine, WriteResult, write_columns
+
+logger = logging.getLogger(__name__)
+
+
+########################################################################
+class Submission(NamedTuple):
+    """A request queued in the buffer."""
+    model: Type[Model]
+    columns: dict[str, np.ndarray]
+    using: str
+    on_conflict: str
+    future: Future
+    queued: float
+    samples: int
+
+
+########################################################################
+class BufferFull(Exception):
+    """
+    Raised when the buffer is past its high-water mark.
+
+    Attributes
+    ----------
+    retry_after : int
+        Seconds the client should wait before retrying.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("The ingest buffer is full.")
+        self.retry_after = retry_after
+
+
+########################################################################
+class IngestBuffer:
+    """
+    Write-behind buffer that group-commits the samples of many requests.
+
+    Parameters
+    ----------
+    max_rows : int, optional
+        Flush when this many samples are queued, by default 100000.
+    max_delay : float, optional
+        Flush when the oldest request has waited this many seconds, by default 0.1.
+    high_water : int, optional
+        Refuse new requests past this many queued samples, by default 1000000.
+    durability : str, optional
+        'flush' (acknowledge after commit) or 'enqueue' (acknowledge after queuing).
+    timeout : float, optional
+        Seconds a request waits for its flush in 'flush' mode, by default 30.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        max_rows: int = 100000,
+        max_delay: float = 0.1,
+        high_water: int = 1000000,
+        durability: str = 'flush',
+        timeout: float = 30,
+    ) -> None:
+        """Initialize the buffer, the flush thread starts on the first submit."""
+        if durability not in ('flush', 'enqueue'):
+            raise ValueError(f"Unknown durability: '{durability}'")
+
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.high_water = high_water
+        self.durability = durability
+        self.timeout = timeout
+
+        self._pending = []
+        self._pending_rows = 0
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_flushed = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_skipped = 0
+        self.requests_flushed = 0
+        self.rejected = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.max_queue_latency = 0.0
+
+    # ----------------------------------------------------------------------
+    def submit(
+        self,
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        using: str,
+        on_conflict: str = REJECT,
+    ) -> Future:
+        """
+        Queue the columns of a request.
+
+        Parameters
+        ----------
+        model : Type[Model]
+            The model whose table receives the rows.
+        columns : dict[str, np.ndarray]
+            The data to write, keyed by database column name.
+        using : str
+            The database alias.
+        on_conflict : str, optional
+            The conflict policy, 'reject' (default), 'skip' or 'overwrite'.
+
+        Returns
+        -------
+        Future
+            Resolved once the rows are committed, with the `WriteResult` of
+            the request, or None when it was merged with other requests under
+            the 'skip' or 'overwrite' policy.
+
+        Raises
+        ------
+        BufferFull
+            If the buffer is past its high-water mark.
+        """
+        # The block and wide tables hold several samples per row
+        rows = IngestEngine.total(columns, getattr(model, 'SAMPLES_COLUMN', None))
+        future = Future()
+
+        with self._condition:
+            if self._closed:
+                raise BufferFull(retry_after=1)
+            if self._pending_rows and self._pending_rows + rows > self.high_water:
+                self.rejected += 1
+                raise BufferFull(retry_after=self.retry_after())
+
+            self._pending.append(
+                Submission(
+                    model,
+                    columns,
+                    using,
+                    on_conflict,
+                    future,
+                    time.monotonic(),
+                    rows,
+                )
+            )
+            self._pending_rows += rows
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._start()
+            self._condition.notify()
+
+        return future
+
+    # ----------------------------------------------------------------------
+    def retry_after(self) -> int:
+        """Estimate the seconds needed to drain the queued samples."""
+        flushes = self._pending_rows / max(self.max_rows, 1)
+        latency = self.max_flush_latency or self.max_delay
+        return max(1, math.ceil(flushes * latency))
+
+    # ----------------------------------------------------------------------
+    def _start(self) -> None:
+        """Start the flush thread if it is not running."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='timescaledbapp-ingest-buffer', daemon=True
+            )
+            self._thread.start()
+
+    # ----------------------------------------------------------------------
+    def _run(self) -> None:
+        """Flush loop of the background thread."""
+        while True:
+            with self._condition:
+                while not self._ready():
+                    if self._closed and not self._pending:
+                        return
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(
+                            0, self._oldest + self.max_delay - time.monotonic()
+                        )
+                    self._condition.wait(timeout)
+
+                batch = self._pending
+                self._pending = []
+                self._pending_rows = 0
+                self._oldest = None
+
+            self._flush(batch)
+
+    # ----------------------------------------------------------------------
+    def _ready(self) -> bool:
+        """Check whether the queued requests must be flushed."""
+        if not self._pending:
+            return False
+        return (
+            self._closed
+            or self._pending_rows >= self.max_rows
+            or time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    # ----------------------------------------------------------------------
+    def _flush(self, batch: list[Submission]) -> None:
+        """
+        Write a batch of queued requests.
+
+        The requests for the same table, database and conflict policy are
+        merged, sorted by (channel, chunk, timestamp) and written in one
+        transaction. If that fails on a conflict, each request is written on
+        its own so a single bad request does not fail the others.
+        """
+        close_old_connections()
+        start = time.monotonic()
+
+        groups = {}
+        for item in batch:
+            key = (item.model, item.using, item.on_conflict)
+            groups.setdefault(key, []).append(item)
+
+        for (model, using, on_conflict), items in groups.items():
+            columns = {
+                name: np.concatenate([item.columns[name] for item in items])
+                for name in items[0].columns
+            }
+            if {'channel_id', 'chunk_id', 'timestamp'} <= set(columns):
+                # lexsort is stable, later requests stay after earlier ones
+                order = np.lexsort(
+                    (
+                        columns['timestamp'],
+                        columns['chunk_id'],
+                        columns['channel_id'],
+                    )
+                )
+                columns = {name: column[order] for name, column in columns.items()}
+
+            try:
+                result = write_columns(
+                    model, columns, using=using, on_conflict=on_conflict
+                )
+            except Exception as error:
+                self.failed_flushes += 1
+                if len(items) == 1 or not isinstance(error, IntegrityError):
+                    self._resolve(items, error=error)
+                else:
+                    for item in items:
+                        self._flush_one(item)
+            else:
+                self._resolve(items, result=result)
+
+        latency = time.monotonic() - start
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+        for connection in connections.all():
+            connection.close_if_unusable_or_obsolete()
+
+    # ----------------------------------------------------------------------
+    def _flush_one(self, item: Submission) -> None:
+        """Write a single queued request."""
+        try:
+            result = write_columns(
+                item.model,
+                item.columns,
+                using=item.using,
+                on_conflict=item.on_conflict,
+            )
+        except Exception as error:
+            self._resolve([item], error=error)
+        else:
+            self._resolve([item], result=result)
+
+    # ----------------------------------------------------------------------
+    def _resolve(
+        self,
+        items: list[Submission],
+        result: Optional[WriteResult] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Complete the futures of the written requests."""
+        now = time.monotonic()
+        if result is not None:
+            self.rows_inserted += result.inserted
+            self.rows_updated += result.updated
+            self.rows_skipped += result.skipped
+
+        for item in items:
+            rows = item.samples
+            self.max_queue_latency = max(
+                self.max_queue_latency, now - item.queued
+            )
+            if error is not None:
+                if self.durability == 'enqueue':
+                    logger.error(
+                        "Ingest buffer dropped %d samples: %s", rows, error
+                    )
+                item.future.set_exception(error)
+                continue
+
+            self.rows_flushed += rows
+            self.requests_flushed += 1
+            if len(items) == 1:
+                item.future.set_result(result)
+            elif item.on_conflict == REJECT:
+                item.future.set_result(WriteResult(rows, 0, 0, {}))
+            else:
+                item.future.set_result(None)
+
+    # ----------------------------------------------------------------------
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop accepting requests and flush the queued ones.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for the queue to drain, by default `self.timeout`.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(self.timeout if timeout is None else timeout)
+
+    # ----------------------------------------------------------------------
+    def info(self) -> dict[str, Any]:
+        """
+        Return the buffer metrics.
+
+        Returns
+        -------
+        dict[str, Any]
+            Queue size, flush counts and flush latencies in milliseconds.
+        """
+        with self._condition:
+            pending_rows = self._pending_rows
+            pending_requests = len(self._pending)
+
+        return {
+            'durability': self.durability,
+            'pending_rows': pending_rows,
+            'pending_requests': pending_requests,
+            'high_water': self.high_water,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'rows_flushed': self.rows_flushed,
+            'rows_inserted': self.rows_inserted,
+            'rows_updated': self.rows_updated,
+            'rows_skipped': self.rows_skipped,
+            'requests_flushed': self.requests_flushed,
+            'rejected': self.rejected,
+            'last_flush_latency_ms': self.last_flush_latency * 1000,
+            'avg_flush_latency_ms': (
+                self.total_flush_latency / self.flushes * 1000
+                if self.flushes
+                else 0.0
+            ),
+            'max_flush_latency_ms': self.max_flush_latency * 1000,
+            'max_queue_latency_ms': self.max_queue_latency * 1000,
+        }
+
+
+_ingest_buffer = None
+_ingest_buffer_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+def get_ingest_buffer() -> Optional[IngestBuffer]:
+    """
+    Return the process ingest buffer.
+
+    Returns
+    -------
+    IngestBuffer or None
+        The buffer configured with `TIMESCALEDB_INGEST_BUFFER`, or None when
+        it is not enabled.
+    """
+    global _ingest_buffer
+
+    config = getattr(settings, 'TIMESCALEDB_INGEST_BUFFER', {})
+    if not config.get('ENABLED', False):
+        return None
+
+    with _ingest_buffer_lock:
+        if _ingest_buffer is None:
+            _ingest_buffer = IngestBuffer(
+                max_rows=config.get('MAX_ROWS', 100000),
+                max_delay=config.get('MAX_DELAY', 0.1),
+                high_water=config.get('HIGH_WATER', 1000000),
+                durability=config.get('DURABILITY', 'flush'),
+                timeout=config.get('TIMEOUT', 30),
+            )
+            atexit.register(_ingest_buffer.close)
+    return _ingest_buffer
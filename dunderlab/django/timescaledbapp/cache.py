@@ -0,0 +1,350 @@
+"""
+====================
+Timescaledbapp Cache
+====================
+
+This module provides a process-local cache for the metadata needed to
+resolve a (source, measure) pair: the measure id, the channel label to
+(id, scale_factor, storage) map and the id of the default chunk. Ingest and read
+paths use it to skip the lookup queries for every request.
+
+The cache has a bounded size (least recently used entries are evicted) and
+a time to live. Entries are invalidated from the `post_save` and
+`post_delete` signals of `Source`, `Measure`, `Channel` and `Chunk` (see
+:mod:`.signals`); in deployments with several processes the time to live
+bounds how long another process can see stale metadata.
+
+Classes
+-------
+
+.. rubric:: ChannelMetadata
+
+The cached fields of a channel.
+
+.. rubric:: MeasureMetadata
+
+The cached fields of a measure, with its channels, default chunk and
+conflict policy.
+
+.. rubric:: MetadataCache
+
+The cache itself, with hit/miss counters available from `info`. Several
+measures can be resolved at once with `get_many`, which loads all the misses
+with one query per table.
+
+Settings
+--------
+
+``TIMESCALEDB_METADATA_CACHE``
+    A dictionary with ``'MAX_SIZE'`` (default 1024 measures) and ``'TTL'``
+    (default 60 seconds, 0 disables the cache).
+
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Channel, Chunk, Measure
+
+DEFAULT_CHUNK = 'default'
+
+
+########################################################################
+class ChannelMetadata(NamedTuple):
+    """The cached fields of a channel."""
+    id: int
+    scale_factor: float
+    storage: str = 'float64'
+    sampling_rate: Optional[float] = None
+    index: Optional[int] = None
+
+
+########################################################################
+class MeasureMetadata(NamedTuple):
+    """The cached fields of a measure."""
+    id: int
+    source: str
+    label: str
+    channels: dict[str, ChannelMetadata]
+    default_chunk_id: Optional[int] = None
+    conflict_policy: Optional[str] = None
+    layout: str = 'row'
+
+
+########################################################################
+class MetadataCache:
+    """
+    A bounded, time limited cache of measure metadata keyed by (source, measure).
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The maximum number of measures kept, by default 1024.
+    ttl : float, optional
+        Seconds an entry is valid, by default 60. With 0 nothing is cached.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, max_size: int = 1024, ttl: float = 60) -> None:
+        """Initialize an empty cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ----------------------------------------------------------------------
+    def get(self, source: str, measure: str) -> MeasureMetadata:
+        """
+        Return the metadata of a measure, loading it on a miss.
+
+        Parameters
+        ----------
+        source : str
+            The label of the source.
+        measure : str
+            The label of the measure.
+
+        Returns
+        -------
+        MeasureMetadata
+            The metadata of the measure.
+
+        Raises
+        ------
+        Measure.DoesNotExist
+            If the measure does not exist.
+        """
+        key = (source, measure)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        metadata = self.load(source, measure)
+        self.store(metadata, generation)
+        return metadata
+
+    # ----------------------------------------------------------------------
+    def get_default_chunk_id(self, source: str, measure: str) -> int:
+        """
+        Return the id of the default chunk of a measure, creating it if needed.
+
+        Parameters
+        ----------
+        source : str
+            The label of the source.
+        measure : str
+            The label of the measure.
+
+        Returns
+        -------
+        int
+            The id of the chunk labelled 'default'.
+        """
+        metadata = self.get(source, measure)
+        if metadata.default_chunk_id is None:
+            with self._lock:
+                generation = self._generation
+            chunk, _ = Chunk.objects.get_or_create(
+                measure_id=metadata.id, label=DEFAULT_CHUNK
+            )
+            metadata = metadata._replace(default_chunk_id=chunk.pk)
+            self.store(metadata, generation)
+        return metadata.default_chunk_id
+
+    # ----------------------------------------------------------------------
+    def get_many(
+        self, keys: Iterable[tuple[str, str]]
+    ) -> dict[tuple[str, str], MeasureMetadata]:
+        """
+        Return the metadata of several measures, loading the misses at once.
+
+        Parameters
+        ----------
+        keys : Iterable[tuple[str, str]]
+            The (source, measure) labels.
+
+        Returns
+        -------
+        dict[tuple[str, str], MeasureMetadata]
+            The metadata keyed by (source, measure). Measures that do not
+            exist are left out.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found[key] = entry[1]
+                else:
+                    self.misses += 1
+                    missing.append(key)
+            generation = self._generation
+
+        if missing:
+            for metadata in self.load_many(missing):
+                self.store(metadata, generation)
+                found[(metadata.source, metadata.label)] = metadata
+        return found
+
+    # ----------------------------------------------------------------------
+    def load(self, source: str, measure: str) -> MeasureMetadata:
+        """Load the metadata of a measure from the database."""
+        metadata = self.load_many([(source, measure)])
+        if not metadata:
+            raise Measure.DoesNotExist(
+                f"Measure '{measure}' of source '{source}' does not exist."
+            )
+        return metadata[0]
+
+    # ----------------------------------------------------------------------
+    def load_many(
+        self, keys: Iterable[tuple[str, str]]
+    ) -> list[MeasureMetadata]:
+        """
+        Load the metadata of several measures from the database.
+
+        The measures, their channels and their default chunks are read with
+        one query each, whatever the number of measures.
+        """
+        condition = Q()
+        for source, measure in keys:
+            condition |= Q(source_id=source, label=measure)
+        if not condition:
+            return []
+        measures = list(
+            Measure.objects.filter(condition).values_list(
+                'id', 'source_id', 'label', 'conflict_policy', 'layout'
+            )
+        )
+        measure_ids = [measure_id for measure_id, *_ in measures]
+
+        channels = {measure_id: {} for measure_id in measure_ids}
+        for measure_id, label, *fields in Channel.objects.filter(
+            measure_id__in=measure_ids
+        ).values_list(
+            'measure_id',
+            'label',
+            'id',
+            'scale_factor',
+            'storage',
+            'sampling_rate',
+            'index',
+        ):
+            channels[measure_id][label] = ChannelMetadata(*fields)
+
+        default_chunks = dict(
+            Chunk.objects.filter(
+                measure_id__in=measure_ids, label=DEFAULT_CHUNK
+            )
+            .order_by('-id')
+            .values_list('measure_id', 'id')
+        )
+
+        return [
+            MeasureMetadata(
+                id=measure_id,
+                source=source,
+                label=label,
+                channels=channels[measure_id],
+                default_chunk_id=default_chunks.get(measure_id),
+                conflict_policy=conflict_policy,
+                layout=layout,
+            )
+            for measure_id, source, label, conflict_policy, layout in measures
+        ]
+
+    # ----------------------------------------------------------------------
+    def store(
+        self, metadata: MeasureMetadata, generation: Optional[int] = None
+    ) -> None:
+        """
+        Store an entry, evicting the least recently used ones.
+
+        When `generation` is given, the entry is discarded if an invalidation
+        happened since it was loaded.
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            key = (metadata.source, metadata.label)
+            self._entries[key] = (time.monotonic() + self.ttl, metadata)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # ----------------------------------------------------------------------
+    def invalidate(
+        self,
+        source: Optional[str] = None,
+        measure_id: Optional[int] = None,
+    ) -> None:
+        """
+        Drop the entries of a source or of a measure.
+
+        Parameters
+        ----------
+        source : str, optional
+            Drop all the measures of this source.
+        measure_id : int, optional
+            Drop the measure with this id.
+        """
+        with self._lock:
+            self._generation += 1
+            for key, (_, metadata) in list(self._entries.items()):
+                if metadata.source == source or metadata.id == measure_id:
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    # ----------------------------------------------------------------------
+    def clear(self) -> None:
+        """Drop all the entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.invalidations = 0
+
+    # ----------------------------------------------------------------------
+    def info(self) -> dict[str, Any]:
+        """
+        Return the cache counters.
+
+        Returns
+        -------
+        dict[str, Any]
+            Hits, misses, invalidations, current size and configuration.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+            }
+
+
+_config = getattr(settings, 'TIMESCALEDB_METADATA_CACHE', {})
+metadata_cache = MetadataCache(
+    max_size=_config.get('MAX_SIZE', 1024),
+    ttl=_config.get('TTL', 60),
+)
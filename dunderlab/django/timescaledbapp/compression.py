@@ -0,0 +1,322 @@
+"""
+==========================
+Timescaledbapp Compression
+==========================
+
+This module provides the compression of the timeserie traffic. Request
+bodies sent with a ``Content-Encoding`` of ``gzip``, ``deflate`` or ``zstd``
+are decompressed while they are parsed, and responses are compressed with
+the best encoding accepted by the client, block by block, while they are
+sent.
+
+The ``zstd`` encoding needs the optional `zstandard` package, without it
+only ``gzip`` and ``deflate`` are available.
+
+Classes
+-------
+
+.. rubric:: PayloadTooLarge
+
+Raised when a request body decompresses to more than the configured limit.
+
+.. rubric:: DecompressingStream
+
+A file-like object that decompresses a request body as it is read.
+
+Functions
+---------
+
+.. rubric:: decompress_request
+
+Wraps the body of a request with a `DecompressingStream` according to its
+``Content-Encoding``.
+
+.. rubric:: negotiate_encoding
+
+Chooses a response encoding from an ``Accept-Encoding`` header.
+
+.. rubric:: compress_response
+
+Turns a rendered response into a streaming compressed response.
+
+Settings
+--------
+
+``TIMESCALEDB_COMPRESSION``
+    A dictionary with ``'MIN_SIZE'`` (responses smaller than this number of
+    bytes are not compressed, default 1024), ``'GZIP_LEVEL'`` (default 6),
+    ``'ZSTD_LEVEL'`` (default 3) and ``'MAX_DECOMPRESSED_SIZE'`` (default
+    1 GiB).
+
+"""
+
+import re
+import zlib
+from typing import Any, Iterator, Optional
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponseBase, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    ParseError,
+    UnsupportedMediaType,
+)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+BLOCK_SIZE = 2**16
+
+# zlib window bits for each HTTP content coding
+ZLIB_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+# Response encodings, by order of preference
+RESPONSE_ENCODINGS = ('zstd', 'gzip') if zstandard else ('gzip',)
+
+QVALUE = re.compile(r';\s*q=([0-9.]+)')
+
+
+########################################################################
+class PayloadTooLarge(APIException):
+    """Raised when a request body decompresses to more than the limit."""
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The decompressed request body is too large."
+    default_code = 'payload_too_large'
+
+
+# ----------------------------------------------------------------------
+def compression_config() -> dict[str, Any]:
+    """Return the `TIMESCALEDB_COMPRESSION` setting with its defaults."""
+    return {
+        'MIN_SIZE': 1024,
+        'GZIP_LEVEL': 6,
+        'ZSTD_LEVEL': 3,
+        'MAX_DECOMPRESSED_SIZE': 2**30,
+        **getattr(settings, 'TIMESCALEDB_COMPRESSION', {}),
+    }
+
+
+########################################################################
+class DecompressingStream:
+    """
+    File-like object that decompresses a stream as it is read.
+
+    Parameters
+    ----------
+    stream : Any
+        The compressed stream, with a `read` method.
+    encoding : str
+        The content coding, 'gzip', 'deflate' or 'zstd'.
+    max_size : int, optional
+        The maximum number of decompressed bytes.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, stream: Any, encoding: str, max_size: Optional[int] = None
+    ) -> None:
+        """Initialize the decompressor for the encoding."""
+        self.stream = stream
+        self.max_size = max_size
+        self.buffer = bytearray()
+        self.size = 0
+        self.finished = False
+
+        if encoding == 'zstd':
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+            self.errors = (zstandard.ZstdError,)
+        else:
+            self.decompressor = zlib.decompressobj(ZLIB_WBITS[encoding])
+            self.errors = (zlib.error,)
+
+    # ----------------------------------------------------------------------
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to `size` decompressed bytes, all of them if negative.
+
+        Raises
+        ------
+        ParseError
+            If the body is not valid for its encoding.
+        PayloadTooLarge
+            If the body decompresses to more than `max_size` bytes.
+        """
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            data = self.stream.read(BLOCK_SIZE)
+            try:
+                if data:
+                    chunk = self.decompressor.decompress(data)
+                else:
+                    chunk = self.decompressor.flush()
+                    self.finished = True
+            except self.errors as error:
+                raise ParseError(f"Invalid compressed body - {error}")
+
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                raise PayloadTooLarge()
+            self.buffer += chunk
+
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+# ----------------------------------------------------------------------
+def decompress_request(request: HttpRequest) -> None:
+    """
+    Decompress the body of a request while it is read.
+
+    Parameters
+    ----------
+    request : HttpRequest
+        The Django request, before its body is read.
+
+    Raises
+    ------
+    UnsupportedMediaType
+        If the ``Content-Encoding`` is not supported.
+    """
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+    if encoding in ('', 'identity'):
+        return
+    if encoding not in ZLIB_WBITS and not (encoding == 'zstd' and zstandard):
+        raise UnsupportedMediaType(
+            encoding, detail=f"Unsupported Content-Encoding '{encoding}'."
+        )
+    request._stream = DecompressingStream(
+        request._stream,
+        encoding,
+        max_size=compression_config()['MAX_DECOMPRESSED_SIZE'],
+    )
+
+
+# ----------------------------------------------------------------------
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Choose the response encoding from an ``Accept-Encoding`` header.
+
+    Parameters
+    ----------
+    accept_encoding : str
+        The header, e.g. 'gzip, deflate, zstd;q=0.9'.
+
+    Returns
+    -------
+    str or None
+        The accepted encoding with the highest quality, preferring 'zstd'
+        over 'gzip' on a tie, or None.
+
+    Examples
+    --------
+    >>> negotiate_encoding('gzip;q=0.5, identity')
+    'gzip'
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(','):
+        coding = item.split(';')[0].strip()
+        match = QVALUE.search(item)
+        try:
+            qualities[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+
+    candidates = [
+        (qualities.get(coding, qualities.get('*', 0)), -rank, coding)
+        for rank, coding in enumerate(RESPONSE_ENCODINGS)
+    ]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+# ----------------------------------------------------------------------
+def compress_chunks(content: bytes, encoding: str) -> Iterator[bytes]:
+    """
+    Compress a body block by block.
+
+    Parameters
+    ----------
+    content : bytes
+        The rendered body.
+    encoding : str
+        Either 'gzip' or 'zstd'.
+
+    Yields
+    ------
+    bytes
+        The compressed blocks.
+    """
+    config = compression_config()
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(
+            level=config['ZSTD_LEVEL']
+        ).compressobj()
+    else:
+        compressor = zlib.compressobj(
+            config['GZIP_LEVEL'], zlib.DEFLATED, ZLIB_WBITS['gzip']
+        )
+
+    view = memoryview(content)
+    for start in range(0, len(view), BLOCK_SIZE):
+        if chunk := compressor.compress(view[start : start + BLOCK_SIZE]):
+            yield chunk
+    yield compressor.flush()
+
+
+# ----------------------------------------------------------------------
+def compress_response(
+    request: HttpRequest, response: HttpResponseBase
+) -> HttpResponseBase:
+    """
+    Compress a response with the encoding accepted by the client.
+
+    Parameters
+    ----------
+    request : HttpRequest
+        The request, with its ``Accept-Encoding`` header.
+    response : HttpResponseBase
+        The response. DRF responses are rendered first.
+
+    Returns
+    -------
+    HttpResponseBase
+        A streaming compressed response, or the same response if it is
+        small, already encoded, streaming or not successful.
+    """
+    if (
+        response.streaming
+        or response.has_header('Content-Encoding')
+        or response.status_code != status.HTTP_200_OK
+    ):
+        return response
+
+    encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+
+    if hasattr(response, 'render'):
+        response.render()
+    if len(response.content) < compression_config()['MIN_SIZE']:
+        return response
+
+    compressed = StreamingHttpResponse(
+        compress_chunks(response.content, encoding),
+        status=response.status_code,
+    )
+    for header, value in response.items():
+        if header.lower() != 'content-length':
+            compressed[header] = value
+    compressed['Content-Encoding'] = encoding
+    patch_vary_headers(compressed, ('Accept-Encoding',))
+    return compressed
@@ -0,0 +1,334 @@
+"""
+=========================
+Timescaledbapp Converters
+=========================
+
+This module provides the columnar conversion stage of the ingest pipeline.
+Whole arrays of incoming data are converted at once with NumPy, instead of
+building one Python object per sample.
+
+Functions
+---------
+
+.. rubric:: to_datetime64
+
+Converts an array of timestamps, given as epoch numbers or ISO 8601
+strings, into a single `datetime64[us]` array of naive UTC times, which is
+what the `timestamp` column of the hypertable stores.
+
+.. rubric:: uniform_timestamps
+
+Builds the timestamps of a uniformly sampled segment from its start and
+sampling rate.
+
+.. rubric:: to_datetimes
+
+Converts a `datetime64` array back into the `datetime` objects returned by
+the ORM.
+
+.. rubric:: from_datetimes
+
+Converts the `datetime` objects returned by the ORM into a `datetime64`
+array.
+
+.. rubric:: time_filter
+
+Returns the filter of the samples within a time range, with the bounds
+passed as constants.
+
+Classes
+-------
+
+.. rubric:: UTCTimestamp
+
+A naive UTC timestamp constant, compared with the `timestamp` columns
+without a time zone conversion.
+
+"""
+
+import re
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DateTimeField, Q, Value
+from django.utils import timezone
+
+# Scale of the epoch units to microseconds.
+EPOCH_UNITS = {
+    's': 10**6,
+    'ms': 10**3,
+    'us': 1,
+}
+
+# An ISO 8601 string with a time and a UTC offset.
+ISO_OFFSET = re.compile(r'[T ].*(Z|[+-]\d{2}(:?\d{2})?)$')
+
+
+# ----------------------------------------------------------------------
+def to_datetime64(data: Any, unit: Optional[str] = None) -> np.ndarray:
+    """
+    Convert a batch of timestamps into a `datetime64[us]` array.
+
+    The unit is detected once for the whole batch: floating point epochs
+    are seconds, integer epochs are milliseconds and strings are parsed as
+    ISO 8601. Strings with a UTC offset are converted to UTC, naive strings
+    are interpreted in the current Django time zone.
+
+    Parameters
+    ----------
+    data : Any
+        A list or array of timestamps.
+    unit : str, optional
+        Force the epoch unit, one of 's', 'ms' or 'us'.
+
+    Returns
+    -------
+    np.ndarray
+        The timestamps as naive UTC `datetime64[us]` values.
+
+    Raises
+    ------
+    ValueError
+        If the timestamps can not be converted.
+    """
+    array = np.asarray(data)
+
+    if array.ndim != 1:
+        raise ValueError("Timestamps must be a one-dimensional array.")
+
+    if not array.size:
+        return array.astype('datetime64[us]')
+
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype('datetime64[us]')
+
+    if array.dtype.kind in 'iuf':
+        if unit is None:
+            unit = 's' if array.dtype.kind == 'f' else 'ms'
+        if unit not in EPOCH_UNITS:
+            raise ValueError(f"Unknown timestamp unit: '{unit}'")
+        if not np.isfinite(array).all():
+            raise ValueError("Timestamps must be finite numbers.")
+        return (
+            np.round(array * EPOCH_UNITS[unit]).astype(np.int64)
+        ).astype('datetime64[us]')
+
+    if array.dtype.kind in 'UO':
+        return iso_to_datetime64(array)
+
+    raise ValueError("Timestamps must be epoch numbers or ISO strings.")
+
+
+# ----------------------------------------------------------------------
+def iso_to_datetime64(array: np.ndarray) -> np.ndarray:
+    """
+    Parse an array of ISO 8601 strings into a `datetime64[us]` array.
+
+    The strings with a UTC offset are converted to UTC with their own
+    offset, the naive ones are interpreted in the current Django time zone,
+    so a batch can mix both.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The ISO strings.
+
+    Returns
+    -------
+    np.ndarray
+        The timestamps as naive UTC `datetime64[us]` values.
+    """
+    try:
+        with warnings.catch_warnings():
+            # NumPy converts the offsets to UTC, but warns about it.
+            warnings.simplefilter('ignore', UserWarning)
+            times = array.astype(str).astype('datetime64[us]')
+    except ValueError as error:
+        raise ValueError(str(error)) from None
+
+    if np.isnat(times).any():
+        raise ValueError("Timestamps can not be NaT.")
+
+    aware = np.fromiter(
+        (ISO_OFFSET.search(text.strip()) is not None for text in array.astype(str)),
+        dtype=bool,
+        count=len(array),
+    )
+    if aware.all():
+        return times
+    if not aware.any():
+        return localtime_to_utc(times)
+
+    times[~aware] = localtime_to_utc(times[~aware])
+    return times
+
+
+# ----------------------------------------------------------------------
+def localtime_to_utc(times: np.ndarray) -> np.ndarray:
+    """
+    Shift naive times in the current time zone to naive UTC.
+
+    The UTC offset is computed at both ends of the batch. When it is the
+    same, the whole array is shifted at once, otherwise (daylight saving
+    transitions inside the batch) each time gets its own offset.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The naive local times.
+
+    Returns
+    -------
+    np.ndarray
+        The naive UTC times.
+    """
+    tz = timezone.get_current_timezone()
+    first, last = times[[0, -1]].astype(datetime)
+    offset = tz.utcoffset(first)
+
+    if offset == tz.utcoffset(last):
+        if not offset:
+            return times
+        return times - np.timedelta64(offset // timedelta(microseconds=1), 'us')
+
+    offsets = [
+        tz.utcoffset(t) // timedelta(microseconds=1)
+        for t in times.astype(datetime)
+    ]
+    return times - np.array(offsets, dtype='timedelta64[us]')
+
+
+# ----------------------------------------------------------------------
+def uniform_timestamps(
+    t0: np.datetime64, sampling_rate: float, n: int, start: int = 0
+) -> np.ndarray:
+    """
+    Build the timestamps of a uniformly sampled segment.
+
+    Parameters
+    ----------
+    t0 : np.datetime64
+        The timestamp of the first sample of the segment.
+    sampling_rate : float
+        The sampling rate, in Hz.
+    n : int
+        The number of samples.
+    start : int, optional
+        The index of the first sample returned.
+
+    Returns
+    -------
+    np.ndarray
+        The `datetime64[us]` timestamps of the samples `start` to
+        `start + n`, rounded to the microsecond.
+    """
+    offsets = np.rint(np.arange(start, start + n) * (1e6 / sampling_rate))
+    return np.datetime64(t0, 'us') + offsets.astype('timedelta64[us]')
+
+
+# ----------------------------------------------------------------------
+def to_datetimes(times: np.ndarray) -> list[datetime]:
+    """
+    Convert naive UTC `datetime64` values into `datetime` objects.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The timestamps as naive UTC `datetime64` values.
+
+    Returns
+    -------
+    list[datetime]
+        The timestamps, aware in UTC when `USE_TZ` is enabled, like the
+        ones returned by the ORM.
+    """
+    objects = times.astype('datetime64[us]').tolist()
+    if settings.USE_TZ:
+        return [t.replace(tzinfo=dt_timezone.utc) for t in objects]
+    return objects
+
+
+# ----------------------------------------------------------------------
+def from_datetimes(objects: list[datetime]) -> np.ndarray:
+    """
+    Convert `datetime` objects, as returned by the ORM, into `datetime64`.
+
+    Parameters
+    ----------
+    objects : list[datetime]
+        The timestamps, aware or naive UTC.
+
+    Returns
+    -------
+    np.ndarray
+        The timestamps as naive UTC `datetime64[us]` values.
+    """
+    return np.array(
+        [
+            t.astimezone(dt_timezone.utc).replace(tzinfo=None)
+            if t.tzinfo
+            else t
+            for t in objects
+        ],
+        dtype='datetime64[us]',
+    )
+
+
+# ----------------------------------------------------------------------
+def time_filter(
+    start: Optional[np.datetime64] = None,
+    end: Optional[np.datetime64] = None,
+    field: str = 'timestamp',
+) -> Q:
+    """
+    Return the filter of the samples within a time range.
+
+    The bounds are passed as constants, so TimescaleDB excludes the chunks
+    of the hypertable out of the range when the query is planned.
+
+    Parameters
+    ----------
+    start : np.datetime64, optional
+        The first naive UTC time included, unbounded when not given.
+    end : np.datetime64, optional
+        The last naive UTC time included, unbounded when not given.
+    field : str, optional
+        The timestamp field, by default 'timestamp'.
+
+    Returns
+    -------
+    Q
+        The filter, empty without bounds.
+    """
+    bounds = Q()
+    if start is not None:
+        bounds &= Q(**{f'{field}__gte': UTCTimestamp(start)})
+    if end is not None:
+        bounds &= Q(**{f'{field}__lte': UTCTimestamp(end)})
+    return bounds
+
+
+########################################################################
+class UTCTimestamp(Value):
+    """
+    A naive UTC timestamp constant.
+
+    The aware `datetime` values of the ORM are sent as `timestamptz`, so the
+    `timestamp` columns compared with them are cast, and the chunks of the
+    hypertable can not be excluded when the query is planned. This constant
+    is sent as a plain `timestamp` instead.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, value: np.datetime64) -> None:
+        super().__init__(
+            np.datetime64(value, 'us').astype(datetime),
+            output_field=DateTimeField(),
+        )
+
+    # ----------------------------------------------------------------------
+    def as_sql(self, compiler, connection):
+        return '%s', [connection.ops.adapt_datetimefield_value(self.value)]
@@ -0,0 +1,181 @@
+"""
+=======================
+Timescaledbapp Counters
+=======================
+
+This module keeps the number of samples stored for each channel without
+a read-modify-write of the `Channel` rows during ingest.
+
+Every ingest appends one `ChannelCountDelta` row per channel, in a single
+INSERT and in the same transaction as the samples, so concurrent writers
+never wait for each other on the `Channel` rows. The deltas are folded into
+`Channel.count` by `compact_counts`, which is run in the background with the
+``compact_counts`` management command. Reads add the pending deltas to the
+compacted count, so they are always exact.
+
+Functions
+---------
+
+.. rubric:: add_counts
+
+Appends the count increments of a batch of channels.
+
+.. rubric:: get_counts
+
+Returns the exact count of a list of channels with one query.
+
+.. rubric:: get_count
+
+Returns the exact count of a single channel.
+
+.. rubric:: compact_counts
+
+Folds the pending deltas into `Channel.count`.
+
+"""
+
+from typing import Iterable, Optional
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Max, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Channel, ChannelCountDelta
+
+
+# ----------------------------------------------------------------------
+def add_counts(
+    increments: dict[int, int], using: Optional[str] = None
+) -> None:
+    """
+    Append the count increments of a batch of channels.
+
+    Parameters
+    ----------
+    increments : dict[int, int]
+        The number of new samples, keyed by channel id.
+    using : str, optional
+        The database alias, by default the one given by the router.
+    """
+    using = using or router.db_for_write(ChannelCountDelta)
+    ChannelCountDelta.objects.using(using).bulk_create(
+        [
+            ChannelCountDelta(channel_id=channel_id, delta=delta)
+            for channel_id, delta in increments.items()
+            if delta
+        ]
+    )
+
+
+# ----------------------------------------------------------------------
+def get_counts(
+    channel_ids: Iterable[int], using: Optional[str] = None
+) -> dict[int, int]:
+    """
+    Return the exact count of a list of channels.
+
+    Parameters
+    ----------
+    channel_ids : Iterable[int]
+        The ids of the channels.
+    using : str, optional
+        The database alias, by default the one given by the router.
+
+    Returns
+    -------
+    dict[int, int]
+        The compacted count plus the pending deltas, keyed by channel id.
+    """
+    using = using or router.db_for_read(Channel)
+    channels = (
+        Channel.objects.using(using)
+        .filter(id__in=list(channel_ids))
+        .annotate(pending=Coalesce(Sum('count_deltas__delta'), Value(0)))
+        .values_list('id', F('count') + F('pending'))
+    )
+    return dict(channels)
+
+
+# ----------------------------------------------------------------------
+def get_count(channel_id: int, using: Optional[str] = None) -> int:
+    """
+    Return the exact count of a single channel.
+
+    Parameters
+    ----------
+    channel_id : int
+        The id of the channel.
+    using : str, optional
+        The database alias, by default the one given by the router.
+
+    Returns
+    -------
+    int
+        The compacted count plus the pending deltas.
+    """
+    return get_counts([channel_id], using=using).get(channel_id, 0)
+
+
+# ----------------------------------------------------------------------
+def compact_counts(using: Optional[str] = None) -> int:
+    """
+    Fold the pending deltas into `Channel.count`.
+
+    On PostgreSQL the deltas are deleted and applied with a single
+    statement, so deltas committed while it runs are kept for the next
+    compaction. Other backends do the same inside a transaction.
+
+    Parameters
+    ----------
+    using : str, optional
+        The database alias, by default the one given by the router.
+
+    Returns
+    -------
+    int
+        The number of channels updated.
+    """
+    using = using or router.db_for_write(ChannelCountDelta)
+    connection = connections[using]
+
+    if connection.vendor == 'postgresql':
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {quote(ChannelCountDelta._meta.db_table)}
+                    RETURNING channel_id, delta
+                ), totals AS (
+                    SELECT channel_id, SUM(delta) AS delta
+                    FROM moved GROUP BY channel_id
+                )
+                UPDATE {quote(Channel._meta.db_table)} AS channel
+                SET count = channel.count + totals.delta
+                FROM totals
+                WHERE channel.id = totals.channel_id;
+                """
+            )
+            return cursor.rowcount
+
+    with transaction.atomic(using=using):
+        deltas = ChannelCountDelta.objects.using(using)
+        last = deltas.aggregate(last=Max('id'))['last']
+        if last is None:
+            return 0
+
+        deltas = deltas.filter(id__lte=last)
+        totals = dict(
+            deltas.values('channel_id')
+            .annotate(total=Sum('delta'))
+            .values_list('channel_id', 'total')
+        )
+        Channel.objects.using(using).filter(id__in=totals).update(
+            count=F('count')
+            + Case(
+                *[When(id=pk, then=Value(total)) for pk, total in totals.items()],
+                default=Value(0),
+            )
+        )
+        deltas.delete()
+        return len(totals)
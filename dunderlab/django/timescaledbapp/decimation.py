@@ -0,0 +1,175 @@
+"""
+=========================
+Timescaledbapp Decimation
+=========================
+
+This module provides the decimation of the time series for plotting, which
+keeps a subset of the samples of each channel that looks like the whole
+series, instead of averaging them, so the spikes are not flattened:
+
+``lttb``
+    Largest-Triangle-Three-Buckets: the samples are split in buckets of the
+    same size, and the sample of each bucket that makes the largest
+    triangle with the sample kept from the previous bucket and the mean of
+    the next bucket is kept. The first and last samples are always kept.
+
+``minmax``
+    The min/max envelope: the samples are split in buckets of the same
+    size, and the lowest and highest samples of each bucket are kept, in
+    time order.
+
+The samples are decimated with NumPy, the buckets are processed at once,
+except the choice of the LTTB samples, which follows the previous bucket.
+
+Functions
+---------
+
+.. rubric:: decimate
+
+Decimates the samples of a channel to a number of points.
+
+.. rubric:: lttb_indices
+
+Returns the indices of the samples kept by LTTB.
+
+.. rubric:: minmax_indices
+
+Returns the indices of the samples kept by the min/max envelope.
+
+"""
+
+import numpy as np
+
+# The decimation methods.
+DECIMATION_METHODS = ('lttb', 'minmax')
+
+
+# ----------------------------------------------------------------------
+def decimate(
+    timestamps: np.ndarray, values: np.ndarray, max_points: int, method: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decimate the samples of a channel to a number of points.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamps of the samples, sorted.
+    values : np.ndarray
+        The values of the samples.
+    max_points : int
+        The maximum number of samples to keep.
+    method : str
+        One of `DECIMATION_METHODS`.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The timestamps and values of the samples kept, all of them when
+        there are no more than `max_points`.
+
+    Raises
+    ------
+    ValueError
+        If the method is unknown.
+    """
+    if method not in DECIMATION_METHODS:
+        raise ValueError(
+            f"Unknown decimation method: '{method}', use "
+            f"{', '.join(DECIMATION_METHODS)}."
+        )
+    if len(values) <= max_points:
+        return timestamps, values
+    if method == 'lttb':
+        indices = lttb_indices(timestamps, values, max_points)
+    else:
+        indices = minmax_indices(values, max_points)
+    return timestamps[indices], values[indices]
+
+
+# ----------------------------------------------------------------------
+def lttb_indices(
+    timestamps: np.ndarray, values: np.ndarray, max_points: int
+) -> np.ndarray:
+    """
+    Return the indices of the samples kept by Largest-Triangle-Three-Buckets.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamps of the samples, sorted.
+    values : np.ndarray
+        The values of the samples.
+    max_points : int
+        The number of samples to keep, lower than the number of samples.
+
+    Returns
+    -------
+    np.ndarray
+        The sorted indices of the samples kept.
+    """
+    length = len(values)
+    if max_points < 3:
+        return np.array([0, length - 1][:max_points], dtype=np.int64)
+
+    # The times are relative to the first sample, to keep their precision
+    times = timestamps.astype('datetime64[us]').astype(np.int64)
+    x = (times - times[0]).astype(np.float64)
+    y = np.asarray(values, dtype=np.float64)
+
+    # The samples between the first and the last, in buckets of the same size
+    buckets = max_points - 2
+    bounds = (
+        np.floor(np.arange(buckets + 1) * (length - 2) / buckets).astype(np.int64)
+        + 1
+    )
+    starts, stops = bounds[:-1], bounds[1:]
+    means_x = np.add.reduceat(x[1:-1], starts - 1) / (stops - starts)
+    means_y = np.add.reduceat(y[1:-1], starts - 1) / (stops - starts)
+    # The third vertex is the mean of the next bucket, or the last sample
+    next_x = np.append(means_x[1:], x[-1])
+    next_y = np.append(means_y[1:], y[-1])
+
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, length - 1
+    previous = 0
+    for i, (start, stop) in enumerate(zip(starts.tolist(), stops.tolist())):
+        # Twice the area of the triangles, without the constant terms
+        areas = np.abs(
+            (x[previous] - next_x[i]) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y[i] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+
+# ----------------------------------------------------------------------
+def minmax_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Return the indices of the samples kept by the min/max envelope.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values of the samples.
+    max_points : int
+        The maximum number of samples to keep, two per bucket, lower than
+        the number of samples.
+
+    Returns
+    -------
+    np.ndarray
+        The sorted indices of the lowest and highest samples of each bucket.
+    """
+    length = len(values)
+    if max_points < 2:
+        return np.array([int(np.argmax(np.abs(values)))], dtype=np.int64)
+
+    buckets = max_points // 2
+    keys = np.arange(length) * buckets // length
+    # Sorted by bucket and value, the first and last of each bucket
+    order = np.lexsort((values, keys))
+    firsts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+    lasts = np.append(firsts[1:], length) - 1
+    return np.unique(np.concatenate([order[firsts], order[lasts]]))
@@ -0,0 +1,640 @@
+"""
+====================
+Timescaledbapp Fetch
+====================
+
+This module provides the columnar read path of the time series. The
+samples of a query are read straight into NumPy arrays, one per column,
+instead of building a model instance, or a tuple, per row.
+
+On PostgreSQL the query is wrapped in ``COPY (...) TO STDOUT`` in binary
+format, and the whole result is decoded with a single structured NumPy
+dtype, the reverse of the binary `COPY` of :mod:`.ingest`. The other
+backends fetch the rows in batches from a raw cursor, and each batch is
+copied into arrays preallocated for the whole query when it is sliced.
+
+Functions
+---------
+
+.. rubric:: fetch_columns
+
+Runs a `QuerySet` and returns the selected fields as NumPy arrays.
+
+.. rubric:: query_columns
+
+Runs a raw SQL query and returns its columns as NumPy arrays.
+
+.. rubric:: channel_columns
+
+Reads the samples of several channels with one query per storage table, and
+splits them by chunk and channel.
+
+.. rubric:: page_columns
+
+Reads the same page of several channels with one query, a `UNION ALL` of
+the `LIMIT` and `OFFSET` subqueries of each channel.
+
+.. rubric:: channel_counts
+
+Counts the samples of several channels within a time range, with one query
+per storage table.
+
+.. rubric:: keyset_columns
+
+Reads the samples of several channels that follow, or precede, a position
+in (timestamp, channel, chunk) order.
+
+.. rubric:: sample_columns
+
+Returns the `timestamp` and `value` arrays of a page of samples, whichever
+layout they are read from.
+
+Settings
+--------
+
+``TIMESCALEDB_FETCH_ENGINE``
+    One of ``'auto'`` (default), ``'copy'`` or ``'cursor'``. With
+    ``'auto'`` and ``'copy'``, binary `COPY` is used on PostgreSQL and the
+    cursor on any other backend.
+
+``TIMESCALEDB_FETCH_BATCH_SIZE``
+    The rows fetched at once from the cursor, by default 10000.
+
+"""
+
+import io
+import itertools
+import struct
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Count, Q, QuerySet
+
+from .blocks import SampleColumns
+from .cache import ChannelMetadata
+from .converters import UTCTimestamp, from_datetimes, time_filter
+from .ingest import PG_EPOCH
+from .models import timeserie_model
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+# NumPy dtype of the columns returned for each model field type.
+FIELD_DTYPES = {
+    'DateTimeField': 'datetime64[us]',
+    'FloatField': 'float64',
+    'SmallIntegerField': 'int16',
+    'IntegerField': 'int32',
+    'PositiveIntegerField': 'int64',
+    'BigIntegerField': 'int64',
+    'AutoField': 'int64',
+    'BigAutoField': 'int64',
+}
+
+
+# ----------------------------------------------------------------------
+def field_dtype(queryset: QuerySet, name: str) -> np.dtype:
+    """Return the NumPy dtype of a field, or annotation, following foreign keys."""
+    if name in queryset.query.annotations:
+        field = queryset.query.annotations[name].output_field
+    else:
+        field = queryset.model._meta.get_field(name)
+    if field.is_relation:
+        field = field.target_field
+    return np.dtype(FIELD_DTYPES[field.get_internal_type()])
+
+
+# ----------------------------------------------------------------------
+def fetch_columns(
+    queryset: QuerySet, fields: list[str]
+) -> dict[str, np.ndarray]:
+    """
+    Run a `QuerySet` and return the selected fields as NumPy arrays.
+
+    The fields must not be null. The `DateTimeField` columns are returned as
+    naive UTC `datetime64[us]` arrays.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The query, with its filters, ordering and slice.
+    fields : list[str]
+        The names of the fields to read.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        One array per field, keyed by field name.
+    """
+    dtypes = [field_dtype(queryset, name) for name in fields]
+    query = queryset.values_list(*fields).query
+    using = queryset.db
+    try:
+        sql, params = query.get_compiler(using=using).as_sql()
+    except EmptyResultSet:
+        return {
+            name: np.empty(0, dtype=dtype)
+            for name, dtype in zip(fields, dtypes)
+        }
+
+    size = None
+    if query.high_mark is not None:
+        size = query.high_mark - query.low_mark
+    arrays = query_columns(sql, params, dtypes, using, size)
+    return dict(zip(fields, arrays))
+
+
+# ----------------------------------------------------------------------
+def query_columns(
+    sql: str,
+    params: tuple,
+    dtypes: list[np.dtype],
+    using: str,
+    size: Optional[int] = None,
+) -> list[np.ndarray]:
+    """
+    Run a raw SQL query and return its columns as NumPy arrays.
+
+    The engine is chosen with `TIMESCALEDB_FETCH_ENGINE`, see
+    `copy_columns` and `cursor_columns` for the parameters.
+    """
+    engine = getattr(settings, 'TIMESCALEDB_FETCH_ENGINE', 'auto')
+    if engine not in ('auto', 'copy', 'cursor'):
+        raise ValueError(f"Unknown TIMESCALEDB_FETCH_ENGINE: '{engine}'")
+
+    dtypes = [np.dtype(dtype) for dtype in dtypes]
+    if engine != 'cursor' and connections[using].vendor == 'postgresql':
+        return copy_columns(sql, params, dtypes, using)
+    return cursor_columns(sql, params, dtypes, using, size)
+
+
+# ----------------------------------------------------------------------
+def copy_columns(
+    sql: str, params: tuple, dtypes: list[np.dtype], using: str
+) -> list[np.ndarray]:
+    """
+    Read the result of a query with binary `COPY TO STDOUT`.
+
+    Parameters
+    ----------
+    sql : str
+        The query.
+    params : tuple
+        The parameters of the query.
+    dtypes : list[np.dtype]
+        The dtype of each column of the result.
+    using : str
+        The database alias.
+
+    Returns
+    -------
+    list[np.ndarray]
+        The columns of the result.
+    """
+    connection = connections[using]
+    buffer = io.BytesIO()
+    with connection.cursor() as cursor:
+        with connection.wrap_database_errors:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                query = raw.mogrify(sql, params).decode()
+                raw.copy_expert(
+                    f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer
+                )
+            else:  # psycopg 3
+                with raw.copy(
+                    f"COPY ({sql}) TO STDOUT WITH (FORMAT binary)", params
+                ) as copy:
+                    for data in copy:
+                        buffer.write(data)
+    return from_binary(buffer.getbuffer(), dtypes)
+
+
+# ----------------------------------------------------------------------
+def from_binary(data: memoryview, dtypes: list[np.dtype]) -> list[np.ndarray]:
+    """
+    Decode the columns of a PostgreSQL binary `COPY` stream.
+
+    The width of every field is read from the first tuple, then all the
+    tuples are decoded at once with a structured dtype, so every field must
+    have a fixed width and no null.
+
+    Raises
+    ------
+    ValueError
+        If the stream is not in binary `COPY` format, or the tuples do not
+        have the same layout.
+    """
+    if bytes(data[: len(PGCOPY_SIGNATURE)]) != PGCOPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream.")
+    (extension,) = struct.unpack_from('>i', data, len(PGCOPY_SIGNATURE) + 4)
+    start = len(PGCOPY_SIGNATURE) + 8 + extension
+    # The trailer is a field count of -1
+    body = data[start:-2]
+    if not len(body):
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+
+    wire = [('nfields', '>i2')]
+    position = 2
+    for i, dtype in enumerate(dtypes):
+        (width,) = struct.unpack_from('>i', body, position)
+        if width <= 0:
+            raise ValueError("The COPY stream has null or empty fields.")
+        position += 4 + width
+        kind = 'i' if np.issubdtype(dtype, np.datetime64) else dtype.kind
+        wire += [(f'size{i}', '>i4'), (f'field{i}', f'>{kind}{width}')]
+    wire = np.dtype(wire)
+
+    if len(body) % wire.itemsize:
+        raise ValueError("The fields of the COPY stream are not fixed width.")
+    rows = np.frombuffer(body, dtype=wire)
+    if not all(
+        (rows[f'size{i}'] == wire[f'field{i}'].itemsize).all()
+        for i in range(len(dtypes))
+    ):
+        raise ValueError("The fields of the COPY stream are not fixed width.")
+
+    columns = []
+    for i, dtype in enumerate(dtypes):
+        field = rows[f'field{i}']
+        if np.issubdtype(dtype, np.datetime64):
+            columns.append(PG_EPOCH + field.astype('timedelta64[us]'))
+        else:
+            columns.append(field.astype(dtype))
+    return columns
+
+
+# ----------------------------------------------------------------------
+def cursor_columns(
+    sql: str,
+    params: tuple,
+    dtypes: list[np.dtype],
+    using: str,
+    size: Optional[int] = None,
+) -> list[np.ndarray]:
+    """
+    Read the result of a query from a cursor, in batches.
+
+    Parameters
+    ----------
+    sql : str
+        The query.
+    params : tuple
+        The parameters of the query.
+    dtypes : list[np.dtype]
+        The dtype of each column of the result.
+    using : str
+        The database alias.
+    size : int, optional
+        The maximum number of rows of the result, the arrays are resized as
+        they fill up when it is not known.
+
+    Returns
+    -------
+    list[np.ndarray]
+        The columns of the result.
+    """
+    batch_size = getattr(settings, 'TIMESCALEDB_FETCH_BATCH_SIZE', 10000)
+    capacity = size if size is not None else batch_size
+    arrays = [np.empty(capacity, dtype=dtype) for dtype in dtypes]
+    length = 0
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(batch_size):
+            if length + len(rows) > capacity:
+                capacity = max(2 * capacity, length + len(rows))
+                arrays = [np.resize(array, capacity) for array in arrays]
+            for array, column in zip(arrays, zip(*rows)):
+                if np.issubdtype(array.dtype, np.datetime64):
+                    column = from_datetimes(column)
+                array[length : length + len(rows)] = column
+            length += len(rows)
+
+    return [array[:length] for array in arrays]
+
+
+# ----------------------------------------------------------------------
+def storage_channels(channels: Iterable[ChannelMetadata]) -> dict[str, list[int]]:
+    """Group the ids of several channels by the storage table of their samples."""
+    storages = {}
+    for channel in channels:
+        storages.setdefault(channel.storage, []).append(channel.id)
+    return storages
+
+
+# ----------------------------------------------------------------------
+def channel_counts(
+    channels: Iterable[ChannelMetadata],
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+) -> dict[int, int]:
+    """
+    Count the samples of several channels within a time range.
+
+    Unlike the counts kept by :mod:`.counters`, the samples are counted in
+    the tables, but only in the chunks of the hypertable within the range.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        The naive UTC times of the first and last samples counted, unbounded
+        when None.
+
+    Returns
+    -------
+    dict[int, int]
+        The number of samples of every channel with samples, keyed by id.
+    """
+    counts = {}
+    for storage, channel_ids in storage_channels(channels).items():
+        counts.update(
+            timeserie_model(storage)
+            .objects.filter(time_filter(*timerange), channel_id__in=channel_ids)
+            .order_by()
+            .values('channel_id')
+            .annotate(count=Count('*'))
+            .values_list('channel_id', 'count')
+        )
+    return counts
+
+
+# ----------------------------------------------------------------------
+def channel_columns(
+    channels: Iterable[ChannelMetadata],
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk_ids: Optional[list[int]] = None,
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+) -> dict[tuple[Optional[int], int], tuple[np.ndarray, np.ndarray]]:
+    """
+    Read the samples of several channels at once.
+
+    The samples of all the channels stored in the same table are read with
+    a single query, ordered by channel and timestamp, then split by channel
+    where the `channel_id` column changes. The pages of the channels are
+    read with `page_columns`.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels.
+    start : int, optional
+        The position, in timestamp order, of the first sample of each
+        channel.
+    stop : int, optional
+        The position after the last sample of each channel, all the samples
+        when not given.
+    chunk_ids : list[int], optional
+        Only the samples of these chunks, split by chunk and channel. The
+        positions are then counted within each chunk.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the samples between these naive UTC times, included, unbounded
+        when None. The positions are then counted within the range.
+
+    Returns
+    -------
+    dict[tuple[Optional[int], int], tuple[np.ndarray, np.ndarray]]
+        The `datetime64[us]` timestamps and the values of every channel with
+        samples, keyed by chunk id (None without `chunk_ids`) and channel id.
+    """
+    storages = storage_channels(channels)
+    partition = ['channel_id']
+    if chunk_ids is not None:
+        partition = ['chunk_id', 'channel_id']
+
+    fields = ['timestamp', 'value', *partition]
+    samples = {}
+    for storage, channel_ids in storages.items():
+        queryset = timeserie_model(storage).objects.filter(
+            time_filter(*timerange)
+        )
+        if start or stop is not None:
+            keys = {'channel_id': channel_ids}
+            if chunk_ids is not None:
+                keys = {'chunk_id': chunk_ids, **keys}
+            columns = page_columns(queryset, fields, keys, start, stop)
+        else:
+            queryset = queryset.filter(channel_id__in=channel_ids)
+            if chunk_ids is not None:
+                queryset = queryset.filter(chunk_id__in=chunk_ids)
+            columns = fetch_columns(
+                queryset.order_by(*partition, 'timestamp', 'chunk_id'), fields
+            )
+
+        # A new channel, or chunk, starts wherever one of the keys changes
+        keys = [columns[column] for column in partition]
+        length = len(columns['timestamp'])
+        changes = np.zeros(max(length - 1, 0), dtype=bool)
+        for key in keys:
+            changes |= key[1:] != key[:-1]
+        bounds = [0, *(np.flatnonzero(changes) + 1).tolist(), length]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            if first == last:
+                continue
+            chunk_id = int(keys[0][first]) if chunk_ids is not None else None
+            samples[(chunk_id, int(keys[-1][first]))] = (
+                columns['timestamp'][first:last],
+                columns['value'][first:last],
+            )
+    return samples
+
+
+# ----------------------------------------------------------------------
+def page_columns(
+    queryset: QuerySet,
+    fields: list[str],
+    keys: dict[str, list[int]],
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Read the same page of the samples of each channel, or chunk, at once.
+
+    Every page is read by its own subquery, ordered by timestamp and sliced
+    with `LIMIT` and `OFFSET`, so each one is an index range scan that stops
+    at the end of the page, and the subqueries are joined with `UNION ALL`
+    into a single query.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        The samples, with their filters but the keys.
+    fields : list[str]
+        The names of the fields to read, with the columns of `keys`.
+    keys : dict[str, list[int]]
+        The ids of the pages, 'channel_id' and maybe 'chunk_id', a page is
+        read for every combination.
+    start : int, optional
+        The position, in timestamp order, of the first sample of each page.
+    stop : int, optional
+        The position after the last sample of each page, the end when None.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        One array per field, ordered by the `keys` and timestamp.
+    """
+    dtypes = [field_dtype(queryset, name) for name in fields]
+    selects, params = [], []
+    for number, values in enumerate(itertools.product(*keys.values())):
+        page = (
+            queryset.filter(**dict(zip(keys, values)))
+            .order_by('timestamp', 'chunk_id')
+            .values_list(*fields)[start:stop]
+        )
+        try:
+            sql, page_params = page.query.get_compiler(using=queryset.db).as_sql()
+        except EmptyResultSet:
+            continue
+        selects.append(f"SELECT * FROM ({sql}) AS page{number}")
+        params.extend(page_params)
+    if not selects:
+        return {
+            name: np.empty(0, dtype=dtype) for name, dtype in zip(fields, dtypes)
+        }
+
+    quote = connections[queryset.db].ops.quote_name
+    order = ', '.join(quote(column) for column in [*keys, 'timestamp'])
+    sql = (
+        f"SELECT * FROM ({' UNION ALL '.join(selects)}) AS pages "
+        f"ORDER BY {order}"
+    )
+    size = None if stop is None else (stop - start) * len(selects)
+    arrays = query_columns(sql, tuple(params), dtypes, queryset.db, size)
+    return dict(zip(fields, arrays))
+
+
+# ----------------------------------------------------------------------
+def keyset_columns(
+    channels: Iterable[ChannelMetadata],
+    limit: int,
+    position: Optional[tuple[np.datetime64, int, int]] = None,
+    reverse: bool = False,
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+) -> dict[str, np.ndarray]:
+    """
+    Read the samples of several channels that follow, or precede, a position.
+
+    The samples are ordered by their key, `(timestamp, channel_id,
+    chunk_id)`, the primary key of the timeserie tables, so each page is an
+    index range scan that starts at the position, whatever its depth.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels.
+    limit : int
+        The maximum number of samples.
+    position : tuple[np.datetime64, int, int], optional
+        The key of the last sample already read, from the first sample when
+        not given.
+    reverse : bool, optional
+        Read the samples that precede the position instead.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the samples between these naive UTC times, included, unbounded
+        when None.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The `timestamp`, `value`, `channel_id` and `chunk_id` columns of the
+        samples closest to the position, in ascending key order.
+    """
+    storages = storage_channels(channels)
+    fields = ['timestamp', 'channel_id', 'chunk_id']
+    parts = []
+    for storage, channel_ids in storages.items():
+        queryset = timeserie_model(storage).objects.filter(
+            time_filter(*timerange), channel_id__in=channel_ids
+        )
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(position, reverse))
+        queryset = queryset.order_by(
+            *(f'-{field}' if reverse else field for field in fields)
+        )
+        parts.append(
+            fetch_columns(queryset[:limit], ['timestamp', 'value', *fields[1:]])
+        )
+
+    if not parts:
+        return {
+            'timestamp': np.empty(0, dtype='datetime64[us]'),
+            'value': np.empty(0),
+            'channel_id': np.empty(0, dtype=np.int64),
+            'chunk_id': np.empty(0, dtype=np.int64),
+        }
+
+    columns = {
+        name: np.concatenate([part[name] for part in parts])
+        for name in parts[0]
+    }
+    order = np.lexsort(
+        (columns['chunk_id'], columns['channel_id'], columns['timestamp'])
+    )
+    order = order[len(order) - limit :] if reverse else order[:limit]
+    return {name: column[order] for name, column in columns.items()}
+
+
+# ----------------------------------------------------------------------
+def keyset_filter(
+    position: tuple[np.datetime64, int, int], reverse: bool = False
+) -> Q:
+    """
+    Return the filter of the samples after, or before, a key.
+
+    The comparison of the keys is expanded field by field, with a bound on
+    the timestamp so that the scan of the index starts at the position.
+    """
+    timestamp, channel_id, chunk_id = position
+    timestamp = UTCTimestamp(timestamp)
+    after = 'lt' if reverse else 'gt'
+    return Q(**{f'timestamp__{after}e': timestamp}) & (
+        Q(**{f'timestamp__{after}': timestamp})
+        | Q(**{f'channel_id__{after}': channel_id})
+        | Q(channel_id=channel_id, **{f'chunk_id__{after}': chunk_id})
+    )
+
+
+# ----------------------------------------------------------------------
+def sample_columns(samples: Any) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the timestamps and values of a page of samples.
+
+    Parameters
+    ----------
+    samples : Any
+        A `QuerySet` of one of the timeserie tables, a sequence of samples
+        whose slices are `SampleColumns`, such as `BlockSamples`, or any
+        sequence of samples with a `timestamp` and a `value`.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The naive UTC `datetime64[us]` timestamps and the values.
+    """
+    if isinstance(samples, QuerySet):
+        columns = fetch_columns(samples, ['timestamp', 'value'])
+        return columns['timestamp'], columns['value']
+
+    if not isinstance(samples, SampleColumns):
+        samples = samples[:]
+    if isinstance(samples, SampleColumns):
+        return samples.timestamps, samples.values
+
+    return (
+        from_datetimes([sample.timestamp for sample in samples]),
+        np.array([sample.value for sample in samples]),
+    )
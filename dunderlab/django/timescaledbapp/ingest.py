@@ -0,0 +1,923 @@
+"""
+============================
+Timescaledbapp Ingest Engine
+============================
+
+This module provides the engines used to write columnar time series data
+into the database. Data arrives as a mapping of database column names to
+NumPy arrays of equal length, so no model instance is created per sample
+unless the backend requires it.
+
+Classes
+-------
+
+.. rubric:: WriteResult
+
+The number of rows inserted, updated and skipped by a write, with the
+inserted rows counted per value of a grouping column.
+
+.. rubric:: IngestEngine
+
+Base class for the ingest engines. It defines the `write` interface shared
+by all the engines.
+
+.. rubric:: BulkCreateEngine
+
+This engine builds model instances and delegates to Django's `bulk_create`.
+It works with any database backend and is used as the fallback when
+PostgreSQL is not available.
+
+.. rubric:: CopyEngine
+
+This engine streams the columns straight into the table with PostgreSQL
+`COPY`, either in binary or in text format. No model instances are created.
+
+Functions
+---------
+
+.. rubric:: get_ingest_engine
+
+Returns the engine configured with the `TIMESCALEDB_INGEST_ENGINE` setting
+for a given database alias.
+
+.. rubric:: conflict_policy
+
+Returns the conflict policy of a write, from the request, the measure or the
+`TIMESCALEDB_CONFLICT_POLICY` setting.
+
+.. rubric:: drop_duplicates
+
+Keeps the last row of every key in a set of columns.
+
+.. rubric:: write_columns
+
+Writes the columns and the channel count increments in one transaction.
+
+.. rubric:: write_slices
+
+Writes a sequence of column slices, each one with the model of its table, in
+one transaction, so that large uploads are sent to the database without
+building all their rows at once.
+
+.. rubric:: merge_tables
+
+Concatenates the columns of several writes, table by table.
+
+Conflict policies
+-----------------
+
+Rows whose key (the `unique_together` fields of the model) already exists
+are handled according to a policy:
+
+``'reject'``
+    The whole write fails with `IntegrityError`.
+
+``'skip'``
+    The existing rows are kept and the new ones are skipped.
+
+``'overwrite'``
+    The existing rows are updated with the new values. When a key repeats
+    within the same write, the last row wins.
+
+On PostgreSQL, `CopyEngine` copies the rows into a temporary staging table
+and moves them with a single ``INSERT ... ON CONFLICT``. `BulkCreateEngine`
+relies on `bulk_create` with ``ignore_conflicts`` or ``update_conflicts``.
+
+Settings
+--------
+
+``TIMESCALEDB_INGEST_ENGINE``
+    One of ``'auto'`` (default), ``'copy'`` or ``'bulk_create'``. With
+    ``'auto'`` and ``'copy'``, `COPY` is used on PostgreSQL and
+    `bulk_create` on any other backend.
+
+``TIMESCALEDB_COPY_FORMAT``
+    One of ``'binary'`` (default) or ``'text'``. Binary `COPY` is only used
+    when every column has a fixed width type, otherwise text is used.
+
+``TIMESCALEDB_BULK_CREATE_BATCH_SIZE``
+    Batch size for the `bulk_create` fallback, by default 1000.
+
+``TIMESCALEDB_INGEST_SLICE_ROWS``
+    Uploads with more samples are written in slices of this many rows,
+    by default 500000.
+
+``TIMESCALEDB_CONFLICT_POLICY``
+    The conflict policy used when neither the request nor the measure
+    sets one, by default ``'reject'``.
+
+"""
+
+import io
+import struct
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Iterable, NamedTuple, Optional, Type
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.utils import IntegrityError
+from django.db.models import Count, Model, Sum
+from django.utils import timezone
+
+from .blocks import overlapping_blocks
+from .counters import add_counts
+from .models import CONFLICT_POLICIES, TimeSerieBlock
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+
+# Binary wire representation for the PostgreSQL types with a fixed width.
+PG_BINARY_TYPES = {
+    'timestamp without time zone': '>i8',
+    'timestamp with time zone': '>i8',
+    'double precision': '>f8',
+    'real': '>f4',
+    'bigint': '>i8',
+    'integer': '>i4',
+    'smallint': '>i2',
+}
+
+REJECT, SKIP, OVERWRITE = (policy for policy, _ in CONFLICT_POLICIES)
+
+
+########################################################################
+class WriteResult(NamedTuple):
+    """The outcome of a write."""
+    inserted: int
+    updated: int
+    skipped: int
+    counts: dict[Any, int]
+
+
+########################################################################
+class IngestEngine:
+    """
+    Base class for the ingest engines.
+
+    Subclasses implement `write`, which receives a model and a dictionary
+    of database column names to NumPy arrays of the same length.
+    """
+
+    # ----------------------------------------------------------------------
+    def write(
+        self,
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        using: Optional[str] = None,
+        on_conflict: str = REJECT,
+        count_by: Optional[str] = None,
+        weight: Optional[str] = None,
+    ) -> WriteResult:
+        """
+        Write the columns into the table of the model.
+
+        Parameters
+        ----------
+        model : Type[Model]
+            The model whose table receives the rows.
+        columns : dict[str, np.ndarray]
+            The data to write, keyed by database column name.
+        using : str, optional
+            The database alias, by default the one given by the router.
+        on_conflict : str, optional
+            The conflict policy, 'reject' (default), 'skip' or 'overwrite'.
+        count_by : str, optional
+            A column to count the inserted rows by, e.g. 'channel_id'.
+        weight : str, optional
+            A column with the number of samples held by each row, e.g. 'n'.
+            When given, the result counts samples instead of rows.
+
+        Returns
+        -------
+        WriteResult
+            The number of rows inserted, updated and skipped.
+        """
+        raise NotImplementedError
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def conflict_columns(model: Type[Model]) -> list[str]:
+        """Return the columns of the key that identifies a row."""
+        if model._meta.unique_together:
+            names = model._meta.unique_together[0]
+            return [model._meta.get_field(name).column for name in names]
+        return [model._meta.pk.column]
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def inserted_result(
+        columns: dict[str, np.ndarray],
+        count_by: Optional[str],
+        weight: Optional[str] = None,
+    ) -> WriteResult:
+        """Return the result of a write where every row was inserted."""
+        length = IngestEngine.total(columns, weight)
+        counts = {}
+        if count_by and length:
+            keys, inverse = np.unique(columns[count_by], return_inverse=True)
+            sizes = np.bincount(
+                inverse, weights=columns[weight] if weight else None
+            ).astype(np.int64)
+            counts = dict(zip(keys.tolist(), sizes.tolist()))
+        return WriteResult(length, 0, 0, counts)
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def total(columns: dict[str, np.ndarray], weight: Optional[str]) -> int:
+        """Return the number of rows, or of samples if `weight` is given."""
+        if weight:
+            return int(columns[weight].sum())
+        return len(next(iter(columns.values()), []))
+
+
+########################################################################
+class BulkCreateEngine(IngestEngine):
+    """
+    Ingest engine based on Django's `bulk_create`.
+
+    It is slower than `CopyEngine` because one model instance is built per
+    row, but it works with any database backend.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, batch_size: int = 1000) -> None:
+        """
+        Parameters
+        ----------
+        batch_size : int, optional
+            The size of each INSERT statement, by default 1000.
+        """
+        self.batch_size = batch_size
+
+    # ----------------------------------------------------------------------
+    def write(
+        self,
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        using: Optional[str] = None,
+        on_conflict: str = REJECT,
+        count_by: Optional[str] = None,
+        weight: Optional[str] = None,
+    ) -> WriteResult:
+        """
+        Write the columns building one model instance per row.
+
+        With the 'skip' and 'overwrite' policies the rows in the key range of
+        the write are counted before and after it to know how many were
+        inserted.
+        """
+        using = using or router.db_for_write(model)
+        length = self.total(columns, weight)
+        fields = {
+            field.column: field for field in model._meta.concrete_fields
+        }
+        keys = self.conflict_columns(model)
+
+        if on_conflict == OVERWRITE:
+            columns = drop_duplicates(columns, keys)
+        if on_conflict != REJECT:
+            before = self.count_rows(
+                model, columns, keys, count_by, using, weight
+            )
+
+        names = [fields[column].attname for column in columns]
+        data = [self.to_python(array) for array in columns.values()]
+        objects = [model(**dict(zip(names, row))) for row in zip(*data)]
+        options = {}
+        if on_conflict == SKIP:
+            options = {'ignore_conflicts': True}
+        elif on_conflict == OVERWRITE:
+            options = {
+                'update_conflicts': True,
+                'unique_fields': [fields[column].name for column in keys],
+                'update_fields': [
+                    fields[column].name
+                    for column in columns
+                    if column not in keys
+                ],
+            }
+        model.objects.using(using).bulk_create(
+            objects, batch_size=self.batch_size, **options
+        )
+
+        if on_conflict == REJECT:
+            return self.inserted_result(columns, count_by, weight)
+
+        after = self.count_rows(
+            model, columns, keys, count_by, using, weight
+        )
+        counts = {
+            key: after[key] - before.get(key, 0)
+            for key in after
+            if after[key] != before.get(key, 0)
+        }
+        inserted = sum(counts.values())
+        updated = (
+            self.total(columns, weight) - inserted
+            if on_conflict == OVERWRITE
+            else 0
+        )
+        return WriteResult(
+            inserted,
+            updated,
+            length - inserted - updated,
+            counts if count_by else {},
+        )
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def count_rows(
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        keys: list[str],
+        count_by: Optional[str],
+        using: str,
+        weight: Optional[str] = None,
+    ) -> dict[Any, int]:
+        """Count the stored rows, or samples, in the key range of the columns."""
+        fields = {
+            field.column: field for field in model._meta.concrete_fields
+        }
+        lookups = {}
+        for column in keys:
+            array = columns[column]
+            if np.issubdtype(array.dtype, np.datetime64):
+                start, end = BulkCreateEngine.to_python(
+                    np.array([array.min(), array.max()])
+                )
+                lookups[f'{fields[column].attname}__range'] = (start, end)
+            else:
+                lookups[f'{fields[column].attname}__in'] = np.unique(
+                    array
+                ).tolist()
+
+        queryset = model.objects.using(using).filter(**lookups)
+        rows = Sum(fields[weight].attname) if weight else Count('*')
+        if not count_by:
+            return {None: queryset.aggregate(rows=rows)['rows'] or 0}
+        return dict(
+            queryset.order_by()
+            .values(fields[count_by].attname)
+            .annotate(rows=rows)
+            .values_list(fields[count_by].attname, 'rows')
+        )
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def to_python(array: np.ndarray) -> list[Any]:
+        """Convert a column into a list of Python objects for the ORM."""
+        if np.issubdtype(array.dtype, np.datetime64):
+            array = array.astype('datetime64[us]').astype(object)
+            if settings.USE_TZ:
+                return [
+                    t.replace(tzinfo=dt_timezone.utc) for t in array
+                ]
+        return array.tolist()
+
+
+########################################################################
+class CopyEngine(IngestEngine):
+    """
+    Ingest engine based on PostgreSQL `COPY FROM STDIN`.
+
+    The columns are serialized directly from the NumPy arrays, in binary
+    format when all the column types have a fixed width, and in text format
+    otherwise.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, format: str = 'binary') -> None:
+        """
+        Parameters
+        ----------
+        format : str, optional
+            Either 'binary' or 'text', by default 'binary'.
+        """
+        self.format = format
+        self._column_types = {}
+
+    # ----------------------------------------------------------------------
+    def write(
+        self,
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        using: Optional[str] = None,
+        on_conflict: str = REJECT,
+        count_by: Optional[str] = None,
+        weight: Optional[str] = None,
+    ) -> WriteResult:
+        """
+        Write the columns with a single COPY statement.
+
+        With the 'skip' and 'overwrite' policies the columns are copied into
+        a temporary staging table, then moved with ``INSERT ... ON CONFLICT``.
+        """
+        using = using or router.db_for_write(model)
+        table = model._meta.db_table
+        if on_conflict == REJECT:
+            self.copy(table, columns, using)
+            return self.inserted_result(columns, count_by, weight)
+        return self.upsert(
+            model, columns, using, on_conflict, count_by, weight
+        )
+
+    # ----------------------------------------------------------------------
+    def upsert(
+        self,
+        model: Type[Model],
+        columns: dict[str, np.ndarray],
+        using: str,
+        on_conflict: str,
+        count_by: Optional[str] = None,
+        weight: Optional[str] = None,
+    ) -> WriteResult:
+        """
+        Copy the columns into a staging table and merge them into the table.
+
+        Parameters
+        ----------
+        model : Type[Model]
+            The model whose table receives the rows.
+        columns : dict[str, np.ndarray]
+            The data to write, keyed by database column name.
+        using : str
+            The database alias.
+        on_conflict : str
+            Either 'skip' or 'overwrite'.
+        count_by : str, optional
+            A column to count the inserted rows by.
+        weight : str, optional
+            A column with the number of samples held by each row.
+
+        Returns
+        -------
+        WriteResult
+            The number of rows, or samples, inserted, updated and skipped.
+        """
+        length = self.total(columns, weight)
+        if not length:
+            return WriteResult(0, 0, 0, {})
+        if on_conflict == OVERWRITE:
+            columns = drop_duplicates(columns, self.conflict_columns(model))
+
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        staging = quote(f'{model._meta.db_table}_staging')
+        keys = self.conflict_columns(model)
+        names = ', '.join(quote(column) for column in columns)
+        group = quote(count_by) if count_by else 'NULL'
+        aggregate = f'SUM({quote(weight)})' if weight else 'COUNT(*)'
+        staged = f'SUM(staging.{quote(weight)})' if weight else 'COUNT(*)'
+        stored = f'SUM({table}.{quote(weight)})' if weight else 'COUNT(*)'
+
+        if on_conflict == OVERWRITE:
+            action = 'DO UPDATE SET ' + ', '.join(
+                f'{quote(column)} = EXCLUDED.{quote(column)}'
+                for column in columns
+                if column not in keys
+            )
+        else:
+            action = 'DO NOTHING'
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;"
+            )
+            cursor.execute(f"TRUNCATE {staging};")
+            self.copy(
+                model._meta.db_table + '_staging',
+                columns,
+                using,
+                column_types=self.column_types(model._meta.db_table, using),
+            )
+
+            # The rows, or samples, of the updated rows before and after
+            existing, replaced = {}, {}
+            if on_conflict == OVERWRITE:
+                cursor.execute(
+                    f"""
+                    SELECT {'staging.' + group if count_by else group}, {staged}, {stored}
+                    FROM {staging} AS staging
+                    JOIN {table} USING ({', '.join(map(quote, keys))})
+                    GROUP BY 1;
+                    """
+                )
+                for key, new_rows, old_rows in cursor.fetchall():
+                    existing[key] = new_rows
+                    replaced[key] = old_rows
+
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    INSERT INTO {table} ({names})
+                    SELECT {names} FROM {staging}
+                    ON CONFLICT ({', '.join(map(quote, keys))}) {action}
+                    RETURNING {group} AS group_key{', ' + quote(weight) if weight else ''}
+                )
+                SELECT group_key, {aggregate} FROM moved GROUP BY group_key;
+                """
+            )
+            written = dict(cursor.fetchall())
+
+        inserted = sum(written.values()) - sum(existing.values())
+        updated = sum(existing.values())
+        counts = {
+            key: rows - replaced.get(key, 0)
+            for key, rows in written.items()
+            if rows != replaced.get(key, 0)
+        }
+        return WriteResult(
+            inserted,
+            updated,
+            length - inserted - updated,
+            counts if count_by else {},
+        )
+
+    # ----------------------------------------------------------------------
+    def copy(
+        self,
+        table: str,
+        columns: dict[str, np.ndarray],
+        using: str,
+        column_types: Optional[dict[str, str]] = None,
+    ) -> int:
+        """
+        Copy the columns into a table given by name.
+
+        Parameters
+        ----------
+        table : str
+            The name of the destination table.
+        columns : dict[str, np.ndarray]
+            The data to write, keyed by column name.
+        using : str
+            The database alias.
+        column_types : dict[str, str], optional
+            The PostgreSQL type of each column, introspected from the table
+            when not given.
+
+        Returns
+        -------
+        int
+            The number of rows written.
+        """
+        length = len(next(iter(columns.values()), []))
+        if not length:
+            return 0
+
+        connection = connections[using]
+        column_types = column_types or self.column_types(table, using)
+
+        types = [column_types.get(column) for column in columns]
+        if self.format == 'binary' and all(
+            self.binary_compatible(array, type_)
+            for array, type_ in zip(columns.values(), types)
+        ):
+            buffer = self.to_binary(list(columns.values()), types)
+            options = "WITH (FORMAT binary)"
+        else:
+            buffer = self.to_text(list(columns.values()))
+            options = ""
+
+        quote = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN {}".format(
+            quote(table), ', '.join(quote(c) for c in columns), options
+        )
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            with connection.wrap_database_errors:
+                raw = cursor.cursor
+                if hasattr(raw, 'copy_expert'):  # psycopg2
+                    raw.copy_expert(sql, io.BytesIO(buffer))
+                else:  # psycopg 3
+                    with raw.copy(sql) as copy:
+                        copy.write(buffer)
+        return length
+
+    # ----------------------------------------------------------------------
+    def column_types(self, table: str, using: str) -> dict[str, str]:
+        """Return the PostgreSQL type of every column of a table."""
+        key = (using, table)
+        if key not in self._column_types:
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT attname, format_type(atttypid, atttypmod)
+                    FROM pg_attribute
+                    WHERE attrelid = %s::regclass
+                    AND attnum > 0 AND NOT attisdropped;
+                    """,
+                    [table],
+                )
+                self._column_types[key] = dict(cursor.fetchall())
+        return self._column_types[key]
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def binary_compatible(array: np.ndarray, type_: Optional[str]) -> bool:
+        """Check whether a column can be sent in binary format."""
+        if type_ not in PG_BINARY_TYPES or array.ndim != 1:
+            return False
+        if type_.startswith('timestamp'):
+            return np.issubdtype(array.dtype, np.datetime64)
+        return np.issubdtype(array.dtype, np.number)
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def to_binary(arrays: list[np.ndarray], types: list[str]) -> bytes:
+        """
+        Serialize the columns in PostgreSQL binary COPY format.
+
+        Each tuple is laid out with a structured NumPy dtype, so the whole
+        payload is built with array assignments only.
+        """
+        dtype = [('nfields', '>i2')]
+        for i, type_ in enumerate(types):
+            dtype += [(f'size{i}', '>i4'), (f'field{i}', PG_BINARY_TYPES[type_])]
+
+        rows = np.empty(len(arrays[0]), dtype=dtype)
+        rows['nfields'] = len(arrays)
+        for i, (array, type_) in enumerate(zip(arrays, types)):
+            if type_.startswith('timestamp'):
+                array = (
+                    array.astype('datetime64[us]') - PG_EPOCH
+                ).astype(np.int64)
+            rows[f'size{i}'] = np.dtype(PG_BINARY_TYPES[type_]).itemsize
+            rows[f'field{i}'] = array
+
+        return PGCOPY_HEADER + rows.tobytes() + PGCOPY_TRAILER
+
+    # ----------------------------------------------------------------------
+    @classmethod
+    def to_text(cls, arrays: list[np.ndarray]) -> bytes:
+        """Serialize the columns in PostgreSQL text COPY format."""
+        columns = [cls.format_text(array) for array in arrays]
+        lines = ['\t'.join(row) for row in zip(*columns)]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def format_text(array: np.ndarray) -> list[str]:
+        """Format a single column as a list of COPY text values."""
+        if np.issubdtype(array.dtype, np.datetime64):
+            return np.datetime_as_string(array, unit='us').tolist()
+        if array.ndim == 2:
+            return [
+                '{' + ','.join(row) + '}'
+                for row in array.astype(str).tolist()
+            ]
+        if array.dtype != object:
+            return array.astype(str).tolist()
+
+        formatted = []
+        for item in array:
+            if item is None:
+                item = '\\N'
+            elif isinstance(item, bytes):
+                item = '\\\\x' + item.hex()
+            elif isinstance(item, datetime):
+                if timezone.is_aware(item):
+                    item = item.astimezone(dt_timezone.utc).replace(
+                        tzinfo=None
+                    )
+                item = item.isoformat()
+            formatted.append(str(item))
+        return formatted
+
+
+_copy_engines: dict[str, CopyEngine] = {}
+
+
+# ----------------------------------------------------------------------
+def get_ingest_engine(using: str) -> IngestEngine:
+    """
+    Return the ingest engine configured for a database.
+
+    Parameters
+    ----------
+    using : str
+        The database alias the data will be written to.
+
+    Returns
+    -------
+    IngestEngine
+        A `CopyEngine` on PostgreSQL unless `bulk_create` was requested,
+        a `BulkCreateEngine` otherwise.
+    """
+    engine = getattr(settings, 'TIMESCALEDB_INGEST_ENGINE', 'auto')
+    if engine not in ('auto', 'copy', 'bulk_create'):
+        raise ValueError(f"Unknown TIMESCALEDB_INGEST_ENGINE: '{engine}'")
+
+    if engine != 'bulk_create' and connections[using].vendor == 'postgresql':
+        if using not in _copy_engines:
+            _copy_engines[using] = CopyEngine(
+                format=getattr(settings, 'TIMESCALEDB_COPY_FORMAT', 'binary')
+            )
+        return _copy_engines[using]
+
+    return BulkCreateEngine(
+        batch_size=getattr(settings, 'TIMESCALEDB_BULK_CREATE_BATCH_SIZE', 1000)
+    )
+
+
+# ----------------------------------------------------------------------
+def conflict_policy(
+    requested: Optional[str] = None, measure: Optional[str] = None
+) -> str:
+    """
+    Return the conflict policy of a write.
+
+    Parameters
+    ----------
+    requested : str, optional
+        The policy asked for by the request.
+    measure : str, optional
+        The policy configured for the measure.
+
+    Returns
+    -------
+    str
+        The first policy given, or the `TIMESCALEDB_CONFLICT_POLICY` setting.
+    """
+    policy = (
+        requested
+        or measure
+        or getattr(settings, 'TIMESCALEDB_CONFLICT_POLICY', REJECT)
+    )
+    if policy not in (REJECT, SKIP, OVERWRITE):
+        raise ValueError(f"Unknown conflict policy: '{policy}'")
+    return policy
+
+
+# ----------------------------------------------------------------------
+def drop_duplicates(
+    columns: dict[str, np.ndarray], keys: list[str]
+) -> dict[str, np.ndarray]:
+    """
+    Keep the last row of every key, in the original order.
+
+    Parameters
+    ----------
+    columns : dict[str, np.ndarray]
+        The data to write, keyed by column name.
+    keys : list[str]
+        The columns that identify a row.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The columns without repeated keys.
+    """
+    # lexsort is stable, so the last row of each key is the last of its run
+    order = np.lexsort([columns[key] for key in reversed(keys)])
+    last = np.ones(order.size, dtype=bool)
+    if order.size:
+        last[:-1] = np.any(
+            [
+                columns[key][order][1:] != columns[key][order][:-1]
+                for key in keys
+            ],
+            axis=0,
+        )
+    if last.all():
+        return columns
+    keep = np.sort(order[last])
+    return {name: array[keep] for name, array in columns.items()}
+
+
+# ----------------------------------------------------------------------
+def write_columns(
+    model: Type[Model],
+    columns: dict[str, np.ndarray],
+    using: Optional[str] = None,
+    on_conflict: str = REJECT,
+) -> WriteResult:
+    """
+    Write the columns and the channel count increments in one transaction.
+
+    The channel counts are increased by the number of samples actually
+    inserted, so skipped or overwritten duplicates are not counted, and by
+    the change of the number of samples of the overwritten rows. The
+    blocks of `TimeSerieBlock` that overlap other blocks of their channel
+    are skipped with the 'skip' policy, and refused with the others, see
+    `overlapping_blocks`. Models
+    that hold several samples per row name the column with their number in
+    a `SAMPLES_COLUMN` attribute, and tables without a 'channel_id' column,
+    that hold several channels per row, are not counted by channel.
+
+    Parameters
+    ----------
+    model : Type[Model]
+        The model whose table receives the rows.
+    columns : dict[str, np.ndarray]
+        The data to write, keyed by database column name.
+    using : str, optional
+        The database alias, by default the one given by the router.
+    on_conflict : str, optional
+        The conflict policy, 'reject' (default), 'skip' or 'overwrite'.
+
+    Returns
+    -------
+    WriteResult
+        The number of rows inserted, updated and skipped.
+    """
+    using = using or router.db_for_write(model)
+    with transaction.atomic(using=using):
+        overlapped = 0
+        if model is TimeSerieBlock and len(columns['n']):
+            overlaps = overlapping_blocks(columns, using=using)
+            if overlaps.any() and on_conflict != SKIP:
+                raise IntegrityError(
+                    "The blocks overlap the blocks already stored for their channel."
+                )
+            overlapped = int(columns['n'][overlaps].sum())
+            if overlaps.all():
+                return WriteResult(0, 0, overlapped, {})
+            columns = {name: array[~overlaps] for name, array in columns.items()}
+
+        result = get_ingest_engine(using).write(
+            model,
+            columns,
+            using=using,
+            on_conflict=on_conflict,
+            count_by='channel_id' if 'channel_id' in columns else None,
+            weight=getattr(model, 'SAMPLES_COLUMN', None),
+        )
+        add_counts(result.counts, using=using)
+    return result._replace(skipped=result.skipped + overlapped)
+
+
+# ----------------------------------------------------------------------
+def write_slices(
+    slices: Iterable[tuple[Type[Model], dict[str, np.ndarray]]],
+    using: str,
+    on_conflict: str = REJECT,
+) -> WriteResult:
+    """
+    Write a sequence of column slices in one transaction.
+
+    The slices are consumed one at a time, so only one of them has to be
+    in memory when they are produced by a generator.
+
+    Parameters
+    ----------
+    slices : Iterable[tuple[Type[Model], dict[str, np.ndarray]]]
+        The model whose table receives each slice, and its columns, see
+        `write_columns`.
+    using : str
+        The database alias.
+    on_conflict : str, optional
+        The conflict policy, 'reject' (default), 'skip' or 'overwrite'.
+
+    Returns
+    -------
+    WriteResult
+        The totals of all the slices.
+    """
+    inserted = updated = skipped = 0
+    counts = {}
+    with transaction.atomic(using=using):
+        for model, columns in slices:
+            result = write_columns(
+                model, columns, using=using, on_conflict=on_conflict
+            )
+            inserted += result.inserted
+            updated += result.updated
+            skipped += result.skipped
+            for key, rows in result.counts.items():
+                counts[key] = counts.get(key, 0) + rows
+    return WriteResult(inserted, updated, skipped, counts)
+
+
+# ----------------------------------------------------------------------
+def merge_tables(
+    writes: Iterable[dict[Type[Model], dict[str, np.ndarray]]]
+) -> dict[Type[Model], dict[str, np.ndarray]]:
+    """
+    Concatenate the columns of several writes, table by table.
+
+    Parameters
+    ----------
+    writes : Iterable[dict[Type[Model], dict[str, np.ndarray]]]
+        The columns of each write, keyed by the model of their table.
+
+    Returns
+    -------
+    dict[Type[Model], dict[str, np.ndarray]]
+        The concatenated columns of each table.
+    """
+    parts = {}
+    for tables in writes:
+        for model, columns in tables.items():
+            parts.setdefault(model, []).append(columns)
+    return {
+        model: {
+            name: np.concatenate([columns[name] for columns in part])
+            for name in part[0]
+        }
+        for model, part in parts.items()
+    }
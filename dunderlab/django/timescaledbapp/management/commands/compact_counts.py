@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dunderlab.django.timescaledbapp.counters import compact_counts
+
+
+class Command(BaseCommand):
+    help = 'Fold the pending channel count deltas into Channel.count.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Keep running and compact every INTERVAL seconds.',
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            channels = compact_counts()
+            self.stdout.write(f'{channels} channel counts compacted')
+            if not kwargs['interval']:
+                break
+            time.sleep(kwargs['interval'])
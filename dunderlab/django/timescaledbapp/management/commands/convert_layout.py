@@ -0,0 +1,264 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+
+from dunderlab.django.timescaledbapp.blocks import block_columns, unpack_blocks
+from dunderlab.django.timescaledbapp.cache import ChannelMetadata
+from dunderlab.django.timescaledbapp.converters import from_datetimes
+from dunderlab.django.timescaledbapp.counters import add_counts
+from dunderlab.django.timescaledbapp.ingest import get_ingest_engine
+from dunderlab.django.timescaledbapp.models import (
+    LAYOUTS,
+    Measure,
+    TimeSerieBlock,
+    TimeSerieWide,
+    timeserie_model,
+)
+from dunderlab.django.timescaledbapp.wide import pack_rows, unpack_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the samples of a measure between the row layout and the '
+        'block or wide layouts. Stop the ingest of the measure while it runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='The label of the source.')
+        parser.add_argument('measure', help='The label of the measure.')
+        parser.add_argument(
+            'layout', choices=[layout for layout, _ in LAYOUTS]
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100000,
+            help='Rows read at once from the tables of the current layout.',
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            measure = Measure.objects.get(
+                source_id=kwargs['source'], label=kwargs['measure']
+            )
+        except Measure.DoesNotExist:
+            raise CommandError(
+                f"Measure '{kwargs['measure']}' of source "
+                f"'{kwargs['source']}' does not exist."
+            )
+        layout = kwargs['layout']
+        if measure.layout == layout:
+            self.stdout.write(f"The measure already has the '{layout}' layout")
+            return
+
+        convert = {
+            ('row', 'block'): self.rows_to_blocks,
+            ('block', 'row'): self.blocks_to_rows,
+            ('row', 'wide'): self.rows_to_wide,
+            ('wide', 'row'): self.wide_to_rows,
+        }.get((measure.layout, layout))
+        if convert is None:
+            raise CommandError(
+                f"Convert the '{measure.layout}' measure to the 'row' layout "
+                f"first."
+            )
+
+        channels = [
+            ChannelMetadata(
+                channel.id,
+                channel.scale_factor,
+                channel.storage,
+                channel.sampling_rate,
+                channel.index,
+            )
+            for channel in measure.channels.all()
+        ]
+        if layout == 'wide' and any(c.index is None for c in channels):
+            raise CommandError('Every channel needs an index.')
+
+        using = router.db_for_write(TimeSerieBlock)
+        samples = 0
+        with transaction.atomic(using=using):
+            for chunk_id in measure.chunks.values_list('id', flat=True):
+                samples += convert(
+                    channels, chunk_id, using, kwargs['batch_size']
+                )
+            measure.layout = layout
+            measure.save(update_fields=['layout'])
+
+        self.stdout.write(
+            f"{samples} samples converted to the '{layout}' layout"
+        )
+
+    def rows_to_blocks(self, channels, chunk_id, using, batch_size):
+        """Pack the rows of each channel of a chunk into blocks."""
+        engine = get_ingest_engine(using)
+        samples = 0
+        for channel in channels:
+            queryset = timeserie_model(channel.storage).objects.using(
+                using
+            ).filter(channel_id=channel.id, chunk_id=chunk_id)
+            batch = queryset.order_by('timestamp')
+            while rows := list(
+                batch.values_list('timestamp', 'value')[:batch_size]
+            ):
+                timestamps, values = zip(*rows)
+                columns = block_columns(
+                    from_datetimes(timestamps),
+                    {'': np.array(values, dtype=channel.storage)},
+                    {'': channel},
+                    chunk_id,
+                )
+                engine.write(TimeSerieBlock, columns, using=using, weight='n')
+                samples += len(rows)
+                batch = queryset.filter(timestamp__gt=rows[-1][0]).order_by(
+                    'timestamp'
+                )
+            queryset.delete()
+        return samples
+
+    def blocks_to_rows(self, channels, chunk_id, using, batch_size):
+        """Unpack the blocks of each channel of a chunk into rows."""
+        engine = get_ingest_engine(using)
+        samples = 0
+        for channel in channels:
+            queryset = TimeSerieBlock.objects.using(using).filter(
+                channel_id=channel.id, chunk_id=chunk_id
+            )
+            batch = queryset.order_by('block_start')
+            while blocks := list(
+                batch.values_list(
+                    'block_start', 'n', 'sample_period', 'values', 'offsets'
+                )[:batch_size]
+            ):
+                starts, ns, periods, values, offsets = zip(*blocks)
+                timestamps, values = unpack_blocks(
+                    from_datetimes(starts), ns, periods, values, offsets,
+                    channel.storage,
+                )
+                engine.write(
+                    timeserie_model(channel.storage),
+                    self.row_columns(timestamps, values, channel, chunk_id),
+                    using=using,
+                )
+                samples += len(values)
+                batch = queryset.filter(
+                    block_start__gt=blocks[-1][0]
+                ).order_by('block_start')
+            queryset.delete()
+        return samples
+
+    def rows_to_wide(self, channels, chunk_id, using, batch_size):
+        """
+        Join the rows of every channel of a chunk into wide rows.
+
+        The samples of the wide rows are not counted by channel, so they are
+        removed from the channel counts.
+        """
+        engine = get_ingest_engine(using)
+        querysets = [
+            timeserie_model(channel.storage).objects.using(using).filter(
+                channel_id=channel.id, chunk_id=chunk_id
+            ).order_by('timestamp')
+            for channel in channels
+        ]
+        width = max((channel.index + 1 for channel in channels), default=0)
+        samples = 0
+        after = None
+        while True:
+            batches = [
+                list(
+                    (
+                        queryset
+                        if after is None
+                        else queryset.filter(timestamp__gt=after)
+                    ).values_list('timestamp', 'value')[:batch_size]
+                )
+                for queryset in querysets
+            ]
+            if not any(batches):
+                break
+
+            # Only the timestamps read from every channel are complete
+            full = [rows[-1][0] for rows in batches if len(rows) == batch_size]
+            until = min(full) if full else None
+            batches = [
+                [row for row in rows if until is None or row[0] <= until]
+                for rows in batches
+            ]
+
+            times = [from_datetimes([t for t, _ in rows]) for rows in batches]
+            timestamps = np.unique(np.concatenate(times))
+            matrix = np.full((len(timestamps), width), np.nan)
+            for channel, rows, channel_times in zip(channels, batches, times):
+                if rows:
+                    matrix[
+                        np.searchsorted(timestamps, channel_times),
+                        channel.index,
+                    ] = [value for _, value in rows]
+            engine.write(
+                TimeSerieWide,
+                pack_rows(timestamps, matrix, chunk_id),
+                using=using,
+                weight='n',
+            )
+            samples += sum(map(len, batches))
+            add_counts(
+                {
+                    channel.id: -len(rows)
+                    for channel, rows in zip(channels, batches)
+                },
+                using=using,
+            )
+            if until is None:
+                break
+            after = until
+
+        for queryset in querysets:
+            queryset.delete()
+        return samples
+
+    def wide_to_rows(self, channels, chunk_id, using, batch_size):
+        """Split the wide rows of a chunk into the counted rows of every channel."""
+        engine = get_ingest_engine(using)
+        queryset = TimeSerieWide.objects.using(using).filter(chunk_id=chunk_id)
+        samples = 0
+        batch = queryset.order_by('timestamp')
+        while rows := list(batch.values_list('timestamp', 'values')[:batch_size]):
+            timestamps, values = zip(*rows)
+            timestamps = from_datetimes(timestamps)
+            matrix = unpack_rows([bytes(packed) for packed in values])
+            for channel in channels:
+                if channel.index is None or channel.index >= matrix.shape[1]:
+                    continue
+                column = matrix[:, channel.index]
+                present = ~np.isnan(column)
+                if not present.any():
+                    continue
+                values = column[present]
+                if channel.storage != 'float64':
+                    values = np.rint(values).astype(channel.storage)
+                engine.write(
+                    timeserie_model(channel.storage),
+                    self.row_columns(
+                        timestamps[present], values, channel, chunk_id
+                    ),
+                    using=using,
+                )
+                samples += int(present.sum())
+                add_counts({channel.id: int(present.sum())}, using=using)
+            batch = queryset.filter(timestamp__gt=rows[-1][0]).order_by(
+                'timestamp'
+            )
+        queryset.delete()
+        return samples
+
+    @staticmethod
+    def row_columns(timestamps, values, channel, chunk_id):
+        """Return the columns of the rows of a channel."""
+        return {
+            'timestamp': timestamps,
+            'value': values,
+            'channel_id': np.full(len(values), channel.id, dtype=np.int32),
+            'chunk_id': np.full(len(values), chunk_id, dtype=np.int32),
+        }
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0002_timescaledb"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChannelCountDelta",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("delta", models.BigIntegerField(verbose_name="Delta")),
+                (
+                    "channel",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="count_deltas",
+                        to="timescaledbapp.channel",
+                    ),
+                ),
+            ],
+        ),
+    ]
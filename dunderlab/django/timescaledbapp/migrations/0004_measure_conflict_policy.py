@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0003_channelcountdelta"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="measure",
+            name="conflict_policy",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("reject", "Reject"),
+                    ("skip", "Skip duplicates"),
+                    ("overwrite", "Overwrite"),
+                ],
+                max_length=16,
+                null=True,
+                verbose_name="Conflict policy",
+            ),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+# ----------------------------------------------------------------------
+def create_hypertable(table: str, value_type: str) -> str:
+    """Return the SQL that creates a timeserie hypertable for a value type."""
+    return f"CREATE TABLE public.{table} ( \
+        timestamp timestamp NOT NULL, \
+        value {value_type} NOT NULL, \
+        channel_id int4 NOT NULL, \
+        chunk_id int4 NOT NULL, \
+        CONSTRAINT {table}_pkey PRIMARY KEY (timestamp, channel_id, chunk_id) \
+    );\
+    SELECT create_hypertable('{table}', 'timestamp', chunk_time_interval => interval '{settings.TIMESCALEDB_CHUNK_INTERVAL}');\
+    SELECT add_retention_policy('{table}', INTERVAL '{settings.TIMESCALEDB_RETENTION_INTERVAL}', schedule_interval => INTERVAL '{settings.TIMESCALEDB_SCHEDULE_INTERVAL}');"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0004_measure_conflict_policy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimeSerieInt16",
+            fields=[
+                (
+                    "timestamp",
+                    models.DateTimeField(
+                        primary_key=True, serialize=False, verbose_name="Timestamp"
+                    ),
+                ),
+                ("value", models.SmallIntegerField(verbose_name="Value")),
+            ],
+            options={
+                "db_table": "timescaledbapp_timeserie_int16",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="TimeSerieInt32",
+            fields=[
+                (
+                    "timestamp",
+                    models.DateTimeField(
+                        primary_key=True, serialize=False, verbose_name="Timestamp"
+                    ),
+                ),
+                ("value", models.IntegerField(verbose_name="Value")),
+            ],
+            options={
+                "db_table": "timescaledbapp_timeserie_int32",
+                "managed": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="channel",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("float64", "Float64 values"),
+                    ("int16", "Int16 counts"),
+                    ("int32", "Int32 counts"),
+                ],
+                default="float64",
+                max_length=16,
+                verbose_name="Storage",
+            ),
+        ),
+        migrations.RunSQL(
+            sql=[
+                create_hypertable("timescaledbapp_timeserie_int16", "int2"),
+                create_hypertable("timescaledbapp_timeserie_int32", "int4"),
+            ],
+            reverse_sql=[
+                "DROP TABLE public.timescaledbapp_timeserie_int16;",
+                "DROP TABLE public.timescaledbapp_timeserie_int32;",
+            ],
+        ),
+    ]
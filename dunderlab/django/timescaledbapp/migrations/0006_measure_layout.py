@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-16 12:00
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0005_channel_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimeSerieBlock",
+            fields=[
+                (
+                    "block_start",
+                    models.DateTimeField(
+                        primary_key=True, serialize=False, verbose_name="Block start"
+                    ),
+                ),
+                ("n", models.IntegerField(verbose_name="Samples")),
+                ("sample_period", models.FloatField(verbose_name="Sample period")),
+                ("values", models.BinaryField(verbose_name="Values")),
+                ("offsets", models.BinaryField(null=True, verbose_name="Offsets")),
+            ],
+            options={
+                "db_table": "timescaledbapp_timeserie_block",
+                "managed": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="measure",
+            name="layout",
+            field=models.CharField(
+                choices=[("row", "One row per sample"), ("block", "Array blocks")],
+                default="row",
+                max_length=16,
+                verbose_name="Layout",
+            ),
+        ),
+        migrations.RunSQL(
+            sql=[
+                (
+                    f"CREATE TABLE public.timescaledbapp_timeserie_block ( \
+                    block_start timestamp NOT NULL, \
+                    n int4 NOT NULL, \
+                    sample_period float NOT NULL, \
+                    \"values\" bytea NOT NULL, \
+                    offsets bytea, \
+                    channel_id int4 NOT NULL, \
+                    chunk_id int4 NOT NULL, \
+                    CONSTRAINT timescaledbapp_timeserie_block_pkey PRIMARY KEY (block_start, channel_id, chunk_id) \
+                );\
+                SELECT create_hypertable('timescaledbapp_timeserie_block', 'block_start', chunk_time_interval => interval '{settings.TIMESCALEDB_CHUNK_INTERVAL}');\
+                SELECT add_retention_policy('timescaledbapp_timeserie_block', INTERVAL '{settings.TIMESCALEDB_RETENTION_INTERVAL}', schedule_interval => INTERVAL '{settings.TIMESCALEDB_SCHEDULE_INTERVAL}');"
+                )
+            ],
+            reverse_sql=[("DROP TABLE public.timescaledbapp_timeserie_block;")],
+        ),
+    ]
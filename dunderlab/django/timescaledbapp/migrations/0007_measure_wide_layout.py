@@ -0,0 +1,81 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+def number_channels(apps, schema_editor):
+    """Give the existing channels of each measure an index, by creation order."""
+    Channel = apps.get_model("timescaledbapp", "Channel")
+    channels = Channel.objects.using(schema_editor.connection.alias).order_by(
+        "measure_id", "id"
+    )
+    indexes = {}
+    for channel in channels:
+        channel.index = indexes.get(channel.measure_id, 0)
+        indexes[channel.measure_id] = channel.index + 1
+        channel.save(update_fields=["index"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0006_measure_layout"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimeSerieWide",
+            fields=[
+                (
+                    "timestamp",
+                    models.DateTimeField(
+                        primary_key=True, serialize=False, verbose_name="Timestamp"
+                    ),
+                ),
+                ("n", models.IntegerField(verbose_name="Samples")),
+                ("values", models.BinaryField(verbose_name="Values")),
+            ],
+            options={
+                "db_table": "timescaledbapp_timeserie_wide",
+                "managed": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="channel",
+            name="index",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Index"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="measure",
+            name="layout",
+            field=models.CharField(
+                choices=[
+                    ("row", "One row per sample"),
+                    ("block", "Array blocks"),
+                    ("wide", "One row per timestamp"),
+                ],
+                default="row",
+                max_length=16,
+                verbose_name="Layout",
+            ),
+        ),
+        migrations.RunPython(number_channels, migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql=[
+                (
+                    f"CREATE TABLE public.timescaledbapp_timeserie_wide ( \
+                    timestamp timestamp NOT NULL, \
+                    n int4 NOT NULL, \
+                    \"values\" bytea NOT NULL, \
+                    chunk_id int4 NOT NULL, \
+                    CONSTRAINT timescaledbapp_timeserie_wide_pkey PRIMARY KEY (timestamp, chunk_id) \
+                );\
+                SELECT create_hypertable('timescaledbapp_timeserie_wide', 'timestamp', chunk_time_interval => interval '{settings.TIMESCALEDB_CHUNK_INTERVAL}');\
+                SELECT add_retention_policy('timescaledbapp_timeserie_wide', INTERVAL '{settings.TIMESCALEDB_RETENTION_INTERVAL}', schedule_interval => INTERVAL '{settings.TIMESCALEDB_SCHEDULE_INTERVAL}');"
+                )
+            ],
+            reverse_sql=[("DROP TABLE public.timescaledbapp_timeserie_wide;")],
+        ),
+    ]
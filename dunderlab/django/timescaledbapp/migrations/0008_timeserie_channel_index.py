@@ -0,0 +1,30 @@
+# Generated manually
+
+from django.db import migrations
+
+
+TABLES = [
+    "timescaledbapp_timeserie",
+    "timescaledbapp_timeserie_int16",
+    "timescaledbapp_timeserie_int32",
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0007_measure_wide_layout"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f"CREATE INDEX IF NOT EXISTS {table}_channel_timestamp_idx \
+                ON public.{table} (channel_id, timestamp, chunk_id);"
+                for table in TABLES
+            ],
+            reverse_sql=[
+                f"DROP INDEX IF EXISTS public.{table}_channel_timestamp_idx;"
+                for table in TABLES
+            ],
+        ),
+    ]
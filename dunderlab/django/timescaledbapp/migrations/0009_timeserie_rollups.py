@@ -0,0 +1,58 @@
+# Generated manually
+
+from django.db import migrations
+from django.conf import settings
+
+
+TABLES = [
+    "timescaledbapp_timeserie",
+    "timescaledbapp_timeserie_int16",
+    "timescaledbapp_timeserie_int32",
+]
+
+# The default levels: bucket width, start offset, end offset and schedule
+# interval of their refresh policy, added only when the start offset is
+# shorter than the retention interval of the samples.
+LEVELS = {
+    "1s": ("1 second", "1 hour", "1 second", "1 minute"),
+    "1min": ("1 minute", "1 day", "1 minute", "10 minutes"),
+    "1h": ("1 hour", "7 days", "1 hour", "1 hour"),
+}
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0008_timeserie_channel_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS public.\"{table}_{level}\" \
+                WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS \
+                SELECT time_bucket(INTERVAL '{width}', timestamp) AS bucket, \
+                    channel_id, \
+                    chunk_id, \
+                    min(value) AS min_value, \
+                    max(value) AS max_value, \
+                    sum(value::float8) AS sum_value, \
+                    count(*) AS count_value \
+                FROM public.{table} \
+                GROUP BY bucket, channel_id, chunk_id \
+                WITH NO DATA; \
+                SELECT add_continuous_aggregate_policy('\"{table}_{level}\"', \
+                    start_offset => INTERVAL '{start_offset}', \
+                    end_offset => INTERVAL '{end_offset}', \
+                    schedule_interval => INTERVAL '{schedule_interval}', \
+                    if_not_exists => true) \
+                WHERE INTERVAL '{start_offset}' < INTERVAL '{settings.TIMESCALEDB_RETENTION_INTERVAL}';"
+                for level, (width, start_offset, end_offset, schedule_interval) in LEVELS.items()
+                for table in TABLES
+            ],
+            reverse_sql=[
+                f"DROP MATERIALIZED VIEW IF EXISTS public.\"{table}_{level}\";"
+                for level in LEVELS
+                for table in TABLES
+            ],
+        ),
+    ]
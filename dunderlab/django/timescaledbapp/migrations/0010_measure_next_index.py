@@ -0,0 +1,63 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def number_channels(apps, schema_editor):
+    """
+    Start the channel counter of each measure after its highest index.
+
+    The channels that share an index with an older channel of their measure
+    get a new one, so the unique constraint can be added.
+    """
+    Measure = apps.get_model("timescaledbapp", "Measure")
+    Channel = apps.get_model("timescaledbapp", "Channel")
+    using = schema_editor.connection.alias
+
+    channels = list(
+        Channel.objects.using(using)
+        .filter(index__isnull=False)
+        .order_by("measure_id", "id")
+    )
+    next_indexes = {}
+    for channel in channels:
+        next_indexes[channel.measure_id] = max(
+            next_indexes.get(channel.measure_id, 0), channel.index + 1
+        )
+
+    seen = set()
+    for channel in channels:
+        if (channel.measure_id, channel.index) in seen:
+            channel.index = next_indexes[channel.measure_id]
+            next_indexes[channel.measure_id] += 1
+            channel.save(update_fields=["index"])
+        seen.add((channel.measure_id, channel.index))
+
+    for measure_id, next_index in next_indexes.items():
+        Measure.objects.using(using).filter(pk=measure_id).update(
+            next_index=next_index
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("timescaledbapp", "0009_timeserie_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="measure",
+            name="next_index",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Next channel index"
+            ),
+        ),
+        migrations.RunPython(number_channels, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="channel",
+            constraint=models.UniqueConstraint(
+                fields=("measure", "index"),
+                name="timescaledbapp_channel_measure_index_unique",
+            ),
+        ),
+    ]
@@ -17,13 +17,18 @@ indicating when it was created.
 .. rubric:: Measure
 
 Represents a measure taken by a source. Each measure has a label, a name, a
-description, and is linked to a specific source.
+description, is linked to a specific source, and can set the conflict policy
+used when its samples are ingested again. Its layout selects whether the
+samples are stored one per row, packed in array blocks, or stored as one row
+per timestamp with the values of all the channels.
 
 .. rubric:: Channel
 
 Represents a channel of a measure. Each channel has a label, a name, a unit, a
 sampling rate, a description, is linked to a specific measure, and has a count
-of the number of times it has been used.
+of the number of times it has been used. Its storage mode selects the table
+that keeps its samples, and its index is its position in the rows of the
+'wide' layout.
 
 .. rubric:: Chunk
 
@@ -35,6 +40,29 @@ specific measure.
 Represents a time series data point. Each data point has a timestamp, a value,
 is linked to a specific channel and chunk.
 
+.. rubric:: TimeSerieInt16 and TimeSerieInt32
+
+The same data points for the channels that store raw converter counts, as
+16 or 32 bit integers, which are multiplied by `Channel.scale_factor` when
+read.
+
+.. rubric:: TimeSerieBlock
+
+Represents a block of consecutive samples of a channel, for the measures with
+the 'block' layout. Each block has a start, a number of samples, a sample
+period and the packed values, see :mod:`.blocks`.
+
+.. rubric:: TimeSerieWide
+
+Represents the samples of all the channels of a measure at one timestamp, for
+the measures with the 'wide' layout, see :mod:`.wide`.
+
+.. rubric:: ChannelCountDelta
+
+Represents a pending increment of the sample count of a channel. Ingest appends
+these rows instead of updating the channel, and they are folded into
+`Channel.count` by the counter compaction (see :mod:`.counters`).
+
 Each of these models corresponds to a table in the database, and each attribute
 of a model corresponds to a field in the table. The relationships between the
 models (such as the ForeignKey fields) represent database relationships (such
@@ -45,6 +73,24 @@ as foreign key constraints).
 from django.db import models
 from django.utils.translation import gettext as _
 
+CONFLICT_POLICIES = [
+    ('reject', 'Reject'),
+    ('skip', 'Skip duplicates'),
+    ('overwrite', 'Overwrite'),
+]
+
+LAYOUTS = [
+    ('row', 'One row per sample'),
+    ('block', 'Array blocks'),
+    ('wide', 'One row per timestamp'),
+]
+
+STORAGE_MODES = [
+    ('float64', 'Float64 values'),
+    ('int16', 'Int16 counts'),
+    ('int32', 'Int32 counts'),
+]
+
 
 ########################################################################
 class Source(models.Model):
@@ -72,6 +118,9 @@ class Measure(models.Model):
     name = models.CharField('Name', max_length=2**8)
     description = models.TextField('Description', max_length=2**15, null=True, blank=True)
     source = models.ForeignKey('Source', on_delete=models.CASCADE, related_name='measures')
+    conflict_policy = models.CharField('Conflict policy', max_length=2**4, choices=CONFLICT_POLICIES, null=True, blank=True)
+    layout = models.CharField('Layout', max_length=2**4, choices=LAYOUTS, default='row')
+    next_index = models.PositiveIntegerField('Next channel index', default=0)
 
     class Meta:
         unique_together = ('source', 'label')
@@ -91,9 +140,17 @@ class Channel(models.Model):
     measure = models.ForeignKey('Measure', on_delete=models.CASCADE, related_name='channels')
     count = models.IntegerField('Count', default=0)
     scale_factor = models.FloatField('Scale factor', default=1)
+    storage = models.CharField('Storage', max_length=2**4, choices=STORAGE_MODES, default='float64')
+    index = models.PositiveIntegerField('Index', null=True, blank=True)
 
     class Meta:
         unique_together = ('measure', 'label')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['measure', 'index'],
+                name='timescaledbapp_channel_measure_index_unique',
+            ),
+        ]
 
 
 ########################################################################
@@ -130,3 +187,102 @@ class TimeSerie(models.Model):
         managed = False
         db_table = 'timescaledbapp_timeserie'
         unique_together = ('timestamp', 'channel', 'chunk')
+
+
+########################################################################
+class TimeSerieInt16(models.Model):
+    """
+    The TimeSerieInt16 model stores the raw counts of the channels with the 'int16' storage. The values
+    are multiplied by the scale factor of the channel when they are read.
+    """
+    timestamp = models.DateTimeField('Timestamp', primary_key=True)
+    value = models.SmallIntegerField('Value')
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='timeseries_int16', db_column='channel_id', db_index=True)
+    chunk = models.ForeignKey('Chunk', on_delete=models.CASCADE, related_name='timeseries_int16', db_column='chunk_id', db_index=True)
+
+    class Meta:
+        managed = False
+        db_table = 'timescaledbapp_timeserie_int16'
+        unique_together = ('timestamp', 'channel', 'chunk')
+
+
+########################################################################
+class TimeSerieInt32(models.Model):
+    """
+    The TimeSerieInt32 model stores the raw counts of the channels with the 'int32' storage. The values
+    are multiplied by the scale factor of the channel when they are read.
+    """
+    timestamp = models.DateTimeField('Timestamp', primary_key=True)
+    value = models.IntegerField('Value')
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='timeseries_int32', db_column='channel_id', db_index=True)
+    chunk = models.ForeignKey('Chunk', on_delete=models.CASCADE, related_name='timeseries_int32', db_column='chunk_id', db_index=True)
+
+    class Meta:
+        managed = False
+        db_table = 'timescaledbapp_timeserie_int32'
+        unique_together = ('timestamp', 'channel', 'chunk')
+
+
+########################################################################
+class TimeSerieBlock(models.Model):
+    """
+    The TimeSerieBlock model represents a block of consecutive samples of a channel. The values are packed
+    with the dtype of the channel storage, and the timestamps are `block_start` plus a multiple of
+    `sample_period`, or `block_start` plus the packed `offsets` for irregular samples.
+    """
+    block_start = models.DateTimeField('Block start', primary_key=True)
+    n = models.IntegerField('Samples')
+    sample_period = models.FloatField('Sample period')
+    values = models.BinaryField('Values')
+    offsets = models.BinaryField('Offsets', null=True)
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='blocks', db_column='channel_id', db_index=True)
+    chunk = models.ForeignKey('Chunk', on_delete=models.CASCADE, related_name='blocks', db_column='chunk_id', db_index=True)
+
+    # Column with the number of samples of a row, used to count the samples written
+    SAMPLES_COLUMN = 'n'
+
+    class Meta:
+        managed = False
+        db_table = 'timescaledbapp_timeserie_block'
+        unique_together = ('block_start', 'channel', 'chunk')
+
+
+########################################################################
+class TimeSerieWide(models.Model):
+    """
+    The TimeSerieWide model stores the samples of all the channels of a measure at one timestamp. The values
+    are packed as little-endian float64, at the `index` of each channel, with NaN for the missing channels.
+    """
+    timestamp = models.DateTimeField('Timestamp', primary_key=True)
+    n = models.IntegerField('Samples')
+    values = models.BinaryField('Values')
+    chunk = models.ForeignKey('Chunk', on_delete=models.CASCADE, related_name='rows', db_column='chunk_id', db_index=True)
+
+    # Column with the number of samples of a row, used to count the samples written
+    SAMPLES_COLUMN = 'n'
+
+    class Meta:
+        managed = False
+        db_table = 'timescaledbapp_timeserie_wide'
+        unique_together = ('timestamp', 'chunk')
+
+
+# ----------------------------------------------------------------------
+def timeserie_model(storage: str) -> type[models.Model]:
+    """Return the model that keeps the samples of a channel storage mode."""
+    return {
+        'float64': TimeSerie,
+        'int16': TimeSerieInt16,
+        'int32': TimeSerieInt32,
+    }[storage]
+
+
+########################################################################
+class ChannelCountDelta(models.Model):
+    """
+    The ChannelCountDelta model represents a pending increment of the count of a channel. Rows are only
+    inserted during ingest, so concurrent writers never lock the Channel rows, and they are compacted into
+    `Channel.count` in the background.
+    """
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='count_deltas')
+    delta = models.BigIntegerField('Delta')
@@ -18,13 +18,23 @@ The maximum allowed page size is 10000.
 .. rubric:: TimeseriePaginator
 
 A custom Paginator class specifically for time series data. It overrides the `count` property to return
-the count of the first channel in the object list.
+the count of the channel of a QuerySet of samples, as kept by :mod:`.counters`, and the length of any
+other sequence.
 
 .. rubric:: TimeseriePagination
 
 This class is a custom pagination class specifically for time series data. It sets the page size to 1024
 and allows the client to override this with the `page_size` query parameter.
-It uses the TimeseriePaginator class for Django's paginator.
+It uses the TimeseriePaginator class for Django's paginator, and returns the pages unevaluated, so that
+the samples can be read into NumPy arrays by :mod:`.fetch`.
+
+.. rubric:: TimeserieCursorPagination
+
+This class is a keyset pagination class for the samples of several channels of the 'row' layout. The
+pages are ordered by `(timestamp, channel_id, chunk_id)` and each one starts after the last key of the
+previous page, given by an opaque `cursor` token, so reading a page costs the same at any depth and
+the samples inserted meanwhile do not shift the pages. It is selected with the `cursor` or
+`pagination=cursor` query parameters, and returns `next` and `previous` links without a `count`.
 
 .. rubric:: Paginationx64
 
@@ -35,9 +45,19 @@ Each of these classes is used by the API views to control how many objects are r
 
 """
 
-from rest_framework.pagination import PageNumberPagination
-from django.core.paginator import Paginator
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import QuerySet
 from django.utils.functional import cached_property
+import numpy as np
+
+from .counters import get_count
+from .fetch import keyset_columns
 
 
 ########################################################################
@@ -57,13 +77,11 @@ class TimeseriePaginator(Paginator):
     def count(self):
         """Returns the count of the first channel in the object list."""
 
-        if self.object_list:
-
-            if isinstance(self.object_list[0], tuple):
-                return len(self.object_list)
-            else:
-                return self.object_list[0].channel.count
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
 
+        if self.object_list:
+            return get_count(self.object_list[0].channel_id)
         else:
             return 0
 
@@ -75,6 +93,138 @@ class TimeseriePagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     django_paginator_class = TimeseriePaginator
 
+    # ----------------------------------------------------------------------
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Returns the objects of the requested page.
+
+        Unlike `PageNumberPagination`, the page is not converted into a list, so
+        the page of a QuerySet is still a sliced QuerySet.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page.object_list
+
+
+########################################################################
+class TimeserieCursorPagination(CursorPagination):
+    """A keyset pagination class for the samples of several channels."""
+    page_size = 1024
+    page_size_query_param = 'page_size'
+    ordering = ('timestamp', 'channel_id', 'chunk_id')
+
+    # ----------------------------------------------------------------------
+    @classmethod
+    def requested(cls, request) -> bool:
+        """Whether the request asks for keyset pagination."""
+        return (
+            cls.cursor_query_param in request.query_params
+            or request.query_params.get('pagination') == 'cursor'
+        )
+
+    # ----------------------------------------------------------------------
+    def paginate_channels(self, channels, request, view=None, timerange=(None, None)):
+        """
+        Returns the samples of the requested page, split by channel.
+
+        The page holds up to `page_size` samples times the number of channels,
+        the samples that follow the key of the cursor, or precede it for the
+        `previous` links, optionally within a time range.
+
+        Returns
+        -------
+        dict[int, tuple[np.ndarray, np.ndarray]]
+            The `timestamp` and `value` arrays of each channel id with samples
+            in the page.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        position, reverse = self.decode_position(self.cursor)
+
+        limit = self.page_size * max(len(channels), 1)
+        columns = keyset_columns(
+            channels, limit + 1, position, reverse, timerange
+        )
+        more = len(columns['timestamp']) > limit
+        if more:
+            window = slice(1, None) if reverse else slice(None, limit)
+            columns = {name: column[window] for name, column in columns.items()}
+
+        keys = list(
+            zip(columns['timestamp'], columns['channel_id'], columns['chunk_id'])
+        )
+        self.first = keys[0] if keys else position
+        self.last = keys[-1] if keys else position
+        self.has_next = more if not reverse else position is not None
+        self.has_previous = more if reverse else position is not None
+
+        # Stable, so each channel keeps the order of the keys
+        order = np.argsort(columns['channel_id'], kind='stable')
+        channel_ids = columns['channel_id'][order]
+        bounds = np.flatnonzero(np.diff(channel_ids)) + 1
+        return {
+            int(channel_ids[indexes[0]]): (
+                columns['timestamp'][order[indexes]],
+                columns['value'][order[indexes]],
+            )
+            for indexes in np.split(np.arange(len(order)), bounds)
+            if len(indexes)
+        }
+
+    # ----------------------------------------------------------------------
+    def decode_position(self, cursor):
+        """Returns the key and the direction of a decoded cursor."""
+        if cursor is None or cursor.position is None:
+            return None, bool(cursor and cursor.reverse)
+        try:
+            timestamp, channel_id, chunk_id = map(int, cursor.position.split('.'))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        return (
+            (np.datetime64(timestamp, 'us'), channel_id, chunk_id),
+            cursor.reverse,
+        )
+
+    # ----------------------------------------------------------------------
+    def encode_position(self, key, reverse):
+        """Returns the link of the page that follows, or precedes, a key."""
+        timestamp, channel_id, chunk_id = key
+        position = f'{timestamp.astype(np.int64)}.{channel_id}.{chunk_id}'
+        return self.encode_cursor(Cursor(0, reverse, position))
+
+    # ----------------------------------------------------------------------
+    def get_next_link(self):
+        """Returns the link of the page after the last key of this one."""
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_position(self.last, False)
+
+    # ----------------------------------------------------------------------
+    def get_previous_link(self):
+        """Returns the link of the page before the first key of this one."""
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_position(self.first, True)
+
 
 ########################################################################
 class Paginationx64(PageNumberPagination):
@@ -0,0 +1,400 @@
+"""
+======================
+Timescaledbapp Parsers
+======================
+
+This module provides request parsers for the timescaledbapp's API views.
+They turn compact columnar request bodies into the same structure that the
+JSON parser produces for `TimeserieSerializer`, with NumPy arrays in place
+of lists.
+
+Classes
+-------
+
+.. rubric:: StreamingJSONParser
+
+Parses a JSON timeserie upload while reading it, in fixed-size blocks. The
+`timestamps` array and the arrays in `values` are decoded block by block
+and copied into one NumPy array each, grown in place, so no Python object
+is built per sample and the decoded blocks are not kept. The memory used
+grows with the size of the decoded arrays, the body itself is not kept.
+Other JSON documents, such as lists of uploads, are parsed as usual.
+
+.. rubric:: JSONStreamReader
+
+The incremental reader used by `StreamingJSONParser`.
+
+.. rubric:: NpzParser
+
+Parses a NumPy `.npz` archive sent with the `application/x-npz` media type.
+The archive holds a `timestamps` array, or a scalar `t0`, and either a 2-D
+`values` array with a matching `channels` array of labels, or one
+`values.<label>` array per channel. The `source`, `measure`, `chunk` and `on_conflict` labels can be
+stored in the archive as string arrays or given as query parameters.
+
+Example
+-------
+
+    buffer = io.BytesIO()
+    np.savez(buffer, source='src', measure='m', timestamps=timestamps,
+             channels=['c0', 'c1'], values=np.stack([c0, c1]))
+    requests.post(url, data=buffer.getvalue(),
+                  headers={'Content-Type': 'application/x-npz'})
+
+"""
+
+import codecs
+import io
+import json
+import re
+import zipfile
+from typing import Any, Callable, Optional
+
+import numpy as np
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .converters import to_datetime64
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+FLOAT_CHARS = re.compile(r'[.eE]')
+
+
+########################################################################
+class NpzParser(BaseParser):
+    """
+    Parser for NumPy `.npz` archives with columnar timeserie data.
+
+    The arrays are loaded without per-element work, pickled objects are not
+    allowed.
+    """
+
+    media_type = 'application/x-npz'
+    labels = ('source', 'measure', 'chunk', 'on_conflict')
+
+    # ----------------------------------------------------------------------
+    def parse(
+        self,
+        stream: Any,
+        media_type: Optional[str] = None,
+        parser_context: Optional[dict[str, Any]] = None,
+    ) -> dict[str, Any]:
+        """
+        Parse the incoming bytestream as an `.npz` archive.
+
+        Parameters
+        ----------
+        stream : Any
+            The request body.
+        media_type : str, optional
+            The media type of the request.
+        parser_context : dict[str, Any], optional
+            The parser context, used to read the query parameters.
+
+        Returns
+        -------
+        dict[str, Any]
+            The timeserie data with `timestamps` and `values` as NumPy arrays.
+        """
+        parser_context = parser_context or {}
+        request = parser_context.get('request')
+        query_params = getattr(request, 'query_params', {})
+
+        try:
+            archive = np.load(io.BytesIO(stream.read()), allow_pickle=False)
+            arrays = {key: archive[key] for key in archive.files}
+        except (ValueError, OSError, zipfile.BadZipFile) as error:
+            raise ParseError(f"NPZ parse error - {error}")
+
+        data = {}
+        for label in self.labels:
+            if label in arrays:
+                data[label] = str(arrays.pop(label))
+            elif label in query_params:
+                data[label] = query_params[label]
+
+        if 'timestamps' in arrays:
+            data['timestamps'] = arrays.pop('timestamps')
+        if 't0' in arrays:
+            data['t0'] = arrays.pop('t0')[()]
+
+        values = {}
+        if 'values' in arrays:
+            matrix = np.atleast_2d(arrays.pop('values'))
+            channels = arrays.pop('channels', None)
+            if channels is None or len(channels) != matrix.shape[0]:
+                raise ParseError(
+                    "NPZ parse error - 'channels' must label every row of 'values'."
+                )
+            values.update(zip(map(str, channels), matrix))
+
+        for key in list(arrays):
+            if key.startswith('values.'):
+                values[key.removeprefix('values.')] = arrays.pop(key)
+
+        data['values'] = values
+        return data
+
+
+########################################################################
+class JSONStreamReader:
+    """
+    Incremental reader for a JSON timeserie document.
+
+    The stream is read in blocks of `block_size` bytes. Arrays of numbers
+    and of timestamp strings are converted to NumPy block by block, every
+    other value is decoded with the standard `json` module.
+
+    Parameters
+    ----------
+    stream : Any
+        A file-like object with a `read` method.
+    encoding : str, optional
+        The encoding of the body, by default 'utf-8'.
+    block_size : int, optional
+        The number of bytes read at once, by default 1 MiB.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, stream: Any, encoding: str = 'utf-8', block_size: int = 2**20
+    ) -> None:
+        """Initialize the reader with an empty buffer."""
+        self.stream = stream
+        self.block_size = block_size
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    # ----------------------------------------------------------------------
+    def fill(self) -> bool:
+        """Read the next block, return False at the end of the stream."""
+        if self.eof:
+            return False
+        data = self.stream.read(self.block_size)
+        self.buffer = self.buffer[self.pos :] + self.decoder.decode(
+            data, final=not data
+        )
+        self.pos = 0
+        self.eof = not data
+        return bool(data)
+
+    # ----------------------------------------------------------------------
+    def peek(self) -> str:
+        """Skip the whitespace and return the next character."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                break
+        return self.buffer[self.pos : self.pos + 1]
+
+    # ----------------------------------------------------------------------
+    def expect(self, char: str) -> None:
+        """Consume the next character, which must be `char`."""
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self.pos}.")
+        self.pos += 1
+
+    # ----------------------------------------------------------------------
+    def value(self) -> Any:
+        """Decode the next value with the standard JSON decoder."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number may continue in the next block
+            if end < len(self.buffer) or not self.fill():
+                self.pos = end
+                return value
+
+    # ----------------------------------------------------------------------
+    def array(self, convert: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        Decode the next array block by block.
+
+        Each block is copied into the array as soon as it is converted. The
+        array doubles its capacity in place when it is full, and is trimmed
+        at the end.
+
+        Parameters
+        ----------
+        convert : Callable[[list[str]], np.ndarray]
+            Converts the items of a block, as strings, into an array. The
+            integer blocks are promoted to float64 by the first float block.
+
+        Returns
+        -------
+        np.ndarray
+            The array, float64 when it is empty.
+
+        Raises
+        ------
+        ValueError
+            If the array is malformed, or mixes numbers and strings.
+        """
+        self.expect('[')
+        array = np.empty(0, dtype=np.float64)
+        length = 0
+        while True:
+            end = self.buffer.find(']', self.pos)
+            stop = end if end != -1 else self.buffer.rfind(',', self.pos)
+            if stop >= self.pos:
+                segment = self.buffer[self.pos : stop]
+                if segment.strip():
+                    block = convert(segment.split(','))
+                    if not length:
+                        array = np.empty(len(block), dtype=block.dtype)
+                    elif block.dtype != array.dtype:
+                        if 'M' in (block.dtype.kind, array.dtype.kind):
+                            raise ValueError("The array mixes numbers and strings.")
+                        array = array.astype(np.float64)
+                    if length + len(block) > len(array):
+                        array.resize(
+                            max(2 * len(array), length + len(block)),
+                            refcheck=False,
+                        )
+                    array[length : length + len(block)] = block
+                    length += len(block)
+                elif end == -1 or length:
+                    raise ValueError(f"Missing value at position {self.pos}.")
+                self.pos = stop + 1
+                if end != -1:
+                    array.resize(length, refcheck=False)
+                    return array
+            if not self.fill():
+                raise ValueError("Unterminated array.")
+
+    # ----------------------------------------------------------------------
+    def timestamps(self) -> np.ndarray:
+        """Decode an array of epoch numbers or of ISO 8601 strings."""
+        return self.array(self.timestamp_block)
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def timestamp_block(items: list[str]) -> np.ndarray:
+        """Convert a block of timestamps, strings are parsed right away."""
+        if items[0].lstrip().startswith('"'):
+            return to_datetime64([item.strip().strip('"') for item in items])
+        if any(FLOAT_CHARS.search(item) for item in items):
+            return np.array(items, dtype=np.float64)
+        return np.array(items, dtype=np.int64)
+
+    # ----------------------------------------------------------------------
+    def numbers(self) -> np.ndarray:
+        """Decode an array of numbers into a float64 array."""
+        return self.array(lambda items: np.array(items, dtype=np.float64))
+
+    # ----------------------------------------------------------------------
+    def values(self) -> dict[str, Any]:
+        """Decode the `values` object, one array per channel."""
+        self.expect('{')
+        values = {}
+        if self.peek() == '}':
+            self.pos += 1
+            return values
+
+        while True:
+            label = self.value()
+            self.expect(':')
+            if self.peek() == '[':
+                values[label] = self.numbers()
+            else:
+                values[label] = self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return values
+
+    # ----------------------------------------------------------------------
+    def document(self) -> Any:
+        """
+        Decode the whole document.
+
+        Objects are decoded field by field, with `timestamps` and `values`
+        streamed into NumPy arrays. Any other document is decoded at once.
+        """
+        if self.peek() != '{':
+            while self.fill():
+                pass
+            return json.loads(self.buffer[self.pos :])
+
+        self.expect('{')
+        data = {}
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                key = self.value()
+                self.expect(':')
+                if key == 'timestamps' and self.peek() == '[':
+                    data[key] = self.timestamps()
+                elif key == 'values' and self.peek() == '{':
+                    data[key] = self.values()
+                else:
+                    data[key] = self.value()
+                if self.peek() == ',':
+                    self.pos += 1
+                    continue
+                self.expect('}')
+                break
+
+        if self.peek():
+            raise ValueError(f"Extra data at position {self.pos}.")
+        return data
+
+
+########################################################################
+class StreamingJSONParser(BaseParser):
+    """
+    Parser for JSON timeserie uploads that decodes the arrays while reading.
+
+    The body is read in blocks of `TIMESCALEDB_JSON_BLOCK_SIZE` bytes, by
+    default 1 MiB.
+    """
+
+    media_type = 'application/json'
+
+    # ----------------------------------------------------------------------
+    def parse(
+        self,
+        stream: Any,
+        media_type: Optional[str] = None,
+        parser_context: Optional[dict[str, Any]] = None,
+    ) -> Any:
+        """
+        Parse the incoming bytestream as JSON.
+
+        Parameters
+        ----------
+        stream : Any
+            The request body.
+        media_type : str, optional
+            The media type of the request.
+        parser_context : dict[str, Any], optional
+            The parser context, used to read the encoding.
+
+        Returns
+        -------
+        Any
+            The parsed data, with `timestamps` and `values` as NumPy arrays
+            when the document is a single object.
+        """
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        reader = JSONStreamReader(
+            stream,
+            encoding=encoding,
+            block_size=getattr(settings, 'TIMESCALEDB_JSON_BLOCK_SIZE', 2**20),
+        )
+        try:
+            return reader.document()
+        except (ValueError, UnicodeDecodeError) as error:
+            raise ParseError(f"JSON parse error - {error}")
@@ -0,0 +1,552 @@
+"""
+======================
+Timescaledbapp Rollups
+======================
+
+This module provides the multi-resolution rollups of the time series, for
+the overviews of long periods without scanning the raw samples. For each
+level of `TIMESCALEDB_ROLLUPS`, e.g. ``'1min'``, every table of the 'row'
+layout has a TimescaleDB continuous aggregate, e.g.
+``timescaledbapp_timeserie_int16_1min``, with the minimum, maximum, sum and
+count of the values of each channel and chunk in buckets of the level width.
+The aggregates are refreshed by a policy, and read with real-time
+aggregation, so the latest buckets are completed from the raw samples.
+
+The levels are spelled canonically (see `buckets.format_width`), so
+``'1 s'``, ``'1.0s'`` and ``'1s'`` name the same aggregates. The levels
+that can be read are the continuous aggregates found in the database with
+their refresh policy, including the ones posted after the migrations, and
+are kept for the time to live of the `metadata_cache`.
+
+The list of timeseries picks the resolution from a time range and a budget
+of points per channel (`select_resolution`): the raw samples when they fit,
+otherwise buckets as wide as needed, aggregated from the coarsest rollup
+that is not wider, or from the raw samples with `time_bucket` for the
+narrow windows, and the aggregates the rollups do not keep (``first`` and
+``last``).
+
+The refresh policies are listed and replaced with `TimescaleConfigView`. The
+`start_offset` of a policy must be shorter than the retention interval of
+the raw samples, a refresh of the buckets of dropped samples deletes them,
+so the longer ones are refused (see `check_policies`).
+
+Functions
+---------
+
+.. rubric:: rollups_config
+
+Returns the refresh policy of each level.
+
+.. rubric:: level_label
+
+Returns the canonical spelling of a level.
+
+.. rubric:: rollup_levels
+
+Returns the levels found in the database and their widths, from the
+finest.
+
+.. rubric:: invalidate_levels
+
+Drops the levels cached by `rollup_levels`.
+
+.. rubric:: create_rollups
+
+Creates the continuous aggregates of some levels, and their policies.
+
+.. rubric:: drop_rollups
+
+Drops the continuous aggregates of some levels.
+
+.. rubric:: check_policies
+
+Checks the refresh policies of some levels against the retention interval.
+
+.. rubric:: set_rollup_policy
+
+Replaces the refresh policy of the continuous aggregates of a level.
+
+.. rubric:: rollup_policies
+
+Returns the refresh policy of each level, as set in the database.
+
+.. rubric:: select_resolution
+
+Picks the rollup level and bucket width for a time range and a budget of
+points.
+
+.. rubric:: rollup_columns
+
+Aggregates the buckets of a rollup level into wider buckets, for several
+channels.
+
+Settings
+--------
+
+``TIMESCALEDB_ROLLUPS``
+    The levels, keyed by width (see `buckets.parse_width`), with the
+    ``'START_OFFSET'``, ``'END_OFFSET'`` and ``'SCHEDULE_INTERVAL'``
+    PostgreSQL intervals of their refresh policy. By default ``'1s'``,
+    ``'1min'`` and ``'1h'``. The default levels are created by the
+    migrations, the others are posted to `TimescaleConfigView`.
+
+"""
+
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, router
+
+from .buckets import ORIGIN, format_width, parse_width, split_buckets
+from .cache import ChannelMetadata, metadata_cache
+from .fetch import query_columns, storage_channels
+from .models import STORAGE_MODES, timeserie_model
+
+# The refresh policy of each level, by default, for a retention interval
+# longer than 7 days.
+ROLLUPS = {
+    '1s': {
+        'START_OFFSET': '1 hour',
+        'END_OFFSET': '1 second',
+        'SCHEDULE_INTERVAL': '1 minute',
+    },
+    '1min': {
+        'START_OFFSET': '1 day',
+        'END_OFFSET': '1 minute',
+        'SCHEDULE_INTERVAL': '10 minutes',
+    },
+    '1h': {
+        'START_OFFSET': '7 days',
+        'END_OFFSET': '1 hour',
+        'SCHEDULE_INTERVAL': '1 hour',
+    },
+}
+
+# The aggregates that can be computed from the buckets of a rollup.
+ROLLUP_AGGREGATES = ('avg', 'min', 'max', 'sum', 'count')
+
+POLICY_FIELDS = ('start_offset', 'end_offset', 'schedule_interval')
+
+# The levels read from the database, until they expire.
+_levels = {'expires': 0.0, 'levels': []}
+_levels_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+def rollups_config() -> dict[str, dict[str, str]]:
+    """Return the refresh policy of each level, with lower case fields."""
+    return {
+        level_label(level): {
+            name.lower(): value for name, value in policy.items()
+        }
+        for level, policy in getattr(
+            settings, 'TIMESCALEDB_ROLLUPS', ROLLUPS
+        ).items()
+    }
+
+
+# ----------------------------------------------------------------------
+def level_label(level: str) -> str:
+    """Return the canonical spelling of a level, e.g. '1s' for '1.0 s'."""
+    return format_width(parse_width(level))
+
+
+# ----------------------------------------------------------------------
+def rollup_levels() -> list[tuple[str, np.timedelta64]]:
+    """
+    Return the levels found in the database and their widths, from the finest.
+
+    The levels are the continuous aggregates with a refresh policy, see
+    `rollup_policies`. They are read once for the time to live of the
+    `metadata_cache`, and again after the rollups are changed by this
+    process. Without PostgreSQL there are no levels.
+
+    Returns
+    -------
+    list[tuple[str, np.timedelta64]]
+        The level, as named in the database, and its width. Of the levels
+        with the same width, the canonical spelling is preferred.
+    """
+    with _levels_lock:
+        if _levels['expires'] > time.monotonic():
+            return _levels['levels']
+
+    connection = connections[router.db_for_read(timeserie_model('float64'))]
+    widths = {}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for level in rollup_policies(cursor):
+                width = parse_width(level)
+                if width not in widths or level == format_width(width):
+                    widths[width] = level
+    levels = [(level, width) for width, level in sorted(widths.items())]
+
+    if metadata_cache.ttl > 0:
+        with _levels_lock:
+            _levels.update(
+                expires=time.monotonic() + metadata_cache.ttl, levels=levels
+            )
+    return levels
+
+
+# ----------------------------------------------------------------------
+def invalidate_levels() -> None:
+    """Drop the levels cached by `rollup_levels`."""
+    with _levels_lock:
+        _levels.update(expires=0.0, levels=[])
+
+
+# ----------------------------------------------------------------------
+def rollup_view(storage: str, level: str, quote: bool = True) -> str:
+    """Return the name of the continuous aggregate of a table and level."""
+    name = f'{timeserie_model(storage)._meta.db_table}_{level}'
+    return f'"{name}"' if quote else name
+
+
+# ----------------------------------------------------------------------
+def create_rollups(
+    cursor: Any, levels: Optional[dict[str, dict[str, str]]] = None
+) -> None:
+    """
+    Create the continuous aggregates of some levels, and their policies.
+
+    The aggregates that already exist are kept, only their policy is
+    replaced. The levels are named with their canonical spelling.
+
+    Parameters
+    ----------
+    cursor : Any
+        A cursor of the TimescaleDB database.
+    levels : dict[str, dict[str, str]], optional
+        The refresh policy of each level, by default `rollups_config`.
+
+    Raises
+    ------
+    ValueError
+        If a policy is not valid, see `check_policies`. Nothing is created
+        then.
+    """
+    if levels is None:
+        levels = rollups_config()
+    check_policies(cursor, levels)
+    for level, policy in levels.items():
+        level = level_label(level)
+        width = int(parse_width(level) / np.timedelta64(1, 'us'))
+        for storage, _ in STORAGE_MODES:
+            table = timeserie_model(storage)._meta.db_table
+            cursor.execute(
+                f"""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS public.{rollup_view(storage, level)}
+                WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+                SELECT time_bucket(INTERVAL '{width} microseconds', timestamp) AS bucket,
+                    channel_id,
+                    chunk_id,
+                    min(value) AS min_value,
+                    max(value) AS max_value,
+                    sum(value::float8) AS sum_value,
+                    count(*) AS count_value
+                FROM public.{table}
+                GROUP BY bucket, channel_id, chunk_id
+                WITH NO DATA;
+                """
+            )
+        set_rollup_policy(cursor, level, policy)
+
+
+# ----------------------------------------------------------------------
+def drop_rollups(cursor: Any, levels: Optional[Iterable[str]] = None) -> None:
+    """Drop the continuous aggregates of some levels, by default all."""
+    for level in rollups_config() if levels is None else levels:
+        for storage, _ in STORAGE_MODES:
+            cursor.execute(
+                "DROP MATERIALIZED VIEW IF EXISTS "
+                f"public.{rollup_view(storage, level_label(level))};"
+            )
+    invalidate_levels()
+
+
+# ----------------------------------------------------------------------
+def check_policies(
+    cursor: Any,
+    levels: dict[str, dict[str, str]],
+    retention_interval: Optional[str] = None,
+) -> None:
+    """
+    Check the refresh policies of some levels.
+
+    Parameters
+    ----------
+    cursor : Any
+        A cursor of the TimescaleDB database.
+    levels : dict[str, dict[str, str]]
+        The refresh policy of each level.
+    retention_interval : str, optional
+        The retention interval of the raw samples, by default the shortest
+        `drop_after` of the retention policies of the 'row' tables, without
+        a limit when they have none.
+
+    Raises
+    ------
+    ValueError
+        If a field of a policy is missing, or its `start_offset` is not
+        shorter than the retention interval.
+    """
+    for level, policy in levels.items():
+        missing = [name for name in POLICY_FIELDS if not policy.get(name)]
+        if missing:
+            raise ValueError(
+                f"The policy of the rollup '{level}' misses {', '.join(missing)}."
+            )
+
+    if retention_interval is None:
+        cursor.execute(
+            """
+            SELECT min((config->>'drop_after')::interval)::text
+            FROM timescaledb_information.jobs
+            WHERE proc_name = 'policy_retention' AND hypertable_name = ANY(%s);
+            """,
+            [[timeserie_model(storage)._meta.db_table for storage, _ in STORAGE_MODES]],
+        )
+        retention_interval = cursor.fetchone()[0]
+        if retention_interval is None:
+            return
+
+    for level, policy in levels.items():
+        cursor.execute(
+            "SELECT %s::interval >= %s::interval;",
+            [policy['start_offset'], retention_interval],
+        )
+        if cursor.fetchone()[0]:
+            raise ValueError(
+                f"The start_offset of the rollup '{level}' must be shorter "
+                f"than the retention interval, {retention_interval}."
+            )
+
+
+# ----------------------------------------------------------------------
+def set_rollup_policy(cursor: Any, level: str, policy: dict[str, str]) -> None:
+    """
+    Replace the refresh policy of the continuous aggregates of a level.
+
+    Parameters
+    ----------
+    cursor : Any
+        A cursor of the TimescaleDB database.
+    level : str
+        The level, in any spelling, its continuous aggregates must exist.
+    policy : dict[str, str]
+        The 'start_offset', 'end_offset' and 'schedule_interval' intervals.
+
+    Raises
+    ------
+    ValueError
+        If the policy is not valid, see `check_policies`.
+    """
+    check_policies(cursor, {level: policy})
+    for storage, _ in STORAGE_MODES:
+        view = rollup_view(storage, level_label(level))
+        cursor.execute(
+            "SELECT remove_continuous_aggregate_policy(%s, if_exists => true);",
+            [view],
+        )
+        cursor.execute(
+            """
+            SELECT add_continuous_aggregate_policy(%s,
+                start_offset => %s::interval,
+                end_offset => %s::interval,
+                schedule_interval => %s::interval);
+            """,
+            [view, *(policy[name] for name in POLICY_FIELDS)],
+        )
+    invalidate_levels()
+
+
+# ----------------------------------------------------------------------
+def rollup_policies(cursor: Any) -> dict[str, dict[str, str]]:
+    """
+    Return the refresh policy of each level, as set in the database.
+
+    The policies are read from the continuous aggregates of the float64
+    table, the other tables get the same ones.
+    """
+    cursor.execute(
+        """
+        SELECT aggregates.view_name,
+            jobs.config->>'start_offset',
+            jobs.config->>'end_offset',
+            jobs.schedule_interval::text
+        FROM timescaledb_information.jobs AS jobs
+        JOIN timescaledb_information.continuous_aggregates AS aggregates
+            ON jobs.hypertable_name = aggregates.materialization_hypertable_name
+        WHERE jobs.proc_name = 'policy_refresh_continuous_aggregate';
+        """
+    )
+    prefix = rollup_view('float64', '', quote=False)
+    policies = {}
+    for view, *policy in cursor.fetchall():
+        level = view[len(prefix) :] if view.startswith(prefix) else ''
+        try:
+            parse_width(level)
+        except ValueError:  # Not a rollup of the float64 table
+            continue
+        policies[level] = dict(zip(POLICY_FIELDS, policy))
+    return policies
+
+
+# ----------------------------------------------------------------------
+def select_resolution(
+    timerange: tuple[np.datetime64, np.datetime64],
+    max_points: int,
+    sampling_rate: Optional[float] = None,
+    aggregates: Iterable[str] = ('avg',),
+) -> tuple[Optional[str], Optional[np.timedelta64]]:
+    """
+    Pick the rollup level and bucket width for a budget of points.
+
+    The raw samples are used when a channel at `sampling_rate` has no more
+    than `max_points` samples in the range. Otherwise the buckets are as
+    wide as needed to keep `max_points` of them, aggregated from the
+    coarsest level that is not wider, and rounded up to a multiple of its
+    width. Without such a level, or when the rollups do not keep one of the
+    `aggregates`, the buckets are aggregated from the raw samples.
+
+    Parameters
+    ----------
+    timerange : tuple[np.datetime64, np.datetime64]
+        The naive UTC start and end of the range.
+    max_points : int
+        The maximum number of points per channel.
+    sampling_rate : float, optional
+        The highest sampling rate of the channels, in Hz, the samples are
+        always bucketed when it is not known.
+    aggregates : Iterable[str]
+        The requested aggregates.
+
+    Returns
+    -------
+    tuple[Optional[str], Optional[np.timedelta64]]
+        The level, None for the raw samples, and the width of the buckets,
+        None for the raw samples.
+    """
+    start, end = (np.datetime64(time, 'us') for time in timerange)
+    duration = int((end - start) / np.timedelta64(1, 'us'))
+    if sampling_rate and duration * sampling_rate / 1e6 + 1 <= max_points:
+        return None, None
+
+    width = max(-(-duration // max_points), 1)
+    if set(aggregates) <= set(ROLLUP_AGGREGATES):
+        levels = [
+            (level, int(step / np.timedelta64(1, 'us')))
+            for level, step in rollup_levels()
+        ]
+        levels = [(level, step) for level, step in levels if step <= width]
+        if levels:
+            level, step = levels[-1]
+            return level, np.timedelta64(-(-width // step) * step, 'us')
+    return None, np.timedelta64(width, 'us')
+
+
+# ----------------------------------------------------------------------
+def rollup_columns(
+    channels: Iterable[ChannelMetadata],
+    level: str,
+    width: np.timedelta64,
+    aggregates: list[str],
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+    chunk_ids: Optional[list[int]] = None,
+) -> dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]:
+    """
+    Aggregate the buckets of a rollup level into wider buckets.
+
+    The buckets of the level are grouped again with `time_bucket`, with one
+    query per storage table for all the channels, like `bucket_columns`.
+    The range is extended to whole buckets of the level, so the first
+    bucket may include samples before the start. Requires TimescaleDB.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels, of a measure with the 'row' layout.
+    level : str
+        The rollup level, from `rollup_levels`.
+    width : np.timedelta64
+        The width of the buckets, a multiple of the level width.
+    aggregates : list[str]
+        The aggregates, from `ROLLUP_AGGREGATES`.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the buckets between these naive UTC times, unbounded when None.
+    chunk_ids : list[int], optional
+        Only the buckets of these chunks, aggregated by chunk and channel.
+
+    Returns
+    -------
+    dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]
+        The `datetime64[us]` start of the buckets and the arrays of each
+        aggregate of every channel with samples, keyed by chunk id (None
+        without `chunk_ids`) and channel id.
+    """
+    partition = ['channel_id']
+    if chunk_ids is not None:
+        partition = ['chunk_id', 'channel_id']
+
+    step = parse_width(level)
+    start, end = timerange
+    if start is not None:
+        start = start - (start - ORIGIN) % step
+
+    buckets = {}
+    for storage, channel_ids in storage_channels(channels).items():
+        conditions = [f"channel_id IN ({', '.join(['%s'] * len(channel_ids))})"]
+        params = [
+            timedelta(microseconds=int(width / np.timedelta64(1, 'us'))),
+            *channel_ids,
+        ]
+        if chunk_ids is not None:
+            if not chunk_ids:
+                continue
+            conditions.append(
+                f"chunk_id IN ({', '.join(['%s'] * len(chunk_ids))})"
+            )
+            params += chunk_ids
+        for operator, bound in [('>=', start), ('<=', end)]:
+            if bound is not None:
+                conditions.append(f"bucket {operator} %s")
+                params.append(np.datetime64(bound, 'us').item())
+
+        keys = ', '.join(str(i + 1) for i in range(len(partition) + 1))
+        sql = f"""
+            SELECT {', '.join(partition)},
+                time_bucket(%s, bucket),
+                min(min_value),
+                max(max_value),
+                sum(sum_value),
+                sum(count_value)::int8
+            FROM public.{rollup_view(storage, level)}
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {keys}
+            ORDER BY {keys}
+        """
+        fields = [*partition, 'bucket', 'min', 'max', 'sum', 'count']
+        dtypes = [
+            *(['int64'] * len(partition)),
+            'datetime64[us]',
+            storage,
+            storage,
+            'float64',
+            'int64',
+        ]
+        using = router.db_for_read(timeserie_model(storage))
+        columns = dict(
+            zip(fields, query_columns(sql, tuple(params), dtypes, using))
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['avg'] = columns['sum'] / columns['count']
+        buckets.update(split_buckets(columns, partition, aggregates))
+    return buckets
@@ -11,10 +11,18 @@ then be easily rendered into JSON.
 Functions
 ---------
 
-.. rubric:: insert_batch
+.. rubric:: timeserie_columns
 
-This function is a helper that allows to perform bulk create operation for
-given model with specified batch size. The default batch size is 1000.
+This function builds the columnar representation of the samples that is
+handed to the ingest engine (see :mod:`.ingest`), split by the table of the
+storage mode of each channel, or packed in blocks for the measures with the
+'block' layout (see :mod:`.blocks`), or in one row per timestamp for the
+measures with the 'wide' layout (see :mod:`.wide`).
+
+.. rubric:: timeserie_slices
+
+This function builds the same columns in slices of a fixed number of rows,
+for uploads too large to be written at once.
 
 Classes
 -------
@@ -45,19 +53,39 @@ get the measure instance before creating the chunk.
 
 This is a custom serializer field that can serialize both lists and dictionaries.
 It delegates to a child field to serialize the individual items in the list or
-dictionary.
+dictionary. NumPy arrays, as produced by the columnar parsers, are validated as
+a whole instead.
+
+.. rubric:: TimestampArrayField
+
+This is a custom serializer field for a whole array of timestamps. It converts
+epoch numbers or ISO strings into a single `datetime64[us]` array in one pass.
+
+.. rubric:: StartTimestampField
+
+This is a custom serializer field for the `t0` of a uniformly sampled upload. It
+converts a single epoch number or ISO string into a `datetime64[us]` value.
+
+.. rubric:: FloatArrayField
+
+This is a custom serializer field for a whole list of values. It converts the
+list into a float64 NumPy array at once, see :mod:`.validators`.
 
-.. rubric:: TimestampField
+.. rubric:: TimeserieListSerializer
 
-This is a custom serializer field for timestamps. If the input is a float, it
-converts it to a datetime iso format string.
+This class provides the many=True create path of `TimeserieSerializer`. It resolves
+the metadata of all the payloads at once, merges their samples and writes them in a
+single transaction, returning one status per payload.
 
 .. rubric:: TimeserieSerializer
 
 This class provides a serializer for creating TimeSerie instances. It includes 'source',
-'measure', 'timestamps', 'values' and 'chunk' fields. It overrides the 'create' method
-to pop 'measure', 'source' and 'chunk' from validated data, get the related measure
-and chunk instances, create TimeSerie instances and perform a bulk insert.
+'measure', 'timestamps', 'values' and 'chunk' fields. Uniformly sampled uploads can send
+a 't0' instead of the 'timestamps', the samples of each channel are then spaced by its
+sampling rate. It overrides the 'create' method
+to pop 'measure', 'source', 'chunk' and 'on_conflict' from validated data, resolve the related measure,
+channels and chunk through the metadata cache, and write the samples with the configured
+ingest engine, or hand them to the ingest buffer when it is enabled (see :mod:`.buffer`).
 
 Each of these classes and function plays a critical role in handling API request
 and response data in the Timescaledbapp.
@@ -66,34 +94,217 @@ and response data in the Timescaledbapp.
 
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from datetime import datetime
-from django.utils.timezone import make_aware
-from .models import Measure, TimeSerie, Channel, Chunk
-from typing import Type, Any, Union
+from .models import (
+    Source,
+    Measure,
+    TimeSerie,
+    TimeSerieBlock,
+    TimeSerieWide,
+    Channel,
+    Chunk,
+    CONFLICT_POLICIES,
+    timeserie_model,
+)
+from typing import Type, Any, Iterator, Optional, Union
+from django.conf import settings
 from rest_framework import serializers, status
-from .models import Source, Measure, Channel
+from django.db import router, transaction
 from django.db.models import Model
 from rest_framework.response import Response
 from django.db.utils import IntegrityError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .ingest import (
+    REJECT,
+    IngestEngine,
+    WriteResult,
+    conflict_policy,
+    merge_tables,
+    write_slices,
+)
+from .buffer import BufferFull, get_ingest_buffer
+from .blocks import block_columns
+from .converters import to_datetime64, uniform_timestamps
+from .wide import wide_columns
+from .cache import ChannelMetadata, MeasureMetadata, metadata_cache
+from .validators import (
+    validation_mode,
+    to_float_array,
+    check_finite,
+    check_monotonic,
+)
+
+
+# ----------------------------------------------------------------------
+def timeserie_columns(
+    timestamps: Optional[np.ndarray],
+    values: dict[str, list[float]],
+    channels: dict[str, ChannelMetadata],
+    chunk_id: int,
+    layout: str = 'row',
+    t0: Optional[np.datetime64] = None,
+) -> dict[Type[Model], dict[str, np.ndarray]]:
+    """
+    Builds the columns of the timeserie tables.
+
+    The values of the 'float64' channels are multiplied by their scale
+    factor, the values of the integer channels are kept as raw counts in the
+    table of their storage mode. With the 'block' and 'wide' layouts, every
+    channel is packed in the block or wide table instead.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray or None
+        The `datetime64[us]` timestamps shared by all the channels, None
+        when `t0` is given.
+    values : dict[str, list[float]]
+        The values of each channel, keyed by channel label.
+    channels : dict[str, ChannelMetadata]
+        The id, scale factor and storage of the channels, keyed by label.
+    chunk_id : int
+        The id of the chunk the samples belong to.
+    layout : str, optional
+        The layout of the measure, 'row', 'block' or 'wide'.
+    t0 : np.datetime64, optional
+        The timestamp of the first sample of every channel, which are
+        uniformly sampled at their `sampling_rate`.
+
+    Returns
+    -------
+    dict[Type[Model], dict[str, np.ndarray]]
+        The `timestamp`, `value`, `channel_id` and `chunk_id` columns, or
+        the columns of `block_columns`, keyed by the model of the table that
+        receives them.
+    """
+    tables = {}
+    for label in values:
+        channel = channels[label]
+        if channel.storage == 'float64':
+            array = (
+                np.asarray(values[label], dtype=np.float64)
+                * channel.scale_factor
+            )
+        else:
+            array = np.rint(values[label]).astype(channel.storage)
+        tables.setdefault(timeserie_model(channel.storage), {})[label] = array
+
+    if layout in ('block', 'wide'):
+        arrays = {
+            label: array
+            for storage in tables.values()
+            for label, array in storage.items()
+        }
+        if layout == 'wide':
+            return {
+                TimeSerieWide: wide_columns(
+                    timestamps, arrays, channels, chunk_id, t0
+                )
+            }
+        return {
+            TimeSerieBlock: block_columns(
+                timestamps, arrays, channels, chunk_id, t0
+            )
+        }
+
+    def channel_timestamps(label: str, n: int) -> np.ndarray:
+        if t0 is None:
+            return timestamps[:n]
+        return uniform_timestamps(t0, channels[label].sampling_rate, n)
+
+    return {
+        model: {
+            'timestamp': np.concatenate(
+                [
+                    channel_timestamps(label, len(array))
+                    for label, array in arrays.items()
+                ]
+            ),
+            'value': np.concatenate(list(arrays.values())),
+            'channel_id': np.concatenate(
+                [
+                    np.full(len(array), channels[label].id, dtype=np.int32)
+                    for label, array in arrays.items()
+                ]
+            ),
+            'chunk_id': np.full(
+                sum(map(len, arrays.values())), chunk_id, dtype=np.int32
+            ),
+        }
+        for model, arrays in tables.items()
+    }
 
 
 # ----------------------------------------------------------------------
-def insert_batch(
-    model: Type[Model], objects: list[Model], batch_size: int = 1000
-) -> None:
+def timeserie_slices(
+    timestamps: Optional[np.ndarray],
+    values: dict[str, np.ndarray],
+    channels: dict[str, ChannelMetadata],
+    chunk_id: int,
+    size: int,
+    layout: str = 'row',
+    t0: Optional[np.datetime64] = None,
+) -> Iterator[tuple[Type[Model], dict[str, np.ndarray]]]:
     """
-    Inserts a batch of objects into the database.
+    Yield the columns of the samples in slices of at most `size` rows.
 
     Parameters
     ----------
-    model : Type[Model]
-        The model class of the objects.
-    objects : list[Model]
-        The objects to be inserted.
-    batch_size : int, optional
-        The size of the batch to be inserted, by default 1000
+    timestamps : np.ndarray or None
+        The `datetime64[us]` timestamps shared by every channel, None when
+        `t0` is given.
+    values : dict[str, np.ndarray]
+        The values of each channel, keyed by channel label.
+    channels : dict[str, ChannelMetadata]
+        The metadata of each channel, keyed by channel label.
+    chunk_id : int
+        The id of the chunk receiving the samples.
+    size : int
+        The maximum number of rows of a slice.
+    layout : str, optional
+        The layout of the measure, 'row', 'block' or 'wide'.
+    t0 : np.datetime64, optional
+        The timestamp of the first sample of every channel, which are
+        uniformly sampled at their `sampling_rate`.
+
+    Yields
+    ------
+    tuple[Type[Model], dict[str, np.ndarray]]
+        The model of the table of a slice and its columns, as returned by
+        `timeserie_columns`.
     """
-    return model.objects.bulk_create(objects, batch_size=batch_size)
+    if layout == 'wide':
+        # The rows hold every channel, so the slices hold every channel too
+        length = max(map(len, values.values()), default=0)
+        if t0 is not None:
+            rate = channels[next(iter(values))].sampling_rate
+            timestamps = uniform_timestamps(t0, rate, length)
+        rows = max(size // max(len(values), 1), 1)
+        for start in range(0, length, rows):
+            yield from timeserie_columns(
+                timestamps[start : start + rows],
+                {
+                    label: array[start : start + rows]
+                    for label, array in values.items()
+                    if len(array) > start
+                },
+                channels,
+                chunk_id,
+                layout,
+            ).items()
+        return
+
+    for label, array in values.items():
+        if t0 is not None:
+            timestamps = uniform_timestamps(
+                t0, channels[label].sampling_rate, len(array)
+            )
+        for start in range(0, len(array), size):
+            yield from timeserie_columns(
+                timestamps[start : start + size],
+                {label: array[start : start + size]},
+                channels,
+                chunk_id,
+                layout,
+            ).items()
 
 
 ########################################################################
@@ -132,7 +343,14 @@ class MeasureSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Measure
-        fields = ['label', 'name', 'description', 'source']
+        fields = [
+            'label',
+            'name',
+            'description',
+            'source',
+            'conflict_policy',
+            'layout',
+        ]
 
 
 ########################################################################
@@ -156,6 +374,7 @@ class ChannelSerializer(serializers.ModelSerializer):
             'unit',
             'sampling_rate',
             'description',
+            'storage',
             'source',
             'measure',
         ]
@@ -273,22 +492,28 @@ class DictOrListField(serializers.Field):
 
     # ----------------------------------------------------------------------
     def to_internal_value(
-        self, data: Union[list[Any], dict[Any, Any]]
-    ) -> Union[list[Any], dict[Any, Any]]:
+        self, data: Union[list[Any], dict[Any, Any], np.ndarray]
+    ) -> Union[list[Any], dict[Any, Any], np.ndarray]:
         """
         Validates the incoming data and returns the converted form.
 
         Parameters
         ----------
-        data : Union[list[Any], dict[Any, Any]]
+        data : Union[list[Any], dict[Any, Any], np.ndarray]
             The data to be validated and converted.
 
         Returns
         -------
-        Union[list[Any], dict[Any, Any]]
+        Union[list[Any], dict[Any, Any], np.ndarray]
             The validated and converted form of the data.
         """
-        if isinstance(data, list):
+        if isinstance(data, np.ndarray):
+            if data.ndim != 1 or data.dtype.kind not in 'iuf':
+                raise serializers.ValidationError(
+                    "Invalid array. Expected a one-dimensional numeric array."
+                )
+            return data.astype(np.float64, copy=False)
+        elif isinstance(data, list):
             return [self.child.to_internal_value(item) for item in data]
         elif isinstance(data, dict):
             return {
@@ -302,26 +527,102 @@ class DictOrListField(serializers.Field):
 
 
 ########################################################################
-class TimestampField(serializers.Field):
+class TimestampArrayField(serializers.Field):
     """
-    A custom field serializer for timestamp data.
+    A custom field serializer for arrays of timestamps.
 
-    It validates and transforms incoming data into an internal value for use in serializer methods.
+    The whole array is converted at once into naive UTC `datetime64[us]` values,
+    see :func:`.converters.to_datetime64`.
     """
 
     # ----------------------------------------------------------------------
-    def __init__(self, *args, **kwargs):
+    def to_representation(self, value: Any) -> Any:
         """
-        Initializes a new instance of the TimestampField class.
+        Converts a Python object into a data type that can then be rendered into JSON.
 
         Parameters
         ----------
-        *args : Any
-            Variable length argument list.
-        **kwargs : Any
-            Arbitrary keyword arguments.
+        value : Any
+            The Python object to be converted.
+
+        Returns
+        -------
+        Any
+            The data type that can be rendered into JSON.
         """
-        super().__init__(*args, **kwargs)
+        return value
+
+    # ----------------------------------------------------------------------
+    def to_internal_value(self, data: Any) -> np.ndarray:
+        """
+        Validates and converts the incoming timestamps to a `datetime64[us]` array.
+
+        Parameters
+        ----------
+        data : Any
+            The list of timestamps, as epoch numbers or ISO strings.
+
+        Returns
+        -------
+        np.ndarray
+            The validated and converted timestamps.
+        """
+        if not isinstance(data, (list, tuple, np.ndarray)):
+            raise serializers.ValidationError(
+                "Invalid data type. Expected a list."
+            )
+        try:
+            return to_datetime64(data)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+########################################################################
+class StartTimestampField(serializers.Field):
+    """
+    A custom field serializer for the first timestamp of a uniform segment.
+
+    The timestamp is converted like the elements of `TimestampArrayField`.
+    """
+
+    # ----------------------------------------------------------------------
+    def to_representation(self, value: Any) -> Any:
+        """Return the value unchanged."""
+        return value
+
+    # ----------------------------------------------------------------------
+    def to_internal_value(self, data: Any) -> np.datetime64:
+        """
+        Validates and converts the incoming timestamp to a `datetime64[us]` value.
+
+        Parameters
+        ----------
+        data : Any
+            The timestamp, as an epoch number or an ISO string.
+
+        Returns
+        -------
+        np.datetime64
+            The validated and converted timestamp.
+        """
+        if isinstance(data, (list, tuple, dict, bool)) or data is None:
+            raise serializers.ValidationError(
+                "Invalid data type. Expected a number or a string."
+            )
+        try:
+            return to_datetime64([data])[0]
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+########################################################################
+class FloatArrayField(serializers.Field):
+    """
+    A custom field serializer for lists of float values.
+
+    The whole list is converted at once into a float64 NumPy array, and invalid
+    elements are reported by index range.
+    """
 
     # ----------------------------------------------------------------------
     def to_representation(self, value: Any) -> Any:
@@ -341,33 +642,171 @@ class TimestampField(serializers.Field):
         return value
 
     # ----------------------------------------------------------------------
-    def to_internal_value(self, data: float) -> str:
+    def to_internal_value(self, data: Any) -> np.ndarray:
         """
-        Validates and converts the incoming timestamp data to an ISO-formatted string.
+        Validates and converts the incoming values to a float64 array.
 
         Parameters
         ----------
-        data : Union[float, str]
-            The timestamp data to be validated and converted.
+        data : Any
+            The list of values.
 
         Returns
         -------
-        str
-            The validated and converted timestamp.
+        np.ndarray
+            The validated and converted values.
+        """
+        array = to_float_array(data)
+        check_finite(array)
+        return array
+
+
+########################################################################
+class TimeserieListSerializer(serializers.ListSerializer):
+    """
+    List serializer for `TimeserieSerializer`, used for many=True POSTs.
+
+    All the payloads are resolved and written together: the measures, channels
+    and default chunks are read with one query each, the new chunks are
+    created with one INSERT, and the samples of every payload are merged into
+    a single write inside one transaction.
+    """
+
+    # ----------------------------------------------------------------------
+    def create(self, validated_data: list[dict[str, Any]]) -> Response:
         """
-        if isinstance(data, float):
+        Creates the TimeSerie instances of every payload.
+
+        Payloads that reference an unknown measure or channel are reported
+        and skipped. If the merged write fails on a conflict, the payloads are
+        written one by one so that only the conflicting ones fail.
+
+        Only the payloads with the 'reject' conflict policy are merged; the
+        'skip' and 'overwrite' ones are written one by one, in the same
+        transaction, to report how many of their rows were inserted.
+
+        Parameters
+        ----------
+        validated_data : list[dict[str, Any]]
+            The validated payloads.
+
+        Returns
+        -------
+        Response
+            One status per payload, in order. The status code is 201 when
+            every payload was saved, 207 otherwise.
+        """
+        keys = [
+            (attrs.get('source', ''), attrs['measure'])
+            for attrs in validated_data
+        ]
+        measures = metadata_cache.get_many(keys)
+        results = [None] * len(validated_data)
+
+        payloads = []
+        for index, (attrs, key) in enumerate(zip(validated_data, keys)):
+            measure = measures.get(key)
             try:
-                return datetime.fromtimestamp(data).isoformat()
-            except:
-                pass
+                if measure is None:
+                    raise serializers.ValidationError(
+                        {'measure': f"Measure '{key[1]}' does not exist."}
+                    )
+                self.child.check_channels(attrs, measure)
+            except serializers.ValidationError as error:
+                results[index] = {"status": "fail", "errors": error.detail}
+                continue
+            if not attrs.get('chunk') and measure.default_chunk_id is None:
+                measure = measure._replace(
+                    default_chunk_id=metadata_cache.get_default_chunk_id(*key)
+                )
+            on_conflict = conflict_policy(
+                attrs.get('on_conflict'), measure.conflict_policy
+            )
+            payloads.append((index, attrs, measure, on_conflict))
+
+        using = router.db_for_write(TimeSerie)
+        with transaction.atomic(using=using):
+            chunks = iter(
+                Chunk.objects.using(using).bulk_create(
+                    [
+                        Chunk(measure_id=measure.id, label=attrs['chunk'])
+                        for _, attrs, measure, _ in payloads
+                        if attrs.get('chunk')
+                    ]
+                )
+            )
+            batch = []
+            for index, attrs, measure, on_conflict in payloads:
+                chunk_id = (
+                    next(chunks).pk
+                    if attrs.get('chunk')
+                    else measure.default_chunk_id
+                )
+                tables = self.child.to_columns(attrs, measure, chunk_id)
+                batch.append((index, tables, on_conflict))
+            if batch:
+                self.write(batch, results, using)
 
-        if isinstance(data, int):
+        created = all(result['status'] == 'success' for result in results)
+        return Response(
+            results,
+            status=(
+                status.HTTP_201_CREATED
+                if created
+                else status.HTTP_207_MULTI_STATUS
+            ),
+            content_type='application/json',
+        )
+
+    # ----------------------------------------------------------------------
+    def write(
+        self,
+        batch: list[tuple[int, dict[Type[Model], dict[str, np.ndarray]], str]],
+        results: list[Optional[dict[str, Any]]],
+        using: str,
+    ) -> None:
+        """
+        Writes the columns of several payloads.
+
+        Parameters
+        ----------
+        batch : list[tuple[int, dict[Type[Model], dict[str, np.ndarray]], str]]
+            The index, columns by table and conflict policy of each payload.
+        results : list[Optional[dict[str, Any]]]
+            The status of each payload, filled in place.
+        using : str
+            The database alias.
+        """
+        merged = [item for item in batch if item[2] == REJECT]
+        single = [item for item in batch if item[2] != REJECT]
+
+        if merged:
+            tables = merge_tables(item[1] for item in merged)
             try:
-                data = datetime.fromtimestamp(data / 1000).isoformat()
-            except:
-                pass
+                write_slices(tables.items(), using=using)
+            except IntegrityError:
+                single = batch
+            else:
+                for index, item_tables, _ in merged:
+                    rows = self.child.count_rows(item_tables)
+                    results[index] = self.child.success_data(
+                        WriteResult(rows, 0, 0, {}), rows
+                    )
 
-        return data
+        for index, item_tables, on_conflict in single:
+            try:
+                result = write_slices(
+                    item_tables.items(), using=using, on_conflict=on_conflict
+                )
+            except IntegrityError:
+                results[index] = {
+                    "status": "fail",
+                    "message": "Objects can not be created.",
+                }
+            else:
+                results[index] = self.child.success_data(
+                    result, self.child.count_rows(item_tables)
+                )
 
 
 ########################################################################
@@ -381,11 +820,221 @@ class TimeserieSerializer(serializers.Serializer):
 
     source = serializers.CharField(required=False, allow_blank=True)
     measure = serializers.CharField()
-    timestamps = DictOrListField(child=TimestampField())
-    values = serializers.DictField(
-        child=DictOrListField(child=serializers.FloatField())
-    )
+    timestamps = TimestampArrayField(required=False)
+    t0 = StartTimestampField(required=False)
+    values = serializers.DictField(child=FloatArrayField())
     chunk = serializers.CharField(required=False, allow_blank=True)
+    on_conflict = serializers.ChoiceField(
+        choices=CONFLICT_POLICIES, required=False
+    )
+
+    class Meta:
+        list_serializer_class = TimeserieListSerializer
+
+    # ----------------------------------------------------------------------
+    def get_fields(self) -> dict[str, serializers.Field]:
+        """
+        Returns the serializer fields for the configured validation mode.
+
+        In 'strict' mode every value is validated by its own `FloatField`.
+
+        Returns
+        -------
+        dict[str, serializers.Field]
+            The fields of the serializer.
+        """
+        fields = super().get_fields()
+        if validation_mode() == 'strict':
+            fields['values'] = serializers.DictField(
+                child=DictOrListField(child=serializers.FloatField())
+            )
+        return fields
+
+    # ----------------------------------------------------------------------
+    def validate(self, attrs: dict[str, Any]) -> dict[str, Any]:
+        """
+        Validates the samples as whole arrays.
+
+        Checks that either the 'timestamps' or the 't0' of the samples is
+        given and, with the timestamps, that every channel has one value per
+        timestamp and that the timestamps are strictly increasing. Only the
+        validation of each value depends on the validation mode, see
+        `get_fields`.
+
+        Parameters
+        ----------
+        attrs : dict[str, Any]
+            The values of the fields.
+
+        Returns
+        -------
+        dict[str, Any]
+            The validated data.
+        """
+        if 't0' in attrs and 'timestamps' in attrs:
+            raise serializers.ValidationError(
+                {'t0': "Send either 't0' or 'timestamps', not both."}
+            )
+        if 't0' not in attrs and 'timestamps' not in attrs:
+            raise serializers.ValidationError(
+                {'timestamps': "This field is required without 't0'."}
+            )
+
+        if 't0' in attrs:
+            return attrs
+
+        timestamps = attrs['timestamps']
+        errors = {
+            label: f"Expected {len(timestamps)} values, got {len(values)}."
+            for label, values in attrs['values'].items()
+            if len(values) != len(timestamps)
+        }
+        if errors:
+            raise serializers.ValidationError({'values': errors})
+
+        try:
+            check_monotonic(timestamps)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError({'timestamps': error.detail})
+
+        return attrs
+
+    # ----------------------------------------------------------------------
+    def check_channels(
+        self, attrs: dict[str, Any], measure: MeasureMetadata
+    ) -> None:
+        """
+        Checks that every channel in the values belongs to the measure.
+
+        The values of the channels with an integer storage must also be
+        finite and within the range of their type, and the channels of an
+        upload with a 't0' must have a sampling rate, the same one for the
+        measures with the 'wide' layout. The uploads of a 'wide' measure must
+        send all its channels, as each row is written whole.
+
+        Raises
+        ------
+        serializers.ValidationError
+            If a channel label is unknown or its values can not be stored.
+        """
+        errors = {}
+        for label, values in attrs['values'].items():
+            channel = measure.channels.get(label)
+            if channel is None:
+                errors[label] = "Unknown channel."
+            elif 't0' in attrs and not (channel.sampling_rate or 0) > 0:
+                errors[label] = "A sampling rate is required with 't0'."
+            elif measure.layout == 'wide' and channel.index is None:
+                errors[label] = "The channel has no index."
+            elif channel.storage != 'float64':
+                array = np.asarray(values, dtype=np.float64)
+                limits = np.iinfo(channel.storage)
+                if array.size and not (
+                    np.isfinite(array).all()
+                    and limits.min <= array.min()
+                    and array.max() <= limits.max
+                ):
+                    errors[label] = (
+                        f"Values must be finite {channel.storage} counts."
+                    )
+        if measure.layout == 'wide':
+            for label in measure.channels.keys() - attrs['values'].keys():
+                errors[label] = (
+                    "Missing channel, the uploads of a 'wide' measure must "
+                    "send all its channels."
+                )
+        if errors:
+            raise serializers.ValidationError({'values': errors})
+
+        rates = {
+            measure.channels[label].sampling_rate for label in attrs['values']
+        }
+        if 't0' in attrs and measure.layout == 'wide' and len(rates) > 1:
+            raise serializers.ValidationError(
+                {
+                    't0': "The channels of a 'wide' measure must share "
+                    "their sampling rate."
+                }
+            )
+
+    # ----------------------------------------------------------------------
+    def to_columns(
+        self, attrs: dict[str, Any], measure: MeasureMetadata, chunk_id: int
+    ) -> dict[Type[Model], dict[str, np.ndarray]]:
+        """
+        Builds the columns to write for a payload.
+
+        Parameters
+        ----------
+        attrs : dict[str, Any]
+            The validated payload, with 'timestamps' or 't0' and 'values'.
+        measure : MeasureMetadata
+            The resolved measure.
+        chunk_id : int
+            The id of the chunk receiving the samples.
+
+        Returns
+        -------
+        dict[Type[Model], dict[str, np.ndarray]]
+            The columns by table, see `timeserie_columns`.
+        """
+        values = attrs['values']
+        channel_dict = {label: measure.channels[label] for label in values}
+        return timeserie_columns(
+            attrs.get('timestamps'),
+            values,
+            channel_dict,
+            chunk_id,
+            measure.layout,
+            attrs.get('t0'),
+        )
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def count_rows(tables: dict[Type[Model], dict[str, np.ndarray]]) -> int:
+        """Return the number of samples of the columns of every table."""
+        return sum(
+            IngestEngine.total(columns, getattr(model, 'SAMPLES_COLUMN', None))
+            for model, columns in tables.items()
+        )
+
+    # ----------------------------------------------------------------------
+    def success_data(
+        self, result: Optional[WriteResult], rows: int
+    ) -> dict[str, Any]:
+        """
+        Return the response body of a successful write.
+
+        Parameters
+        ----------
+        result : WriteResult or None
+            The outcome of the write, None when it is not known per request.
+        rows : int
+            The number of rows sent.
+        """
+        data = {
+            "status": "success",
+            "message": "Your data has been successfully saved.",
+        }
+        if result is None:
+            data["objects_written"] = rows
+        else:
+            data["objects_created"] = result.inserted
+            data["objects_updated"] = result.updated
+            data["objects_skipped"] = result.skipped
+        return data
+
+    # ----------------------------------------------------------------------
+    def integrity_error_response(self) -> Response:
+        """Return the response for samples that can not be stored."""
+        return Response(
+            {
+                "status": "fail",
+                "message": "Objects can not be created.",
+            },
+            status=status.HTTP_403_FORBIDDEN,
+            content_type='application/json',
+        )
 
     # ----------------------------------------------------------------------
     def create(self, validated_data: dict[str, Any]) -> dict[str, Any]:
@@ -402,86 +1051,113 @@ class TimeserieSerializer(serializers.Serializer):
         dict[str, Any]
             A status message indicating the success of the operation and the number of objects created.
         """
-        measure = Measure.objects.select_related('source').get(
-            source_id=validated_data.pop('source'),
-            label=validated_data.pop('measure'),
-        )
-        timestamps = np.array(validated_data.pop('timestamps'))
-        values = validated_data.pop('values')
+        source_label = validated_data.pop('source', '')
+        measure_label = validated_data.pop('measure')
+        try:
+            measure = metadata_cache.get(source_label, measure_label)
+        except Measure.DoesNotExist:
+            raise serializers.ValidationError(
+                {'measure': f"Measure '{measure_label}' does not exist."}
+            )
+        self.check_channels(validated_data, measure)
 
         # chunk, _ = Chunk.objects.get_or_create(measure=measure, label=validated_data.pop('chunk', 'default'))
 
         if chunk_label := validated_data.pop('chunk', False):
-            chunk = Chunk.objects.create(
-                measure=measure,
-                label=validated_data.pop('chunk', chunk_label),
-            )
+            chunk_id = Chunk.objects.create(
+                measure_id=measure.id,
+                label=chunk_label,
+            ).pk
         else:
-            chunk, _ = Chunk.objects.get_or_create(
-                measure=measure, label=validated_data.pop('chunk', 'default')
+            chunk_id = metadata_cache.get_default_chunk_id(
+                source_label, measure_label
             )
 
-        if isinstance(timestamps[0], (float, int, np.integer, np.floating)):
-            timestamps = np.array(
-                list(
-                    map(
-                        lambda t: make_aware(datetime.fromtimestamp(t)),
-                        timestamps,
-                    )
-                )
+        values = validated_data['values']
+        rows = sum(len(values[label]) for label in values)
+        storages = {measure.channels[label].storage for label in values}
+        on_conflict = conflict_policy(
+            validated_data.pop('on_conflict', None), measure.conflict_policy
+        )
+        using = router.db_for_write(TimeSerie)
+        slice_rows = getattr(settings, 'TIMESCALEDB_INGEST_SLICE_ROWS', 500000)
+        buffer = get_ingest_buffer()
+
+        if rows > slice_rows:
+            slices = timeserie_slices(
+                validated_data.get('timestamps'),
+                values,
+                measure.channels,
+                chunk_id,
+                slice_rows,
+                measure.layout,
+                validated_data.get('t0'),
             )
+            try:
+                result = write_slices(
+                    slices, using=using, on_conflict=on_conflict
+                )
+            except IntegrityError:
+                return self.integrity_error_response()
+
+        # Samples for several storage tables are not buffered, so that they
+        # are committed together
+        elif buffer and len(storages) == 1:
+            ((model, columns),) = self.to_columns(
+                validated_data, measure, chunk_id
+            ).items()
+            try:
+                future = buffer.submit(
+                    model, columns, using=using, on_conflict=on_conflict
+                )
+            except BufferFull as error:
+                return Response(
+                    {
+                        "status": "fail",
+                        "message": "The ingest buffer is full, retry later.",
+                    },
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(error.retry_after)},
+                    content_type='application/json',
+                )
 
-        channels = Channel.objects.filter(measure=measure)
-        channel_dict = {
-            channel.label: channel
-            for channel in channels
-            if channel.label in values.keys()
-        }
-
-        # for channel_label in channel_dict:
-        # channel = channel_dict[channel_label]
-        # channel.count = channel.count + len(timestamps)
-        # channel.save()
-
-        timeseries = []
-        for channel_label in values:
-            channel = channel_dict[channel_label]
-            values[channel_label] = (
-                np.array(values[channel_label]) * channel.scale_factor
-            ).tolist()
-            for i, value in enumerate(values[channel_label]):
-                timeserie_params = {
-                    'timestamp': timestamps[i],
-                    'value': value,
-                    'channel': channel,
-                    'chunk': chunk,
-                }
-                timeseries.append(TimeSerie(**timeserie_params))
-
-        try:
+            if buffer.durability == 'enqueue':
+                return Response(
+                    {
+                        "status": "accepted",
+                        "message": "Your data has been queued.",
+                        "objects_queued": rows,
+                    },
+                    status=status.HTTP_202_ACCEPTED,
+                    content_type='application/json',
+                )
 
-            insert_batch(TimeSerie, timeseries, batch_size=1000)
-        except IntegrityError:
-            return Response(
-                {
-                    "status": "fail",
-                    "message": "Objects can not be created.",
-                },
-                status=status.HTTP_403_FORBIDDEN,
-                content_type='application/json',
-            )
+            try:
+                result = future.result(timeout=buffer.timeout)
+            except FutureTimeoutError:
+                return Response(
+                    {
+                        "status": "accepted",
+                        "message": "Your data has been queued, the flush is pending.",
+                        "objects_queued": rows,
+                    },
+                    status=status.HTTP_202_ACCEPTED,
+                    content_type='application/json',
+                )
+            except IntegrityError:
+                return self.integrity_error_response()
 
-        for channel_label in channel_dict:
-            channel = channel_dict[channel_label]
-            channel.count = channel.count + len(timestamps)
-            channel.save()
+        else:
+            tables = self.to_columns(validated_data, measure, chunk_id)
+            try:
+                result = write_slices(
+                    tables.items(), using=using, on_conflict=on_conflict
+                )
+            except IntegrityError:
+                return self.integrity_error_response()
 
         return Response(
-            {
-                "status": "success",
-                "message": "Your data has been successfully saved.",
-                "objects_created": len(timeseries),
-            },
+            self.success_data(result, rows),
             status=status.HTTP_201_CREATED,
             content_type='application/json',
         )
@@ -0,0 +1,78 @@
+"""
+======================
+Timescaledbapp Signals
+======================
+
+This module connects the model signals that keep the metadata cache of
+:mod:`.cache` consistent with the database, and that number the channels of
+a measure for the 'wide' layout. It is imported from
+`TimeScaleDBConfig.ready`.
+
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import DEFAULT_CHUNK, metadata_cache
+from .models import Channel, Chunk, Measure, Source
+
+
+# ----------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Source)
+def invalidate_source(sender, instance, **kwargs):
+    """Drop the cached measures of a source."""
+    metadata_cache.invalidate(source=instance.pk)
+
+
+# ----------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Measure)
+def invalidate_measure(sender, instance, **kwargs):
+    """Drop a cached measure."""
+    metadata_cache.invalidate(measure_id=instance.pk)
+
+
+# ----------------------------------------------------------------------
+@receiver(pre_save, sender=Channel)
+def assign_channel_index(sender, instance, **kwargs):
+    """
+    Give a new channel the next index of its measure.
+
+    The index is claimed from the `next_index` counter of the measure, which
+    is incremented in the database, so concurrent channels get different
+    indexes and the indexes of deleted channels are never reused: their
+    values are still stored in the rows of the 'wide' layout. An index given
+    explicitly moves the counter past it.
+    """
+    measures = Measure.objects.using(kwargs.get('using')).filter(
+        pk=instance.measure_id
+    )
+    if instance.index is not None:
+        measures.filter(next_index__lte=instance.index).update(
+            next_index=instance.index + 1
+        )
+        return
+
+    with transaction.atomic(using=kwargs.get('using')):
+        # The update locks the measure until the index is read
+        measures.update(next_index=F('next_index') + 1)
+        instance.index = measures.values_list('next_index', flat=True).get() - 1
+
+
+# ----------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Channel)
+def invalidate_channel(sender, instance, **kwargs):
+    """Drop the cached measure of a channel."""
+    metadata_cache.invalidate(measure_id=instance.measure_id)
+
+
+# ----------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Chunk)
+def invalidate_chunk(sender, instance, **kwargs):
+    """Drop the cached measure of a default chunk."""
+    if kwargs.get('created'):
+        # A new chunk can not be referenced by a cached entry yet.
+        return
+    if instance.label == DEFAULT_CHUNK:
+        metadata_cache.invalidate(measure_id=instance.measure_id)
@@ -0,0 +1,262 @@
+"""
+====================
+Timescaledbapp Stats
+====================
+
+This module provides the statistics of the time series for ``stats=true``,
+computed over every sample of a channel in a time range, not over a page:
+
+``avg_value``, ``std_value``, ``max_value``, ``min_value`` and ``sum_value``
+    The mean, population standard deviation, extrema and sum of the values.
+
+``tmin``, ``tmax`` and ``duration``
+    The first and last timestamps, as epoch seconds, and the time between
+    them, in seconds.
+
+``avg_diff_timestamp``, ``std_diff_timestamp``, ``max_diff_timestamp`` and ``min_diff_timestamp``
+    The mean, standard deviation and extrema of the intervals between
+    consecutive samples, in milliseconds.
+
+On PostgreSQL, the statistics of the channels of the 'row' layout are
+computed by the database with a single query for all the storage tables:
+the intervals with the `lag` window function over each channel, and the
+statistics with aggregates grouped by channel, and chunk, so only one row
+per channel is sent. The other layouts, and backends, read the samples and
+compute the same statistics with NumPy.
+
+Functions
+---------
+
+.. rubric:: stats_columns
+
+Computes the statistics of several channels of the 'row' layout in SQL.
+
+.. rubric:: sample_stats
+
+Computes the statistics of the samples of a channel with NumPy.
+
+.. rubric:: format_stats
+
+Returns the value and timestamp statistics of a channel, with its values
+scaled.
+
+"""
+
+import math
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from django.db import router
+
+from .cache import ChannelMetadata
+from .fetch import query_columns, storage_channels
+from .models import timeserie_model
+
+# The statistics of the samples of a channel, in the order of `stats_columns`.
+STATS = (
+    'count',
+    'avg',
+    'std',
+    'max',
+    'min',
+    'sum',
+    'tmin',
+    'tmax',
+    'avg_diff',
+    'std_diff',
+    'max_diff',
+    'min_diff',
+)
+
+
+# ----------------------------------------------------------------------
+def stats_columns(
+    channels: Iterable[ChannelMetadata],
+    timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+        None,
+        None,
+    ),
+    chunk_ids: Optional[list[int]] = None,
+) -> dict[tuple[Optional[int], int], dict[str, Any]]:
+    """
+    Compute the statistics of several channels, in SQL.
+
+    The samples of every storage table are read with `UNION ALL`, the
+    intervals between them are computed with `lag` over each channel and
+    chunk, and aggregated with the values, in a single query. Requires
+    PostgreSQL.
+
+    Parameters
+    ----------
+    channels : Iterable[ChannelMetadata]
+        The channels, of a measure with the 'row' layout.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the samples between these naive UTC times, included, unbounded
+        when None.
+    chunk_ids : list[int], optional
+        Only the samples of these chunks, with statistics by chunk and
+        channel.
+
+    Returns
+    -------
+    dict[tuple[Optional[int], int], dict[str, Any]]
+        The `STATS` of every channel with samples, the intervals in seconds,
+        NaN without intervals, keyed by chunk id (None without `chunk_ids`)
+        and channel id.
+    """
+    partition = ['channel_id']
+    if chunk_ids is not None:
+        partition = ['chunk_id', 'channel_id']
+        if not chunk_ids:
+            return {}
+
+    selects, params, using = [], [], None
+    for storage, channel_ids in storage_channels(channels).items():
+        table = timeserie_model(storage)._meta.db_table
+        using = router.db_for_read(timeserie_model(storage))
+        conditions = [f"channel_id IN ({', '.join(['%s'] * len(channel_ids))})"]
+        params += channel_ids
+        if chunk_ids is not None:
+            conditions.append(
+                f"chunk_id IN ({', '.join(['%s'] * len(chunk_ids))})"
+            )
+            params += chunk_ids
+        for operator, time in zip(['>=', '<='], timerange):
+            if time is not None:
+                conditions.append(f"timestamp {operator} %s")
+                params.append(np.datetime64(time, 'us').item())
+        selects.append(
+            f"""
+            SELECT {', '.join(partition)},
+                value::float8 AS value,
+                timestamp,
+                EXTRACT(EPOCH FROM timestamp - lag(timestamp) OVER (
+                    PARTITION BY {', '.join(partition)} ORDER BY timestamp
+                ))::float8 AS diff
+            FROM public.{table}
+            WHERE {' AND '.join(conditions)}
+            """
+        )
+    if not selects:
+        return {}
+
+    keys = ', '.join(str(i + 1) for i in range(len(partition)))
+    sql = f"""
+        SELECT {', '.join(partition)},
+            count(*)::int8,
+            avg(value),
+            stddev_pop(value),
+            max(value),
+            min(value),
+            sum(value),
+            min(timestamp),
+            max(timestamp),
+            coalesce(avg(diff), 'NaN'),
+            coalesce(stddev_pop(diff), 'NaN'),
+            coalesce(max(diff), 'NaN'),
+            coalesce(min(diff), 'NaN')
+        FROM ({' UNION ALL '.join(selects)}) AS samples
+        GROUP BY {keys}
+        ORDER BY {keys}
+    """
+    dtypes = [
+        *(['int64'] * len(partition)),
+        'int64',
+        *(['float64'] * 5),
+        'datetime64[us]',
+        'datetime64[us]',
+        *(['float64'] * 4),
+    ]
+    columns = query_columns(sql, tuple(params), dtypes, using)
+
+    stats = {}
+    for row in zip(*columns):
+        chunk_id = int(row[0]) if chunk_ids is not None else None
+        stats[(chunk_id, int(row[len(partition) - 1]))] = dict(
+            zip(STATS, row[len(partition) :])
+        )
+    return stats
+
+
+# ----------------------------------------------------------------------
+def sample_stats(timestamps: np.ndarray, values: np.ndarray) -> dict[str, Any]:
+    """
+    Compute the statistics of the samples of a channel, with NumPy.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamps of the samples, at least one.
+    values : np.ndarray
+        The values of the samples.
+
+    Returns
+    -------
+    dict[str, Any]
+        The `STATS` of the samples, like `stats_columns`.
+    """
+    timestamps = timestamps.astype('datetime64[us]')
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    values = np.asarray(values, dtype=np.float64)[order]
+    diffs = np.diff(timestamps.astype(np.int64)) / 1e6
+    nan = float('nan')
+    return {
+        'count': len(values),
+        'avg': values.mean(),
+        'std': values.std(),
+        'max': values.max(),
+        'min': values.min(),
+        'sum': values.sum(),
+        'tmin': timestamps[0],
+        'tmax': timestamps[-1],
+        'avg_diff': diffs.mean() if len(diffs) else nan,
+        'std_diff': diffs.std() if len(diffs) else nan,
+        'max_diff': diffs.max() if len(diffs) else nan,
+        'min_diff': diffs.min() if len(diffs) else nan,
+    }
+
+
+# ----------------------------------------------------------------------
+def format_stats(
+    stats: dict[str, Any], channel: ChannelMetadata
+) -> tuple[dict[str, Optional[float]], dict[str, Optional[float]]]:
+    """
+    Return the value and timestamp statistics of a channel.
+
+    The statistics of the integer storages are scaled by the channel
+    `scale_factor`, and the undefined ones, like the intervals of a single
+    sample, are None.
+
+    Returns
+    -------
+    tuple[dict[str, Optional[float]], dict[str, Optional[float]]]
+        The value statistics and the timestamp statistics, with the names of
+        the list of timeseries.
+    """
+
+    def number(value: Any, scale: float = 1.0) -> Optional[float]:
+        value = float(value) * scale
+        return None if math.isnan(value) else value
+
+    scale = 1.0 if channel.storage == 'float64' else channel.scale_factor
+    bounds = sorted([number(stats['min'], scale), number(stats['max'], scale)])
+    tmin = stats['tmin'].astype('datetime64[us]').astype(np.int64) / 1e6
+    tmax = stats['tmax'].astype('datetime64[us]').astype(np.int64) / 1e6
+    values = {
+        'avg_value': number(stats['avg'], scale),
+        'std_value': number(stats['std'], abs(scale)),
+        'max_value': bounds[1],
+        'min_value': bounds[0],
+        'sum_value': number(stats['sum'], scale),
+    }
+    timestamps = {
+        'tmin': float(tmin),
+        'tmax': float(tmax),
+        'duration': float(tmax - tmin),
+        'avg_diff_timestamp': number(stats['avg_diff'], 1e3),
+        'std_diff_timestamp': number(stats['std_diff'], 1e3),
+        'max_diff_timestamp': number(stats['max_diff'], 1e3),
+        'min_diff_timestamp': number(stats['min_diff'], 1e3),
+    }
+    return values, timestamps
@@ -0,0 +1,421 @@
+"""
+========================
+Timescaledbapp Streaming
+========================
+
+This module provides a WebSocket endpoint to stream samples into the
+database over a single persistent connection. It is a plain ASGI
+application, so no additional dependency is needed: wrap the project's ASGI
+application with `StreamRouter` and the WebSocket connections to
+`TIMESCALEDB_STREAM['PATH']` are handled here, everything else is passed
+through.
+
+Protocol
+--------
+
+The producer authenticates once, with a JWT in the ``Authorization`` header
+of the handshake or in the ``bind`` message, and binds the connection to a
+measure::
+
+    {"type": "bind", "token": "...", "source": "...", "measure": "...",
+     "chunk": "...", "on_conflict": "skip"}
+
+The server answers with the flow control window, the number of frames that
+can be sent before waiting for an acknowledgement::
+
+    {"type": "bound", "window": 32, "channels": ["c0", "c1"]}
+
+Then every frame holds columnar samples, as a JSON text message with the
+same `timestamps` (or `t0`) and `values` fields as `TimeserieSerializer`,
+or as a binary message with an `.npz` archive (see :mod:`.parsers`). JSON frames
+can carry a `seq` number, binary frames are numbered in order::
+
+    {"seq": 1, "timestamps": [...], "values": {"c0": [...], "c1": [...]}}
+
+Frames are validated as they arrive and written in batches with the same
+ingest engine used by the REST API, when the window is half full or every
+`ACK_INTERVAL` seconds. After each write the server acknowledges every frame
+up to `seq`, which returns their credit to the producer::
+
+    {"type": "ack", "seq": 12, "frames": 8, "status": "success",
+     "objects_created": 800, "objects_updated": 0, "objects_skipped": 0}
+
+Invalid frames are answered with an ``error`` message with their `seq`, and
+count as acknowledged. The frames of a write that fails in the database are
+acknowledged with a ``'fail'`` status and a `message`. A producer that exceeds its window is disconnected.
+
+Classes
+-------
+
+.. rubric:: TimeserieStream
+
+Handles a single WebSocket connection.
+
+.. rubric:: StreamRouter
+
+ASGI application that sends the streaming connections to `TimeserieStream`
+and the rest to the wrapped application.
+
+Settings
+--------
+
+``TIMESCALEDB_STREAM``
+    A dictionary with ``'PATH'`` (default ``'/ws/timeserie/'``),
+    ``'WINDOW'`` (default 32 frames) and ``'ACK_INTERVAL'`` (default 0.5
+    seconds).
+
+"""
+
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Optional
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, router
+from django.db.utils import DatabaseError, IntegrityError
+from rest_framework import serializers
+from rest_framework.exceptions import APIException, ParseError
+
+from .cache import MeasureMetadata, metadata_cache
+from .ingest import conflict_policy, merge_tables, write_slices
+from .models import Chunk, Measure, TimeSerie
+from .parsers import NpzParser
+from .permissions import AdminPermission, ConsumerPermission, ProduserPermission
+from .serializers import TimeserieSerializer
+
+# WebSocket close codes
+POLICY_VIOLATION = 1008
+
+
+########################################################################
+class TimeserieStream:
+    """
+    Handles a streaming ingest WebSocket connection.
+
+    Parameters
+    ----------
+    scope : dict[str, Any]
+        The ASGI connection scope.
+    receive : Callable
+        The ASGI receive callable.
+    send : Callable
+        The ASGI send callable.
+    """
+
+    permission = AdminPermission | ConsumerPermission | ProduserPermission
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        scope: dict[str, Any],
+        receive: Callable[[], Awaitable[dict[str, Any]]],
+        send: Callable[[dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        """Initialize the connection state."""
+        config = getattr(settings, 'TIMESCALEDB_STREAM', {})
+        self.window = config.get('WINDOW', 32)
+        self.ack_interval = config.get('ACK_INTERVAL', 0.5)
+
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+
+        self.user = None
+        self.measure: Optional[MeasureMetadata] = None
+        self.chunk_id = None
+        self.on_conflict = None
+        self.bind_data = {}
+
+        self.seq = 0
+        self.pending = []
+        self.lock = asyncio.Lock()
+
+    # ----------------------------------------------------------------------
+    async def __call__(self) -> None:
+        """Run the connection until the client disconnects."""
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        await self.send({'type': 'websocket.accept'})
+
+        flusher = None
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+
+                if self.measure is None:
+                    if not await self.bind(message):
+                        return
+                    flusher = asyncio.create_task(self.flush_periodically())
+                    continue
+
+                if len(self.pending) >= self.window:
+                    await self.close("Flow control window exceeded.")
+                    return
+                await self.frame(message)
+                if len(self.pending) >= max(self.window // 2, 1):
+                    await self.flush()
+        finally:
+            if flusher:
+                flusher.cancel()
+            if self.measure is not None:
+                await self.flush(disconnected=True)
+
+    # ----------------------------------------------------------------------
+    async def bind(self, message: dict[str, Any]) -> bool:
+        """
+        Authenticate the producer and bind the connection to a measure.
+
+        Returns
+        -------
+        bool
+            True if the connection is bound, False if it was closed.
+        """
+        try:
+            data = json.loads(message.get('text') or message.get('bytes'))
+            if data.get('type') != 'bind':
+                raise ValueError("The first message must be a 'bind' message.")
+        except (TypeError, ValueError) as error:
+            await self.close(str(error))
+            return False
+
+        try:
+            self.user = await sync_to_async(self.authenticate)(
+                data.get('token')
+            )
+        except APIException as error:
+            await self.close(error.detail)
+            return False
+
+        source = data.get('source', '')
+        try:
+            self.measure = await sync_to_async(metadata_cache.get)(
+                source, data.get('measure')
+            )
+            self.on_conflict = conflict_policy(
+                data.get('on_conflict'), self.measure.conflict_policy
+            )
+        except Measure.DoesNotExist:
+            await self.close(f"Measure '{data.get('measure')}' does not exist.")
+            return False
+        except ValueError as error:
+            await self.close(str(error))
+            return False
+
+        self.chunk_id = await sync_to_async(self.get_chunk_id)(
+            data.get('chunk')
+        )
+        self.bind_data = {'source': source, 'measure': self.measure.label}
+        await self.send_json(
+            {
+                'type': 'bound',
+                'window': self.window,
+                'channels': list(self.measure.channels),
+            }
+        )
+        return True
+
+    # ----------------------------------------------------------------------
+    def authenticate(self, token: Optional[str]) -> Any:
+        """
+        Return the user of a JWT, from the bind message or the handshake.
+
+        Raises
+        ------
+        APIException
+            If the token is missing or invalid, or the user is not allowed to
+            write timeseries.
+        """
+        from rest_framework.exceptions import (
+            AuthenticationFailed,
+            PermissionDenied,
+        )
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+
+        authentication = JWTAuthentication()
+        if token:
+            raw = token.encode()
+        else:
+            headers = dict(self.scope.get('headers', []))
+            raw = authentication.get_raw_token(
+                headers.get(b'authorization', b'')
+            )
+        if not raw:
+            raise AuthenticationFailed("Authentication credentials were not provided.")
+
+        close_old_connections()
+        user = authentication.get_user(authentication.get_validated_token(raw))
+        if not self.permission().has_permission(SimpleNamespace(user=user), None):
+            raise PermissionDenied()
+        return user
+
+    # ----------------------------------------------------------------------
+    def get_chunk_id(self, label: Optional[str]) -> int:
+        """Return the chunk of the connection, created once per connection."""
+        if label:
+            return Chunk.objects.create(measure_id=self.measure.id, label=label).pk
+        return metadata_cache.get_default_chunk_id(
+            self.measure.source, self.measure.label
+        )
+
+    # ----------------------------------------------------------------------
+    async def frame(self, message: dict[str, Any]) -> None:
+        """
+        Validate a frame and queue its columns.
+
+        The frame is decoded and validated in a worker thread, like the
+        writes, so the other connections are not blocked meanwhile.
+        """
+        self.seq += 1
+        try:
+            data = await sync_to_async(self.decode)(message)
+            if message.get('bytes') is None:
+                self.seq = int(data.pop('seq', self.seq))
+            tables = await sync_to_async(self.columns)(data)
+        except (ValueError, TypeError, ParseError) as error:
+            await self.reject(self.seq, str(error))
+            return
+        except serializers.ValidationError as error:
+            await self.reject(self.seq, error.detail)
+            return
+
+        self.pending.append((self.seq, tables))
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def decode(message: dict[str, Any]) -> dict[str, Any]:
+        """Decode a frame, an `.npz` archive or a JSON object."""
+        if message.get('bytes') is not None:
+            return NpzParser().parse(io.BytesIO(message['bytes']))
+        data = json.loads(message['text'])
+        if not isinstance(data, dict):
+            raise ValueError("A frame must be a JSON object.")
+        return data
+
+    # ----------------------------------------------------------------------
+    def columns(self, data: dict[str, Any]) -> dict[type, dict[str, np.ndarray]]:
+        """
+        Validate the data of a frame and return its columns.
+
+        Raises
+        ------
+        serializers.ValidationError
+            If the frame is not valid for the measure.
+        """
+        serializer = TimeserieSerializer(data={**data, **self.bind_data})
+        serializer.is_valid(raise_exception=True)
+        serializer.check_channels(serializer.validated_data, self.measure)
+        return serializer.to_columns(
+            serializer.validated_data, self.measure, self.chunk_id
+        )
+
+    # ----------------------------------------------------------------------
+    async def reject(self, seq: int, errors: Any) -> None:
+        """Report an invalid frame, which counts as acknowledged."""
+        await self.send_json({'type': 'error', 'seq': seq, 'errors': errors})
+
+    # ----------------------------------------------------------------------
+    async def flush_periodically(self) -> None:
+        """Write the queued frames every `ack_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.ack_interval)
+            await self.flush()
+
+    # ----------------------------------------------------------------------
+    async def flush(self, disconnected: bool = False) -> None:
+        """
+        Write the queued frames in a single batch and acknowledge them.
+
+        When the write fails in the database, the frames are acknowledged
+        with a 'fail' status, so the producer can send them again, and the
+        connection goes on.
+        """
+        async with self.lock:
+            if not self.pending:
+                return
+            frames, self.pending = self.pending, []
+            tables = merge_tables(frame[1] for frame in frames)
+
+            ack = {'type': 'ack', 'seq': frames[-1][0], 'frames': len(frames)}
+            try:
+                result = await sync_to_async(self.write)(tables)
+            except IntegrityError:
+                ack.update(status='fail', message="Objects can not be created.")
+            except DatabaseError:
+                ack.update(status='fail', message="Objects can not be written.")
+            else:
+                ack.update(
+                    status='success',
+                    objects_created=result.inserted,
+                    objects_updated=result.updated,
+                    objects_skipped=result.skipped,
+                )
+
+        if not disconnected:
+            await self.send_json(ack)
+
+    # ----------------------------------------------------------------------
+    def write(self, tables: dict[type, dict[str, np.ndarray]]) -> Any:
+        """Write the columns of each table with the configured ingest engine."""
+        close_old_connections()
+        return write_slices(
+            tables.items(),
+            using=router.db_for_write(TimeSerie),
+            on_conflict=self.on_conflict,
+        )
+
+    # ----------------------------------------------------------------------
+    async def send_json(self, data: dict[str, Any]) -> None:
+        """Send a JSON text message."""
+        await self.send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    # ----------------------------------------------------------------------
+    async def close(self, errors: Any) -> None:
+        """Report an error and close the connection."""
+        await self.send_json({'type': 'error', 'errors': errors})
+        await self.send({'type': 'websocket.close', 'code': POLICY_VIOLATION})
+
+
+########################################################################
+class StreamRouter:
+    """
+    ASGI application that routes the streaming ingest connections.
+
+    Parameters
+    ----------
+    application : Callable
+        The ASGI application that handles everything else, usually the one
+        returned by `get_asgi_application`.
+
+    Examples
+    --------
+    In the project's ``asgi.py``::
+
+        application = StreamRouter(get_asgi_application())
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, application: Callable) -> None:
+        """Wrap an ASGI application."""
+        self.application = application
+        config = getattr(settings, 'TIMESCALEDB_STREAM', {})
+        self.path = config.get('PATH', '/ws/timeserie/')
+
+    # ----------------------------------------------------------------------
+    async def __call__(
+        self,
+        scope: dict[str, Any],
+        receive: Callable[[], Awaitable[dict[str, Any]]],
+        send: Callable[[dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        """Handle an ASGI connection."""
+        if scope['type'] == 'websocket' and scope['path'] == self.path:
+            await TimeserieStream(scope, receive, send)()
+            return
+        await self.application(scope, receive, send)
@@ -14,6 +14,7 @@ from .views import (
     TimeserieViewSet,
     ChunkViewSet,
     ping_view,
+    metrics_view,
     TimescaleConfigView,
 )
 
@@ -51,6 +52,7 @@ app_name = 'timescaledbapp'
 urlpatterns = [
     path('', include(router.urls)),
     path('ping/', ping_view, name='ping'),
+    path('metrics/', metrics_view, name='metrics'),
     path(
         'config/',
         TimescaleConfigView.as_view(),
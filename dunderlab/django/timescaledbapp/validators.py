@@ -0,0 +1,205 @@
+"""
+=========================
+Timescaledbapp Validators
+=========================
+
+This module provides the vectorized validation used by `TimeserieSerializer`.
+Each column is converted to a NumPy array once and checked with array
+operations, and the errors are reported by index range instead of once per
+element.
+
+Functions
+---------
+
+.. rubric:: validation_mode
+
+Returns the validation mode configured with `TIMESCALEDB_VALIDATION_MODE`.
+
+.. rubric:: index_ranges
+
+Formats the indices where a boolean mask is set as compact ranges.
+
+.. rubric:: to_float_array
+
+Converts a list of numbers into a float64 array.
+
+.. rubric:: check_finite
+
+Applies the NaN/inf policy configured with `TIMESCALEDB_NONFINITE_VALUES`.
+
+.. rubric:: check_monotonic
+
+Checks that an array of timestamps is strictly increasing.
+
+Settings
+--------
+
+``TIMESCALEDB_VALIDATION_MODE``
+    ``'vectorized'`` (default) or ``'strict'``. The strict mode validates
+    every sample with DRF's `FloatField`, as older versions did.
+
+``TIMESCALEDB_NONFINITE_VALUES``
+    ``'reject'`` (default) or ``'allow'`` NaN and infinite values.
+
+``TIMESCALEDB_REQUIRE_MONOTONIC``
+    Reject timestamps that are not strictly increasing, by default True.
+
+"""
+
+from typing import Any
+
+import numpy as np
+from django.conf import settings
+from rest_framework import serializers
+
+MAX_RANGES = 10
+
+
+# ----------------------------------------------------------------------
+def validation_mode() -> str:
+    """Return the configured validation mode, 'vectorized' or 'strict'."""
+    mode = getattr(settings, 'TIMESCALEDB_VALIDATION_MODE', 'vectorized')
+    if mode not in ('vectorized', 'strict'):
+        raise ValueError(f"Unknown TIMESCALEDB_VALIDATION_MODE: '{mode}'")
+    return mode
+
+
+# ----------------------------------------------------------------------
+def index_ranges(mask: np.ndarray) -> str:
+    """
+    Format the indices where `mask` is True as ranges.
+
+    Parameters
+    ----------
+    mask : np.ndarray
+        A boolean array.
+
+    Returns
+    -------
+    str
+        The ranges, e.g. '3-7, 12', truncated after `MAX_RANGES` ranges.
+
+    Examples
+    --------
+    >>> index_ranges(np.array([0, 1, 1, 1, 0, 1], dtype=bool))
+    '1-3, 5'
+    """
+    indices = np.flatnonzero(mask)
+    if not indices.size:
+        return ''
+
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    starts = indices[np.r_[0, breaks + 1]]
+    ends = indices[np.r_[breaks, indices.size - 1]]
+
+    ranges = [
+        f'{start}' if start == end else f'{start}-{end}'
+        for start, end in zip(starts[:MAX_RANGES], ends[:MAX_RANGES])
+    ]
+    if starts.size > MAX_RANGES:
+        ranges.append(f'... ({starts.size - MAX_RANGES} more)')
+    return ', '.join(ranges)
+
+
+# ----------------------------------------------------------------------
+def to_float_array(data: Any) -> np.ndarray:
+    """
+    Convert a list of numbers into a one-dimensional float64 array.
+
+    Parameters
+    ----------
+    data : Any
+        A list or array of numbers.
+
+    Returns
+    -------
+    np.ndarray
+        The values as float64.
+
+    Raises
+    ------
+    serializers.ValidationError
+        If the data is not a flat list of numbers. The invalid elements are
+        reported by index range.
+    """
+    if not isinstance(data, (list, tuple, np.ndarray)):
+        raise serializers.ValidationError(
+            "Invalid data type. Expected a list."
+        )
+
+    try:
+        array = np.asarray(data, dtype=np.float64)
+    except (TypeError, ValueError, OverflowError):
+        invalid = np.array([not is_number(item) for item in data])
+        raise serializers.ValidationError(
+            f"A valid number is required at indices {index_ranges(invalid)}."
+        )
+
+    if array.ndim != 1:
+        raise serializers.ValidationError(
+            "Invalid array. Expected a one-dimensional list of numbers."
+        )
+    return array
+
+
+# ----------------------------------------------------------------------
+def is_number(item: Any) -> bool:
+    """Check if a single element can be converted to float."""
+    try:
+        float(item)
+    except (TypeError, ValueError, OverflowError):
+        return False
+    return True
+
+
+# ----------------------------------------------------------------------
+def check_finite(array: np.ndarray) -> None:
+    """
+    Apply the NaN/inf policy to an array of values.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The values of a channel.
+
+    Raises
+    ------
+    serializers.ValidationError
+        If the policy is 'reject' and there are non-finite values.
+    """
+    policy = getattr(settings, 'TIMESCALEDB_NONFINITE_VALUES', 'reject')
+    if policy == 'allow':
+        return
+
+    finite = np.isfinite(array)
+    if not finite.all():
+        raise serializers.ValidationError(
+            f"Non-finite values at indices {index_ranges(~finite)}."
+        )
+
+
+# ----------------------------------------------------------------------
+def check_monotonic(timestamps: np.ndarray) -> None:
+    """
+    Check that the timestamps are strictly increasing.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamps.
+
+    Raises
+    ------
+    serializers.ValidationError
+        If a timestamp is not greater than the previous one. The indices of
+        the offending timestamps are reported.
+    """
+    if not getattr(settings, 'TIMESCALEDB_REQUIRE_MONOTONIC', True):
+        return
+
+    decreasing = np.r_[False, np.diff(timestamps) <= np.timedelta64(0)]
+    if decreasing.any():
+        raise serializers.ValidationError(
+            "Timestamps must be strictly increasing, "
+            f"failed at indices {index_ranges(decreasing)}."
+        )
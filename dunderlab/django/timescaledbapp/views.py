@@ -1,5 +1,5 @@
 import json
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
 
 import numpy as np
 from django.views import View
@@ -15,9 +15,44 @@ from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.request import Request
 from rest_framework import viewsets, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-
-from .paginators import Paginationx64, TimeseriePagination
+from rest_framework.settings import api_settings
+
+from .parsers import NpzParser, StreamingJSONParser
+from .blocks import BlockSamples, blocks_config, fits_period
+from .buckets import (
+    bucket_columns,
+    bucket_samples,
+    parse_aggregates,
+    parse_width,
+)
+from .cache import ChannelMetadata, metadata_cache
+from .converters import (
+    from_datetimes,
+    time_filter,
+    to_datetime64,
+    to_datetimes,
+)
+from .counters import get_counts
+from .decimation import DECIMATION_METHODS, decimate
+from .rollups import (
+    check_policies,
+    create_rollups,
+    rollup_columns,
+    rollup_policies,
+    select_resolution,
+)
+from .stats import format_stats, sample_stats, stats_columns
+from .fetch import channel_columns, channel_counts, sample_columns
+from .wide import WideSamples, unpack_rows
+from .buffer import get_ingest_buffer
+from .compression import compress_response, decompress_request
+from .paginators import (
+    Paginationx64,
+    TimeserieCursorPagination,
+    TimeseriePagination,
+)
 from .filters import ChannelFilter, MeasureFilter, SourceFilter
 from .permissions import (
     AdminPermission,
@@ -26,12 +61,17 @@ from .permissions import (
 )
 from .models import (
     TimeSerie,
+    TimeSerieInt16,
+    TimeSerieInt32,
+    TimeSerieBlock,
+    TimeSerieWide,
     Channel,
     Measure,
     Chunk,
     Source,
     Measure,
     Channel,
+    timeserie_model,
 )
 from .serializers import (
     SourceSerializer,
@@ -42,6 +82,9 @@ from .serializers import (
     TimeserieBrowsableSerializer,
 )
 
+# The timestamps and values of a channel without samples.
+EMPTY_SAMPLES = (np.empty(0, dtype='datetime64[us]'), np.empty(0))
+
 
 # ----------------------------------------------------------------------
 @csrf_exempt
@@ -66,61 +109,47 @@ def ping_view(request):
     )
 
 
+# ----------------------------------------------------------------------
+def metrics_view(request):
+    """Return the internal counters of the app, e.g. metadata cache hits."""
+    buffer = get_ingest_buffer()
+    return JsonResponse(
+        {
+            'metadata_cache': metadata_cache.info(),
+            'ingest_buffer': buffer.info() if buffer else None,
+        }
+    )
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class TimescaleConfigView(View):
 
+    # The hypertables of the samples, they share the chunk interval and the
+    # retention policy
+    hypertables = [
+        TimeSerie._meta.db_table,
+        TimeSerieInt16._meta.db_table,
+        TimeSerieInt32._meta.db_table,
+        TimeSerieBlock._meta.db_table,
+        TimeSerieWide._meta.db_table,
+    ]
+
     def get(self, request, *args, **kwargs):
         try:
+            hypertables = {}
             with connections['timescaledb'].cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT range_start, range_end
-                    FROM timescaledb_information.chunks
-                    WHERE hypertable_name = 'timescaledbapp_timeserie'
-                    ORDER BY range_start DESC
-                    LIMIT 1;
-                    """
-                )
-                result = cursor.fetchone()
-                if result:
-                    range_start, range_end = result
-                    # Calcular el chunk_interval como la diferencia entre range_end y range_start
-                    chunk_interval = range_end - range_start
-                    if chunk_interval.seconds == 0:
-                        chunk_interval = (
-                            'Not enought data to calculate chunk interval'
-                        )
-                    else:
-                        chunk_interval = self.convert_seconds(
-                            chunk_interval.seconds
-                        )
-                else:
-                    chunk_interval = "No chunks found"
-
-            with connections['timescaledb'].cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT config->>'drop_after' as retention_interval
-                    FROM timescaledb_information.jobs
-                    WHERE hypertable_name = 'timescaledbapp_timeserie'
-                    AND proc_name = 'policy_retention';
-                    """
-                )
-                retention_result = cursor.fetchone()
-                if retention_result:
-                    retention_interval = retention_result[0]
-                    # retention_interval = self.time_to_seconds(
-                    #     retention_interval
-                    # )
-                    # retention_interval = self.convert_seconds(
-                    #     retention_interval
-                    # )
+                for table in self.hypertables:
+                    hypertables[table] = self.hypertable_config(cursor, table)
+                rollups = rollup_policies(cursor)
 
+            config = hypertables[TimeSerie._meta.db_table]
             return JsonResponse(
                 {
                     'status': 'success',
-                    'chunk_interval': chunk_interval,
-                    'retention_interval': retention_interval,
+                    'chunk_interval': config['chunk_interval'],
+                    'retention_interval': config['retention_interval'],
+                    'hypertables': hypertables,
+                    'rollups': rollups,
                 }
             )
         except Exception as e:
@@ -128,6 +157,47 @@ class TimescaleConfigView(View):
                 {'status': 'error', 'message': str(e)}, status=500
             )
 
+    def hypertable_config(self, cursor, table):
+        """Return the chunk and retention intervals of a hypertable."""
+        cursor.execute(
+            """
+            SELECT range_start, range_end
+            FROM timescaledb_information.chunks
+            WHERE hypertable_name = %s
+            ORDER BY range_start DESC
+            LIMIT 1;
+            """,
+            [table],
+        )
+        result = cursor.fetchone()
+        if result:
+            range_start, range_end = result
+            # Calcular el chunk_interval como la diferencia entre range_end y range_start
+            chunk_interval = range_end - range_start
+            if chunk_interval.seconds == 0:
+                chunk_interval = 'Not enought data to calculate chunk interval'
+            else:
+                chunk_interval = self.convert_seconds(chunk_interval.seconds)
+        else:
+            chunk_interval = "No chunks found"
+
+        cursor.execute(
+            """
+            SELECT config->>'drop_after' as retention_interval
+            FROM timescaledb_information.jobs
+            WHERE hypertable_name = %s
+            AND proc_name = 'policy_retention';
+            """,
+            [table],
+        )
+        retention_result = cursor.fetchone()
+        retention_interval = retention_result[0] if retention_result else None
+
+        return {
+            'chunk_interval': chunk_interval,
+            'retention_interval': retention_interval,
+        }
+
     def post(self, request, *args, **kwargs):
 
         chunk_interval = request.POST.get(
@@ -150,35 +220,53 @@ class TimescaleConfigView(View):
             ),
         )
 
+        # Refresh policy of each rollup level, the missing levels are created
+        rollups = request.POST.get(
+            'rollups',
+            json.loads(request.body.decode('utf8')).get('rollups', {}),
+        )
+        if isinstance(rollups, str):
+            rollups = json.loads(rollups)
+        rollups = {
+            level: {name.lower(): value for name, value in policy.items()}
+            for level, policy in rollups.items()
+        }
+
         try:
             # Usa la conexión a la base de datos 'timescaledb'
             with connections['timescaledb'].cursor() as cursor:
-                # Actualizar el intervalo de chunks
-                cursor.execute(
-                    f"SELECT set_chunk_time_interval('timescaledbapp_timeserie', INTERVAL '{chunk_interval}');"
-                )
+                # The refresh of the rollups must not reach the dropped samples
+                try:
+                    check_policies(
+                        cursor,
+                        {**rollup_policies(cursor), **rollups},
+                        retention_interval,
+                    )
+                except ValueError as error:
+                    return JsonResponse(
+                        {'status': 'error', 'message': str(error)}, status=400
+                    )
 
-                # Verificar si existe una política de retención antes de intentar eliminarla
-                cursor.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM timescaledb_information.jobs
-                    WHERE hypertable_name = 'timescaledbapp_timeserie'
-                    AND proc_name = 'policy_retention';
-                    """
-                )
-                retention_policy_exists = cursor.fetchone()[0] > 0
+                for table in self.hypertables:
+                    # Actualizar el intervalo de chunks
+                    cursor.execute(
+                        "SELECT set_chunk_time_interval(%s, %s::interval);",
+                        [table, chunk_interval],
+                    )
 
-                if retention_policy_exists:
-                    # Eliminar la política de retención existente
+                    # Reemplazar la política de retención, si existe
+                    cursor.execute(
+                        "SELECT remove_retention_policy(%s, if_exists => true);",
+                        [table],
+                    )
                     cursor.execute(
-                        f"SELECT remove_retention_policy('timescaledbapp_timeserie');"
+                        "SELECT add_retention_policy(%s, %s::interval, schedule_interval => %s::interval);",
+                        [table, retention_interval, schedule_interval],
                     )
 
-                # Añadir la nueva política de retención
-                cursor.execute(
-                    f"SELECT add_retention_policy('timescaledbapp_timeserie', INTERVAL '{retention_interval}', schedule_interval => INTERVAL '{schedule_interval}');"
-                )
+                if rollups:
+                    create_rollups(cursor, rollups)
+                rollups = rollup_policies(cursor)
 
             return JsonResponse(
                 {
@@ -186,6 +274,8 @@ class TimescaleConfigView(View):
                     'chunk_interval': chunk_interval,
                     'retention_interval': retention_interval,
                     'schedule_interval': schedule_interval,
+                    'hypertables': self.hypertables,
+                    'rollups': rollups,
                 }
             )
         except Exception as e:
@@ -456,6 +546,47 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
         The serializer class used to serialize and deserialize Timeserie instances.
     pagination_class : Type[TimeseriePagination]
         The pagination class used to paginate the QuerySet.
+    parser_classes : list
+        `StreamingJSONParser` for large JSON uploads, the default parsers and
+        `NpzParser` for columnar uploads.
+
+    Request bodies can be compressed with ``gzip``, ``deflate`` or ``zstd``,
+    and the `list` responses are compressed with the encoding accepted by
+    the client (see :mod:`.compression`).
+
+    With ``timestamps=uniform`` (combined with ``absolute`` or ``relative``),
+    the timestamps of a uniformly sampled page are sent as ``{t0, dt, n}``,
+    with the period `dt` in seconds, instead of one timestamp per sample.
+
+    ``start`` and ``end``, as ISO 8601 strings or epoch seconds, only list
+    the samples between these times, included. The bounds are sent to the
+    database as constants, so the chunks of the hypertable out of the range
+    are not scanned.
+
+    ``bucket`` (e.g. ``1s``, ``500ms`` or ``5min``) aggregates the samples
+    of each channel in time buckets, and ``agg`` selects the aggregates, from
+    ``avg`` (default), ``min``, ``max``, ``first``, ``last``, ``sum`` and
+    ``count`` (see :mod:`.buckets`). The timestamps are the start of the
+    buckets, and the values of several aggregates are sent by name.
+
+    ``max_points`` picks the resolution of a range with a ``start`` for a
+    budget of points per channel: the raw samples when they fit, otherwise
+    buckets of the ``agg`` aggregates, read from the coarsest rollup that
+    is fine enough (see :mod:`.rollups`). The ``Timeserie-Resolution`` and
+    ``Timeserie-Rollup`` headers report the bucket width and rollup level.
+
+    ``method`` (``lttb`` or ``minmax``) with ``max_points`` decimates the
+    samples of each channel for plotting instead (see :mod:`.decimation`),
+    from the coarsest rollup with ``max_points`` buckets for long ranges.
+
+    ``stats=true`` sends the stats of the values and of the intervals
+    between the samples of each channel instead, over the whole range, or
+    channel, computed by the database for the 'row' layout (see
+    :mod:`.stats`). The channels, or the chunks, are paginated.
+
+    With ``pagination=cursor``, the samples of the 'row' layout are paged by
+    key with `TimeserieCursorPagination`, following the `cursor` of the
+    `next` and `previous` links.
 
     Methods
     -------
@@ -469,6 +600,11 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
         AdminPermission | ConsumerPermission | ProduserPermission
     ]
     pagination_class = TimeseriePagination
+    parser_classes = [
+        StreamingJSONParser,
+        *api_settings.DEFAULT_PARSER_CLASSES,
+        NpzParser,
+    ]
 
     # ----------------------------------------------------------------------
     def get_view_name(self) -> str:
@@ -482,6 +618,22 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
         else:
             return text
 
+    # ----------------------------------------------------------------------
+    def initial(self, request: Request, *args: Any, **kwargs: Any) -> None:
+        """Decompress the request body before it is parsed."""
+        decompress_request(request._request)
+        super().initial(request, *args, **kwargs)
+
+    # ----------------------------------------------------------------------
+    def finalize_response(
+        self, request: Request, response: Response, *args: Any, **kwargs: Any
+    ) -> Any:
+        """Compress the `list` responses while they are sent."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action == 'list':
+            return compress_response(request, response)
+        return response
+
     # ----------------------------------------------------------------------
     def list(self, request: Request, *args: Any, **kwargs: dict) -> Response:
         """
@@ -517,71 +669,246 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
         times = request.query_params.get('timestamps', 'single absolute')
         times_relative = 'relative' in times
         times_absolute = 'absolute' in times
+        times_uniform = 'uniform' in times
         if not times_absolute and not times_relative:
             times_absolute = True
 
         # Measure
         source_label = request.query_params.get('source')
         measure_label = request.query_params.get('measure')
-        measure = Measure.objects.select_related('source').get(
-            source_id=source_label, label=measure_label
-        )
+        try:
+            measure = metadata_cache.get(source_label, measure_label)
+        except Measure.DoesNotExist:
+            raise NotFound(f"Measure '{measure_label}' does not exist.")
 
         # Channel
-        channels = Channel.objects.filter(measure=measure)
-        # channels = Channel.objects.select_related('measure').filter(measure=measure)
-        channel_dict = {channel.label: channel for channel in channels}
+        channel_dict = measure.channels
         channel_labels = request.query_params.getlist(
             'channels', channel_dict.keys()
         )
+        unknown_labels = [
+            label for label in channel_labels if label not in channel_dict
+        ]
+        if unknown_labels:
+            raise ValidationError(
+                {
+                    'channels': [
+                        f"Unknown channel '{label}'." for label in unknown_labels
+                    ]
+                }
+            )
 
         # Chunks
         chunks_labels = request.query_params.getlist('chunks', None)
-        chunks = Chunk.objects.filter(
-            measure=measure, label__in=chunks_labels
-        )
-        # chunks = Chunk.objects.select_related('measure').filter(measure=measure, label__in=chunks_labels)
+
+        # Time range
+        timerange = self.time_range(request)
+
+        # Time buckets
+        bucket = request.query_params.get('bucket')
+        if bucket:
+            if stats:
+                raise ValidationError(
+                    {'bucket': ["Buckets can not be combined with stats."]}
+                )
+            try:
+                width = parse_width(bucket)
+            except ValueError as error:
+                raise ValidationError({'bucket': [str(error)]})
+            try:
+                aggregates = parse_aggregates(
+                    request.query_params.get('agg', 'avg')
+                )
+            except ValueError as error:
+                raise ValidationError({'agg': [str(error)]})
+
+        # Level of detail, for a budget of points per channel
+        level = None
+        max_points = request.query_params.get('max_points')
+        method = request.query_params.get('method')
+        if method and (bucket or not max_points):
+            raise ValidationError(
+                {'method': ["The decimation requires max_points, not bucket."]}
+            )
+        if max_points and not bucket:
+            timerange, max_points, level, width, aggregates = self.resolution(
+                request, measure, channel_labels, timerange, stats, method
+            )
+            bucket = width is not None and not method
 
         # Timeseries for chunks
+        paginator = self.paginator
         timeseries_by_channel_list = []
-        if chunks_labels:
-            timeseries_by_chunk = [
-                (chunk.label, chunk.timeseries.all()) for chunk in chunks
-            ]
+        if method:
+            timeseries_by_channel_list = self.decimated_timeseries(
+                measure,
+                channel_labels,
+                chunks_labels,
+                max_points,
+                method,
+                timerange,
+                level,
+            )
+
+        elif bucket:
+            timeseries_by_channel_list = self.bucket_timeseries(
+                measure,
+                channel_labels,
+                chunks_labels,
+                width,
+                aggregates,
+                timerange,
+                level,
+            )
+
+        elif stats:
+            timeseries_by_channel_list = self.stats_timeseries(
+                measure, channel_labels, chunks_labels, timerange
+            )
+
+        elif chunks_labels:
+            chunks = Chunk.objects.filter(
+                measure_id=measure.id, label__in=chunks_labels
+            )
+            timeseries_by_chunk = [(chunk.label, chunk.id) for chunk in chunks]
             timeseries_by_chunk = self.paginate_queryset(timeseries_by_chunk)
-            for chunk, timeserie in timeseries_by_chunk:
+            if measure.layout == 'row':
+                samples = channel_columns(
+                    [channel_dict[label] for label in channel_labels],
+                    chunk_ids=[chunk_id for _, chunk_id in timeseries_by_chunk],
+                    timerange=timerange,
+                )
+            for chunk, chunk_id in timeseries_by_chunk:
+                if measure.layout == 'wide':
+                    timeseries_by_channel = self.wide_timeseries(
+                        WideSamples(measure.id, chunk_id, timerange),
+                        channel_labels,
+                        channel_dict,
+                    )
+                    timeseries_by_channel_list.append(
+                        (chunk, timeseries_by_channel)
+                    )
+                    continue
+
                 timeseries_by_channel = {}
                 for channel_label in channel_labels:
                     channel = channel_dict[channel_label]
-                    times_values = [
-                        (ts.timestamp, ts.value)
-                        for ts in timeserie.filter(channel=channel)
-                    ]
-                    timestamps, values = zip(*times_values)
-                    timeseries_by_channel[channel_label] = {
-                        'timestamps': np.array(timestamps),
-                        'values': np.array(values),
-                    }
+                    if measure.layout == 'row':
+                        timestamps, values = samples.get(
+                            (chunk_id, channel.id), EMPTY_SAMPLES
+                        )
+                    else:
+                        timestamps, values = sample_columns(
+                            self.channel_samples(
+                                channel, measure.layout, chunk_id, timerange
+                            )
+                        )
+                    if len(timestamps):
+                        timeseries_by_channel[channel_label] = {
+                            'timestamps': timestamps,
+                            'values': self.channel_values(channel, values),
+                        }
                 timeseries_by_channel_list.append(
                     (chunk, timeseries_by_channel)
                 )
 
+        # Timeseries of all the channels, read at once
+        elif measure.layout == 'wide':
+            timeseries_by_channel = self.wide_timeseries(
+                self.paginate_queryset(
+                    WideSamples(measure.id, timerange=timerange)
+                ),
+                channel_labels,
+                channel_dict,
+            )
+            timeseries_by_channel_list.append((None, timeseries_by_channel))
+
+        # Timeseries of the channels stored by row, paged by key
+        elif measure.layout == 'row' and TimeserieCursorPagination.requested(
+            request
+        ):
+            paginator = TimeserieCursorPagination()
+            samples = paginator.paginate_channels(
+                [channel_dict[label] for label in channel_labels],
+                request,
+                self,
+                timerange=timerange,
+            )
+
+            timeseries_by_channel = {}
+            for channel_label in channel_labels:
+                channel = channel_dict[channel_label]
+                if channel.id in samples:
+                    timestamps, values = samples[channel.id]
+                    timeseries_by_channel[channel_label] = {
+                        'timestamps': timestamps,
+                        'values': self.channel_values(channel, values),
+                    }
+            timeseries_by_channel_list.append((None, timeseries_by_channel))
+
+        # Timeseries of the channels stored by row
+        elif measure.layout == 'row':
+            # Paginate the positions of the samples of each channel, then
+            # read the pages of every channel with a single query
+            if any(bound is not None for bound in timerange):
+                counts = channel_counts(
+                    [channel_dict[label] for label in channel_labels],
+                    timerange,
+                )
+            else:
+                counts = get_counts(
+                    channel_dict[label].id for label in channel_labels
+                )
+            pages = {
+                channel_label: self.paginate_queryset(
+                    range(counts.get(channel_dict[channel_label].id, 0))
+                )
+                for channel_label in channel_labels
+            }
+            start = min((page.start for page in pages.values()), default=0)
+            stop = max((page.stop for page in pages.values()), default=0)
+            samples = channel_columns(
+                [channel_dict[label] for label in channel_labels],
+                start,
+                stop,
+                timerange=timerange,
+            )
+
+            timeseries_by_channel = {}
+            for channel_label, page in pages.items():
+                channel = channel_dict[channel_label]
+                timestamps, values = samples.get(
+                    (None, channel.id), EMPTY_SAMPLES
+                )
+                page_slice = slice(page.start - start, page.stop - start)
+                timestamps = timestamps[page_slice]
+                if len(timestamps):
+                    timeseries_by_channel[channel_label] = {
+                        'timestamps': timestamps,
+                        'values': self.channel_values(
+                            channel, values[page_slice]
+                        ),
+                    }
+            timeseries_by_channel_list.append((None, timeseries_by_channel))
+
         # Timeseries
         else:
             timeseries_by_channel = {}
             for channel_label in channel_labels:
                 channel = channel_dict[channel_label]
 
-                timeserie = self.paginate_queryset(channel.timeseries.all())
+                timestamps, values = sample_columns(
+                    self.paginate_queryset(
+                        self.channel_samples(
+                            channel, measure.layout, timerange=timerange
+                        )
+                    )
+                )
 
-                if timeserie:
-                    times_values = [
-                        (ts.timestamp, ts.value) for ts in timeserie
-                    ]
-                    timestamps, values = zip(*times_values)
+                if len(timestamps):
                     timeseries_by_channel[channel_label] = {
-                        'timestamps': np.array(timestamps),
-                        'values': np.array(values),
+                        'timestamps': timestamps,
+                        'values': self.channel_values(channel, values),
                     }
             timeseries_by_channel_list.append((None, timeseries_by_channel))
 
@@ -607,45 +934,13 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
 
                 timeseries = timeseries_by_channel[channel_label]
 
-                if stats:  # Stats for values
-                    results['values'][channel_label] = {
-                        "avg_value": timeseries['values'].mean(),
-                        "std_value": timeseries['values'].std(),
-                        "max_value": timeseries['values'].max(),
-                        "min_value": timeseries['values'].min(),
-                        "sum_value": timeseries['values'].sum(),
-                    }
-
-                    # timeseries_stats = TimeSerie.objects.filter(channel=channel).aggregate(
-                    # avg_value=Avg('value'),
-                    # std_value=StdDev('value'),
-                    # max_value=Max('value'),
-                    # min_value=Min('value'),
-                    # sum_value=Sum('value'),
-                    # )
-
-                else:  # Values
-                    results['values'][channel_label] = timeseries['values']
+                # Values, or their stats
+                results['values'][channel_label] = timeseries['values']
 
                 if times_ or times_single:
 
                     if stats:
-                        times_r = [
-                            t.timestamp() for t in timeseries['timestamps']
-                        ]
-                        timestamp_stats = {
-                            "tmin": times_r[0],
-                            "tmax": times_r[-1],
-                            "duration": times_r[-1] - times_r[0],
-                            "avg_diff_timestamp": np.diff(times_r).mean()
-                            * 1000,
-                            "std_diff_timestamp": np.diff(times_r).std()
-                            * 1000,
-                            "max_diff_timestamp": np.diff(times_r).max()
-                            * 1000,
-                            "min_diff_timestamp": np.diff(times_r).min()
-                            * 1000,
-                        }
+                        timestamp_stats = timeseries['timestamps']
                         if times_single:
                             results['timestamps'] = timestamp_stats
                         else:
@@ -655,12 +950,20 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
 
                     else:
                         if times_absolute:
-                            timestamps = timeseries['timestamps']
+                            timestamps = to_datetimes(timeseries['timestamps'])
                         elif times_relative:
-                            timestamps = [
-                                t.timestamp() * 1000
-                                for t in timeseries['timestamps']
-                            ]
+                            timestamps = (
+                                timeseries['timestamps'].astype(np.int64) / 1e3
+                            )
+
+                        if times_uniform and (
+                            dt := self.sample_period(timeseries['timestamps'])
+                        ):
+                            timestamps = {
+                                't0': timestamps[0],
+                                'dt': dt,
+                                'n': len(timestamps),
+                            }
 
                         if times_single:
                             results['timestamps'] = timestamps
@@ -680,7 +983,545 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
         else:
             serializer = self.get_serializer(results_list[0])
 
-        return self.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if max_points:
+            response['Timeserie-Resolution'] = (
+                'raw' if width is None else f'{width / np.timedelta64(1, "s"):g}s'
+            )
+            if level:
+                response['Timeserie-Rollup'] = level
+            if method:
+                response['Timeserie-Decimation'] = method
+        return response
+
+    # ----------------------------------------------------------------------
+    def resolution(
+        self,
+        request: Request,
+        measure: Any,
+        channel_labels: Sequence[str],
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+        stats: bool = False,
+        method: Optional[str] = None,
+    ) -> tuple[
+        tuple[np.datetime64, np.datetime64],
+        int,
+        Optional[str],
+        Optional[np.timedelta64],
+        Sequence[str],
+    ]:
+        """
+        Pick the resolution of the list for the `max_points` query parameter.
+
+        The range requires a `start`, and ends now without an `end`. The
+        page size is `max_points`, unless `page_size` is given, so a page
+        holds the points of a channel.
+
+        With a decimation `method`, the samples are read from the rollup
+        level whose min/max buckets are fine enough, or raw, and the width
+        is the width of the level, None for the raw samples.
+
+        Returns
+        -------
+        tuple
+            The time range, `max_points`, the rollup level and bucket width
+            (see `select_resolution`), and the aggregates.
+
+        Raises
+        ------
+        ValidationError
+            If `max_points` is not a positive integer, there is no `start`,
+            the stats are requested, or the method is unknown.
+        """
+        try:
+            max_points = int(request.query_params['max_points'])
+            if max_points < 1:
+                raise ValueError
+        except ValueError:
+            raise ValidationError(
+                {'max_points': ["The points must be a positive integer."]}
+            )
+        if stats:
+            raise ValidationError(
+                {'max_points': ["The points can not be combined with stats."]}
+            )
+        start, end = timerange
+        if start is None:
+            raise ValidationError(
+                {'start': ["A start time is required with max_points."]}
+            )
+        if end is None:
+            end = np.datetime64(timezone.now().replace(tzinfo=None), 'us')
+        try:
+            aggregates = parse_aggregates(request.query_params.get('agg', 'avg'))
+        except ValueError as error:
+            raise ValidationError({'agg': [str(error)]})
+        if method:
+            if method not in DECIMATION_METHODS:
+                raise ValidationError(
+                    {
+                        'method': [
+                            f"Unknown method: '{method}', use "
+                            f"{', '.join(DECIMATION_METHODS)}."
+                        ]
+                    }
+                )
+            aggregates = ['min', 'max']
+
+        rates = [
+            measure.channels[label].sampling_rate
+            for label in channel_labels
+            if measure.channels[label].sampling_rate
+        ]
+        level, width = select_resolution(
+            (start, end), max_points, max(rates, default=None), aggregates
+        )
+        if (
+            measure.layout != 'row'
+            or connections[TimeSerie.objects.db].vendor != 'postgresql'
+        ):
+            level = None
+        if method:
+            width = parse_width(level) if level else None
+        if 'page_size' not in request.query_params:
+            self.paginator.page_size = max_points
+        return (start, end), max_points, level, width, aggregates
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def time_range(
+        request: Request,
+    ) -> tuple[Optional[np.datetime64], Optional[np.datetime64]]:
+        """
+        Return the `start` and `end` query parameters as naive UTC times.
+
+        The times are given as ISO 8601 strings, the naive ones in the current
+        time zone, or as epoch seconds. A missing bound is None.
+
+        Raises
+        ------
+        ValidationError
+            If a time can not be parsed, or the range is empty.
+        """
+        bounds = []
+        for name in ['start', 'end']:
+            value = request.query_params.get(name)
+            if not value:
+                bounds.append(None)
+                continue
+            try:
+                try:
+                    time = to_datetime64([float(value)])
+                except ValueError:
+                    time = to_datetime64([value])
+            except ValueError as error:
+                raise ValidationError({name: [str(error)]})
+            bounds.append(time[0])
+
+        start, end = bounds
+        if start is not None and end is not None and start > end:
+            raise ValidationError({'end': ["The end is before the start."]})
+        return start, end
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def channel_samples(
+        channel: ChannelMetadata,
+        layout: str = 'row',
+        chunk_id: Optional[int] = None,
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+            None,
+            None,
+        ),
+    ) -> Sequence:
+        """
+        Return the samples of a channel, optionally of a single chunk and
+        time range.
+
+        The samples are read from the table of the channel storage, or
+        unpacked from the block table for the measures with the 'block'
+        layout. Either way they have a `timestamp` and a `value`.
+        """
+        if layout == 'block':
+            return BlockSamples(channel, chunk_id, timerange)
+        queryset = timeserie_model(channel.storage).objects.filter(
+            time_filter(*timerange), channel_id=channel.id
+        )
+        if chunk_id is not None:
+            queryset = queryset.filter(chunk_id=chunk_id)
+        return queryset
+
+    # ----------------------------------------------------------------------
+    def bucket_timeseries(
+        self,
+        measure: Any,
+        channel_labels: Sequence[str],
+        chunks_labels: Optional[Sequence[str]],
+        width: np.timedelta64,
+        aggregates: Sequence[str],
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+        level: Optional[str] = None,
+    ) -> Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]:
+        """
+        Aggregate the samples of the channels of a measure in time buckets.
+
+        With `chunks`, the chunks are paginated and every bucket of each one
+        is returned, otherwise the buckets of each channel are paginated like
+        its samples. The 'values' of a channel are the array of the
+        aggregate, or a dictionary of arrays for several aggregates. With a
+        rollup `level`, the buckets are aggregated from its continuous
+        aggregates instead of the raw samples.
+
+        Returns
+        -------
+        Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]
+            The 'timestamps', the start of the buckets, and the 'values' of
+            each channel with samples, by chunk label (None without chunks).
+        """
+        channels = [measure.channels[label] for label in channel_labels]
+        chunks, chunk_ids = self.chunk_pages(measure, chunks_labels)
+        if level:
+            buckets = rollup_columns(
+                channels, level, width, aggregates, timerange, chunk_ids
+            )
+        elif (
+            measure.layout == 'row'
+            and connections[TimeSerie.objects.db].vendor == 'postgresql'
+        ):
+            buckets = bucket_columns(
+                channels, width, aggregates, timerange, chunk_ids
+            )
+        else:
+            buckets = self.channel_buckets(
+                measure, channels, width, aggregates, timerange, chunk_ids
+            )
+
+        timeseries_by_channel_list = []
+        for chunk, chunk_id in chunks:
+            timeseries_by_channel = {}
+            for channel, channel_label in zip(channels, channel_labels):
+                starts, columns = buckets.get(
+                    (chunk_id, channel.id), (EMPTY_SAMPLES[0], {})
+                )
+                if chunk_ids is None:
+                    page = self.paginate_queryset(range(len(starts)))
+                    starts = starts[page.start : page.stop]
+                    columns = {
+                        name: column[page.start : page.stop]
+                        for name, column in columns.items()
+                    }
+                if not len(starts):
+                    continue
+
+                values = {
+                    name: (
+                        column
+                        if name == 'count'
+                        else self.channel_values(channel, column)
+                    )
+                    for name, column in columns.items()
+                }
+                timeseries_by_channel[channel_label] = {
+                    'timestamps': starts,
+                    'values': (
+                        values[aggregates[0]] if len(aggregates) == 1 else values
+                    ),
+                }
+            timeseries_by_channel_list.append((chunk, timeseries_by_channel))
+        return timeseries_by_channel_list
+
+    # ----------------------------------------------------------------------
+    def decimated_timeseries(
+        self,
+        measure: Any,
+        channel_labels: Sequence[str],
+        chunks_labels: Optional[Sequence[str]],
+        max_points: int,
+        method: str,
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+        level: Optional[str] = None,
+    ) -> Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]:
+        """
+        Decimate the samples of the channels of a measure for plotting.
+
+        At most `max_points` samples of each channel, and chunk, are kept
+        with the `method` of :mod:`.decimation`. With a rollup `level`, the
+        lowest and highest values of each of its buckets are decimated
+        instead of the raw samples, both at the start of the bucket. The
+        chunks are paginated like in `bucket_timeseries`.
+
+        Returns
+        -------
+        Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]
+            The 'timestamps' and 'values' of each channel with samples, by
+            chunk label (None without chunks).
+        """
+        channels = [measure.channels[label] for label in channel_labels]
+        chunks, chunk_ids = self.chunk_pages(measure, chunks_labels)
+        if level:
+            samples = {
+                key: (
+                    np.repeat(starts, 2),
+                    np.column_stack([columns['min'], columns['max']]).ravel(),
+                )
+                for key, (starts, columns) in rollup_columns(
+                    channels,
+                    level,
+                    parse_width(level),
+                    ['min', 'max'],
+                    timerange,
+                    chunk_ids,
+                ).items()
+            }
+        else:
+            samples = self.raw_columns(measure, channels, timerange, chunk_ids)
+
+        timeseries_by_channel_list = []
+        for chunk, chunk_id in chunks:
+            timeseries_by_channel = {}
+            for channel, channel_label in zip(channels, channel_labels):
+                timestamps, values = samples.get(
+                    (chunk_id, channel.id), EMPTY_SAMPLES
+                )
+                if not len(timestamps):
+                    continue
+                timestamps, values = decimate(
+                    timestamps, values, max_points, method
+                )
+                if chunk_ids is None:
+                    page = self.paginate_queryset(range(len(timestamps)))
+                    timestamps = timestamps[page.start : page.stop]
+                    values = values[page.start : page.stop]
+                timeseries_by_channel[channel_label] = {
+                    'timestamps': timestamps,
+                    'values': self.channel_values(channel, values),
+                }
+            timeseries_by_channel_list.append((chunk, timeseries_by_channel))
+        return timeseries_by_channel_list
+
+    # ----------------------------------------------------------------------
+    def stats_timeseries(
+        self,
+        measure: Any,
+        channel_labels: Sequence[str],
+        chunks_labels: Optional[Sequence[str]],
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+    ) -> Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]:
+        """
+        Compute the stats of the channels of a measure over a time range.
+
+        The stats cover every sample of the range, the chunks are paginated
+        like in `bucket_timeseries`, otherwise the channels are paginated.
+        The samples of the 'row' layout are aggregated by PostgreSQL, see
+        :mod:`.stats`.
+
+        Returns
+        -------
+        Sequence[tuple[Optional[str], dict[str, dict[str, Any]]]]
+            The 'timestamps' and 'values' stats of each channel with
+            samples, by chunk label (None without chunks).
+        """
+        chunks, chunk_ids = self.chunk_pages(measure, chunks_labels)
+        if chunk_ids is None:
+            channel_labels = self.paginate_queryset(list(channel_labels))
+        channels = [measure.channels[label] for label in channel_labels]
+
+        if (
+            measure.layout == 'row'
+            and connections[TimeSerie.objects.db].vendor == 'postgresql'
+        ):
+            stats = stats_columns(channels, timerange, chunk_ids)
+        else:
+            stats = {
+                key: sample_stats(timestamps, values)
+                for key, (timestamps, values) in self.raw_columns(
+                    measure, channels, timerange, chunk_ids
+                ).items()
+                if len(timestamps)
+            }
+
+        timeseries_by_channel_list = []
+        for chunk, chunk_id in chunks:
+            timeseries_by_channel = {}
+            for channel, channel_label in zip(channels, channel_labels):
+                if (chunk_id, channel.id) in stats:
+                    values, timestamps = format_stats(
+                        stats[(chunk_id, channel.id)], channel
+                    )
+                    timeseries_by_channel[channel_label] = {
+                        'timestamps': timestamps,
+                        'values': values,
+                    }
+            timeseries_by_channel_list.append((chunk, timeseries_by_channel))
+        return timeseries_by_channel_list
+
+    # ----------------------------------------------------------------------
+    def chunk_pages(
+        self, measure: Any, chunks_labels: Optional[Sequence[str]]
+    ) -> tuple[
+        Sequence[tuple[Optional[str], Optional[int]]], Optional[Sequence[int]]
+    ]:
+        """
+        Return the page of the requested chunks, as (label, id) pairs, and
+        their ids, or a single chunk None and no ids without chunks.
+        """
+        if not chunks_labels:
+            return [(None, None)], None
+        chunks = Chunk.objects.filter(
+            measure_id=measure.id, label__in=chunks_labels
+        )
+        chunks = self.paginate_queryset(
+            [(chunk.label, chunk.id) for chunk in chunks]
+        )
+        return chunks, [chunk_id for _, chunk_id in chunks]
+
+    # ----------------------------------------------------------------------
+    def channel_buckets(
+        self,
+        measure: Any,
+        channels: Sequence[ChannelMetadata],
+        width: np.timedelta64,
+        aggregates: Sequence[str],
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+        chunk_ids: Optional[Sequence[int]] = None,
+    ) -> dict[tuple[Optional[int], int], tuple[np.ndarray, dict[str, np.ndarray]]]:
+        """
+        Read the samples of the channels, and aggregate them with NumPy.
+
+        Used for the layouts, and backends, without `time_bucket`. The
+        samples keep their raw integer counts, like in `bucket_columns`.
+        """
+        return {
+            key: bucket_samples(timestamps, values, width, aggregates)
+            for key, (timestamps, values) in self.raw_columns(
+                measure, channels, timerange, chunk_ids
+            ).items()
+            if len(timestamps)
+        }
+
+    # ----------------------------------------------------------------------
+    def raw_columns(
+        self,
+        measure: Any,
+        channels: Sequence[ChannelMetadata],
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]],
+        chunk_ids: Optional[Sequence[int]] = None,
+    ) -> dict[tuple[Optional[int], int], tuple[np.ndarray, np.ndarray]]:
+        """
+        Read the samples of the channels, whichever layout they are stored
+        in, keyed by chunk id (None without `chunk_ids`) and channel id.
+
+        The samples keep their raw integer counts.
+        """
+        if measure.layout == 'row':
+            samples = channel_columns(
+                channels, chunk_ids=chunk_ids, timerange=timerange
+            )
+        else:
+            samples = {}
+            labels = {
+                channel.id: label for label, channel in measure.channels.items()
+            }
+            for chunk_id in chunk_ids if chunk_ids is not None else [None]:
+                if measure.layout == 'wide':
+                    timeseries_by_channel = self.wide_timeseries(
+                        WideSamples(measure.id, chunk_id, timerange),
+                        [labels[channel.id] for channel in channels],
+                        measure.channels,
+                        scale=False,
+                    )
+                    for channel in channels:
+                        timeseries = timeseries_by_channel.get(labels[channel.id])
+                        if timeseries:
+                            samples[(chunk_id, channel.id)] = (
+                                timeseries['timestamps'],
+                                timeseries['values'],
+                            )
+                    continue
+
+                for channel in channels:
+                    samples[(chunk_id, channel.id)] = sample_columns(
+                        BlockSamples(channel, chunk_id, timerange)
+                    )
+        return samples
+
+    # ----------------------------------------------------------------------
+    def wide_timeseries(
+        self,
+        rows: Sequence,
+        channel_labels: Sequence[str],
+        channel_dict: dict[str, ChannelMetadata],
+        scale: bool = True,
+    ) -> dict[str, dict[str, np.ndarray]]:
+        """
+        Split the rows of a 'wide' measure by channel.
+
+        Parameters
+        ----------
+        rows : Sequence
+            The rows, with a `timestamp` and the packed `values`.
+        channel_labels : Sequence[str]
+            The labels of the channels to return.
+        channel_dict : dict[str, ChannelMetadata]
+            The metadata of the channels of the measure.
+        scale : bool, optional
+            Scale the raw integer counts, True by default.
+
+        Returns
+        -------
+        dict[str, dict[str, np.ndarray]]
+            The 'timestamps' and 'values' of each channel with samples in
+            the rows, keyed by label.
+        """
+        rows = list(rows)
+        timestamps = from_datetimes([row.timestamp for row in rows])
+        matrix = unpack_rows([row.values for row in rows])
+
+        timeseries_by_channel = {}
+        for channel_label in channel_labels:
+            channel = channel_dict[channel_label]
+            if channel.index is None or channel.index >= matrix.shape[1]:
+                continue
+            column = matrix[:, channel.index]
+            present = ~np.isnan(column)
+            if present.any():
+                values = column[present]
+                timeseries_by_channel[channel_label] = {
+                    'timestamps': timestamps[present],
+                    'values': (
+                        self.channel_values(channel, values) if scale else values
+                    ),
+                }
+        return timeseries_by_channel
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def sample_period(timestamps: np.ndarray) -> Optional[float]:
+        """
+        Return the period, in seconds, of uniformly spaced timestamps.
+
+        The timestamps are given as a `datetime64` array.
+
+        Returns None for fewer than two timestamps, or when they are not
+        rebuilt from their period within the `TIMESCALEDB_BLOCKS` tolerance,
+        e.g. because of a gap, so they are sent explicitly.
+        """
+        if len(timestamps) < 2:
+            return None
+        times = timestamps.astype('datetime64[us]').astype(np.int64)
+        if not fits_period(times, blocks_config()['TOLERANCE']):
+            return None
+        return float(times[-1] - times[0]) / (len(times) - 1) / 1e6
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def channel_values(
+        channel: ChannelMetadata, values: Sequence[float]
+    ) -> np.ndarray:
+        """Return the values of a channel, scaling the raw integer counts."""
+        if channel.storage == 'float64':
+            return np.asarray(values, dtype=np.float64)
+        return np.array(values, dtype=np.float64) * channel.scale_factor
 
     # ----------------------------------------------------------------------
     def create(self, request, format=None):
@@ -689,12 +1530,7 @@ class TimeserieViewSet(CustomCreateViewSet, viewsets.ModelViewSet):
             data=request.data, many=isinstance(request.data, list)
         )
         if serializer.is_valid():
-            response = serializer.save()
-            if isinstance(response, list):
-                return Response(
-                    [r.data for r in response], status=status.HTTP_200_OK
-                )
-            return response
+            return serializer.save()
         return Response(
             serializer.errors, status=status.HTTP_400_BAD_REQUEST
         )
@@ -0,0 +1,256 @@
+"""
+===================
+Timescaledbapp Wide
+===================
+
+This module provides the wide layout of the samples, used by the measures
+with the 'wide' layout. Multichannel devices sample all their channels at
+the same instants, so instead of one row per sample, every timestamp of a
+chunk is stored once in the `TimeSerieWide` table, with the values of all
+the channels:
+
+``values``
+    The values, packed as little-endian float64 at the `Channel.index` of
+    each channel. Channels without a sample at a timestamp, or added after
+    the row was written, read as NaN. The indexes are unique within a
+    measure and never reused, see `signals.assign_channel_index`.
+
+``n``
+    The number of samples of the row, the values that are not NaN.
+
+The values are stored as they are sent, so the integer channels keep their
+raw counts, which are multiplied by their scale factor when read.
+
+Each row is written whole, so the uploads of a wide measure must send all
+its channels at once, the uploads of a subset of the channels are rejected
+by `TimeserieSerializer`, as a later upload of the other channels would
+conflict with, or overwrite, the rows of the first one. Conflicts are
+detected per timestamp and chunk. The
+sample counts of the channels are not kept for this layout, the list
+endpoint counts the rows of the measure instead.
+
+Functions
+---------
+
+.. rubric:: wide_columns
+
+Packs the samples of several channels into the columns of the wide table.
+
+.. rubric:: pack_rows
+
+Packs a matrix of values, one column per channel index, into the columns of
+the wide table.
+
+.. rubric:: unpack_rows
+
+Unpacks the values of a sequence of rows into a matrix.
+
+Classes
+-------
+
+.. rubric:: WideRow
+
+A single row, with a `timestamp` and the packed `values`.
+
+.. rubric:: WideSamples
+
+The rows of a measure, as a sequence that only reads the rows of the slices
+requested by the paginator.
+
+"""
+
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Union
+
+import numpy as np
+from django.utils.functional import cached_property
+
+from .cache import ChannelMetadata
+from .converters import time_filter, uniform_timestamps
+from .models import TimeSerieWide
+
+
+# ----------------------------------------------------------------------
+def wide_columns(
+    timestamps: Optional[np.ndarray],
+    values: dict[str, np.ndarray],
+    channels: dict[str, ChannelMetadata],
+    chunk_id: int,
+    t0: Optional[np.datetime64] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Pack the samples of several channels into the columns of the wide table.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray or None
+        The `datetime64[us]` timestamps shared by all the channels, None
+        when `t0` is given.
+    values : dict[str, np.ndarray]
+        The values of each channel, keyed by channel label.
+    channels : dict[str, ChannelMetadata]
+        The metadata of the channels, keyed by label.
+    chunk_id : int
+        The id of the chunk the samples belong to.
+    t0 : np.datetime64, optional
+        The timestamp of the first sample of every channel, which share
+        their `sampling_rate`.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The `timestamp`, `n`, `values` and `chunk_id` columns.
+    """
+    length = max(map(len, values.values()), default=0)
+    if t0 is not None and values:
+        rate = channels[next(iter(values))].sampling_rate
+        timestamps = uniform_timestamps(t0, rate, length)
+
+    width = max((channels[label].index + 1 for label in values), default=0)
+    matrix = np.full((length, width), np.nan)
+    for label, array in values.items():
+        matrix[: len(array), channels[label].index] = array
+    return pack_rows(timestamps[:length], matrix, chunk_id)
+
+
+# ----------------------------------------------------------------------
+def pack_rows(
+    timestamps: np.ndarray, matrix: np.ndarray, chunk_id: int
+) -> dict[str, np.ndarray]:
+    """
+    Pack a matrix of values into the columns of the wide table.
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        The `datetime64[us]` timestamp of each row of the matrix.
+    matrix : np.ndarray
+        The values, one column per channel index, NaN for the missing
+        samples.
+    chunk_id : int
+        The id of the chunk the samples belong to.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The `timestamp`, `n`, `values` and `chunk_id` columns.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype='<f8')
+    packed = np.empty(len(matrix), dtype=object)
+    packed[:] = [row.tobytes() for row in matrix]
+    return {
+        'timestamp': timestamps,
+        'n': (~np.isnan(matrix)).sum(axis=1, dtype=np.int32),
+        'values': packed,
+        'chunk_id': np.full(len(matrix), chunk_id, dtype=np.int32),
+    }
+
+
+# ----------------------------------------------------------------------
+def unpack_rows(values: list[bytes]) -> np.ndarray:
+    """
+    Unpack the values of a sequence of rows into a matrix.
+
+    Parameters
+    ----------
+    values : list[bytes]
+        The packed values of each row.
+
+    Returns
+    -------
+    np.ndarray
+        A float64 matrix with one row per row and one column per channel
+        index, padded with NaN for the rows written with fewer channels.
+    """
+    widths = [len(packed) // 8 for packed in values]
+    if len(set(widths)) <= 1:
+        return np.frombuffer(b''.join(values), dtype='<f8').reshape(
+            len(values), widths[0] if widths else 0
+        )
+
+    matrix = np.full((len(values), max(widths)), np.nan)
+    for row, (packed, width) in enumerate(zip(values, widths)):
+        matrix[row, :width] = np.frombuffer(packed, dtype='<f8')
+    return matrix
+
+
+########################################################################
+class WideRow(NamedTuple):
+    """A single row, as read from the wide table."""
+    timestamp: datetime
+    values: bytes
+
+
+########################################################################
+class WideSamples(Sequence):
+    """
+    The rows of a measure stored with the 'wide' layout.
+
+    The rows are counted once, then each slice only reads its own rows, so
+    a page of all the channels costs a single query.
+
+    Parameters
+    ----------
+    measure_id : int
+        The id of the measure.
+    chunk_id : int, optional
+        Only the rows of this chunk.
+    timerange : tuple[np.datetime64, np.datetime64], optional
+        Only the rows between these naive UTC times, included, unbounded
+        when None.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        measure_id: int,
+        chunk_id: Optional[int] = None,
+        timerange: tuple[Optional[np.datetime64], Optional[np.datetime64]] = (
+            None,
+            None,
+        ),
+    ) -> None:
+        """Select the rows of the measure."""
+        if chunk_id is None:
+            self.queryset = TimeSerieWide.objects.filter(
+                chunk__measure_id=measure_id
+            )
+        else:
+            self.queryset = TimeSerieWide.objects.filter(chunk_id=chunk_id)
+        self.queryset = self.queryset.filter(time_filter(*timerange)).order_by(
+            'timestamp', 'chunk_id'
+        )
+
+    # ----------------------------------------------------------------------
+    @cached_property
+    def length(self) -> int:
+        """The number of rows, counted once."""
+        return self.queryset.count()
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """The number of rows."""
+        return self.length
+
+    # ----------------------------------------------------------------------
+    def __iter__(self):
+        """Iterate over all the rows."""
+        return iter(self[:])
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, item: Union[int, slice]) -> Any:
+        """Return a row, or a list of rows for a slice."""
+        if not isinstance(item, slice):
+            index = item + len(self) if item < 0 else item
+            if not 0 <= index < len(self):
+                raise IndexError("Row index out of range.")
+            return self[index : index + 1][0]
+
+        start, stop, step = item.indices(len(self))
+        if start >= stop:
+            return []
+        rows = self.queryset.values_list('timestamp', 'values')[start:stop]
+        return [
+            WideRow(timestamp, bytes(values)) for timestamp, values in rows
+        ][::step]
@@ -12,7 +12,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from dunderlab.django.timescaledbapp.streaming import StreamRouter
+
+# WebSocket streaming ingest on TIMESCALEDB_STREAM['PATH']
+application = StreamRouter(django_application)
 
 
 
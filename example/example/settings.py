@@ -213,5 +213,73 @@ SIMPLE_JWT = {
 
 
 TIMESCALEDB_CHUNK_INTERVAL = "1 hours"
-TIMESCALEDB_RETENTION_INTERVAL = "60 seconds"
+# Longer than the START_OFFSET of every level of TIMESCALEDB_ROLLUPS
+TIMESCALEDB_RETENTION_INTERVAL = "30 days"
 TIMESCALEDB_SCHEDULE_INTERVAL = "60 seconds"
+
+# Ingest engine for timeseries: 'auto', 'copy' or 'bulk_create'
+TIMESCALEDB_INGEST_ENGINE = "auto"
+TIMESCALEDB_COPY_FORMAT = "binary"
+
+# Timeserie validation: 'vectorized' or 'strict'
+TIMESCALEDB_VALIDATION_MODE = "vectorized"
+TIMESCALEDB_NONFINITE_VALUES = "reject"
+TIMESCALEDB_REQUIRE_MONOTONIC = True
+
+# Process-local cache of source/measure/channel/chunk metadata
+TIMESCALEDB_METADATA_CACHE = {
+    'MAX_SIZE': 1024,
+    'TTL': 60,
+}
+
+# Write-behind buffer that group-commits small timeserie POSTs
+TIMESCALEDB_INGEST_BUFFER = {
+    'ENABLED': False,
+    'MAX_ROWS': 100000,
+    'MAX_DELAY': 0.1,
+    'HIGH_WATER': 1000000,
+    'DURABILITY': 'flush',
+    'TIMEOUT': 30,
+}
+
+# Handling of samples already stored: 'reject', 'skip' or 'overwrite'.
+# Requests (`on_conflict`) and measures (`Measure.conflict_policy`) override it.
+TIMESCALEDB_CONFLICT_POLICY = "reject"
+
+# WebSocket streaming ingest (see example/asgi.py)
+TIMESCALEDB_STREAM = {
+    'PATH': '/ws/timeserie/',
+    'WINDOW': 32,
+    'ACK_INTERVAL': 0.5,
+}
+
+# Large JSON uploads are read in blocks and written in slices of rows
+TIMESCALEDB_JSON_BLOCK_SIZE = 2**20
+TIMESCALEDB_INGEST_SLICE_ROWS = 500000
+
+# gzip/zstd request bodies and responses of the timeserie endpoint
+TIMESCALEDB_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'ZSTD_LEVEL': 3,
+    'MAX_DECOMPRESSED_SIZE': 2**30,
+}
+
+# Blocks of the measures with the 'block' layout
+TIMESCALEDB_BLOCKS = {
+    'SIZE': 1024,
+    'MIN_RUN': 8,
+    'TOLERANCE': 1,  # microseconds
+}
+
+# Pages of samples are read into NumPy arrays with binary COPY on PostgreSQL
+TIMESCALEDB_FETCH_ENGINE = "auto"
+TIMESCALEDB_FETCH_BATCH_SIZE = 10000
+
+# Continuous aggregates of the samples, read by the timeserie list for
+# `max_points`; the START_OFFSET must be shorter than the retention interval
+TIMESCALEDB_ROLLUPS = {
+    '1s': {'START_OFFSET': '1 hour', 'END_OFFSET': '1 second', 'SCHEDULE_INTERVAL': '1 minute'},
+    '1min': {'START_OFFSET': '1 day', 'END_OFFSET': '1 minute', 'SCHEDULE_INTERVAL': '10 minutes'},
+    '1h': {'START_OFFSET': '7 days', 'END_OFFSET': '1 hour', 'SCHEDULE_INTERVAL': '1 hour'},
+}
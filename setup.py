@@ -18,6 +18,9 @@ setup(
         'aiohttp',
         'numpy',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     scripts=[
         "cmd/timescaledbapp_create",
     ],